@@ -1,19 +1,30 @@
+import json
 import os
+import threading
+from typing import Annotated, TypedDict
 from dotenv import load_dotenv
 from deepagents import create_deep_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from testing_protocol_agent.testing_agent import test_protocol_agent
-from defect_analysis_agent.defect_agent import defect_analysis_agent
-from Report_analysis_agent.cost_analysis_agent import cost_analysis_agent
+from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langgraph.errors import GraphBubbleUp
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from testing_protocol_agent.testing_agent import build_test_protocol_agent
+from defect_analysis_agent.defect_agent import build_defect_analysis_agent
+from defect_analysis_agent.tools import detect_pcb_defects
+from Report_analysis_agent.cost_analysis_agent import build_cost_analysis_agent
 # formats messages
-from utils import show_prompt, format_messages
+from utils import content_to_text, show_prompt, format_messages
+from models import LLMBudgetMiddleware, ModelProfileMiddleware, get_agent_model
+from admission import current_endpoint
+from agent_runner import SubagentLimiter, llm_budget, subagent_limiter
+from context_budget import ContextBudgetMiddleware
+from cassettes import install_tools
 
 load_dotenv()
 
-# Model Gemini3
-model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.0)
-
-subagents = [test_protocol_agent, defect_analysis_agent, cost_analysis_agent]
+# model / subagent / graph ทั้งหมดสร้างตอนใช้งานครั้งแรก (import ไฟล์นี้ไม่ต่อ network และไม่ print อะไร)
 
 supervisor_system_prompt = """
 You are the **PCB Project Supervisor**, an expert Project Manager responsible for orchestrating specialized Subagents to analyze PCB defects, calculate financial impact, and generate final reports. 
@@ -26,6 +37,7 @@ Your primary goal is to ensure a smooth, complete, and correct workflow that bal
 2.  **Visual & Defect Analysis:** If the input is an image or a defect description, delegate to `defect-analysis-agent` first to confirm the issue.
 3.  **Financial Assessment:** Once a defect is identified, **ALWAYS** delegate to `cost-analysis-agent` to estimate the financial loss (Scrap vs. Rework) and check material market trends (e.g., Gold price for ENIG boards). This adds business value to the report.
 4.  **Protocol Design:** If a testing plan is needed, delegate to `test-protocol-agent`.
+    Steps 3 and 4 only depend on the defect result, not on each other: issue both `task()` calls **in the same turn** so they run in parallel.
 5.  **Synthesize:** Compile the technical findings, cost analysis, and testing protocols into a final summary for the user.
 
 ### Subagent List & Usage:
@@ -36,18 +48,238 @@ Your primary goal is to ensure a smooth, complete, and correct workflow that bal
 ### Important Notes:
 -   **Exact Names:** When delegating, use the EXACT agent names: "defect-analysis-agent", "cost-analysis-agent", "test-protocol-agent".
 -   **Data Passing:** Pass relevant data between agents. For example, tell the *cost-analysis-agent* about the specific defect type found by the *defect-analysis-agent* (e.g., "Visual agent found 50 missing holes, please analyze cost assuming batch size 1000").
--   **Wait:** Wait for subagent responses before proceeding.
+-   **Keep It Compact:** Forward defect counts per class and the `artifact_id`, not image URLs or full reports. URLs can be resolved later from the `artifact_id` if the user asks for them.
+-   **Wait:** Wait for subagent responses before proceeding. Only wait between tasks that really depend on each other (e.g., defect detection before cost analysis).
+"""
+
+class SubagentLimitMiddleware(AgentMiddleware):
+    """
+    ครอบ task tool ของ deep agent (supervisor) ให้ผ่าน subagent_limiter
+    task หลายตัวใน turn เดียวจึงรันพร้อมกันได้ไม่เกิน SUBAGENT_MAX_CONCURRENCY
+    และ subagent ที่ช้าเกิน SUBAGENT_TIMEOUT หรือ error จะกลายเป็น error ToolMessage ให้ supervisor สรุปต่อได้
+    (ไม่ล้มทั้ง run เหมือน run_subagent ของ pipeline)
+    """
+
+    def __init__(self, limiter: SubagentLimiter = subagent_limiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def wrap_tool_call(self, request, handler):
+        # รันแบบ sync (CLI) ไม่จำกัด
+        return handler(request)
+
+    async def awrap_tool_call(self, request, handler):
+        tool_call = request.tool_call
+        if tool_call["name"] != "task":
+            return await handler(request)
+        subagent = (tool_call.get("args") or {}).get("subagent_type")
+        try:
+            return await self.limiter.run(handler(request))
+        except TimeoutError:
+            error = f"Error: {subagent} did not finish within {self.limiter.timeout:.0f}s"
+        except GraphBubbleUp:
+            # interrupt / command ของ langgraph ต้องส่งต่อขึ้นไป
+            raise
+        except Exception as e:
+            print(f"[supervisor] subagent {subagent} failed: {e!r}")
+            error = f"Error: {subagent} failed: {e}"
+        return ToolMessage(content=error, tool_call_id=tool_call["id"], name="task", status="error")
+
+
+def _with_cassette(spec: dict) -> dict:
+    # CASSETTE_MODE=record|replay: บันทึก / เล่นซ้ำผลของ tool ของ subagent (ดู cassettes.py)
+    install_tools(spec["tools"])
+    return spec
+
+
+def build_supervisor_agent(checkpointer=None):
+    """
+    checkpointer: ใส่เพื่อเก็บประวัติแชทต่อ thread_id (ดู sessions.py) / None = ไม่เก็บ
+    """
+    return create_deep_agent(
+        model = get_agent_model("supervisor"),
+        system_prompt = supervisor_system_prompt,
+        subagents = [
+            _with_cassette(build_test_protocol_agent()),
+            _with_cassette(build_defect_analysis_agent()),
+            _with_cassette(build_cost_analysis_agent()),
+        ],
+        middleware = [
+            ModelProfileMiddleware("supervisor"),
+            SubagentLimitMiddleware(),
+            ContextBudgetMiddleware(),
+            LLMBudgetMiddleware(),
+        ],
+        checkpointer = checkpointer,
+    )
+
+
+# ---------- Deterministic image pipeline ----------
+# การวิเคราะห์รูปเป็น workflow เดิมทุกครั้ง (detect -> cost + protocol พร้อมกัน -> สรุป)
+# pipeline นี้เรียก detection ตรง ๆ แล้วส่งผล (compact JSON) ให้ subagent ปลายทาง
+# ใช้ LLM ของ supervisor แค่ตอนสรุปผล ไม่ต้องเสีย round trip ไปกับการเลือก subagent
+# "pipeline" (default) หรือ "supervisor" (ให้ supervisor LLM ตัดสินใจเองแบบเดิม)
+ANALYZE_IMAGE_MODE = os.getenv("ANALYZE_IMAGE_MODE", "pipeline").lower()
+
+pipeline_synthesis_prompt = """
+You are the **PCB Project Supervisor**. The specialized Subagents have already finished their work on a PCB image:
+the defect detection result (compact JSON), the cost analysis and the testing protocol are given below.
+
+Compile the technical findings, cost analysis, and testing protocol into a final summary for the user.
+-   Start with the verdict (PASS/FAIL) and the defect counts per class.
+-   Keep the subagents' numbers exactly as given; do not recalculate or invent new figures.
+-   If a section is missing or reports an error, say so briefly instead of guessing.
+-   Mention the `artifact_id` so the images can be retrieved later. Do not print image URLs.
 """
 
-agent = create_deep_agent(
-    model = model,
-    system_prompt = supervisor_system_prompt,
-    subagents = subagents,
-)
+COST_TASK = """Defect detection result for a PCB image (compact JSON):
+{detection}
+
+Estimate the financial impact of these defects (Scrap vs. Rework) and check the market price of the relevant materials if needed.
+Batch size and unit cost are not known, so state your assumptions."""
+
+PROTOCOL_TASK = """Defect detection result for a PCB image (compact JSON):
+{detection}
+
+Create an IPC-compliant testing checklist / QA plan for the defect classes found."""
+
+# node ของ pipeline ที่เทียบเท่ากับ subagent (streaming ใช้ส่ง subagent_start / subagent_end)
+PIPELINE_SUBAGENT_NODES = {
+    "cost": "cost-analysis-agent",
+    "protocol": "test-protocol-agent",
+}
+
+
+class ImageAnalysisState(TypedDict, total=False):
+    messages: Annotated[list, add_messages]
+    image_path: str
+    detection: str
+    cost_report: str
+    protocol_report: str
+
+
+def _build_subagent(spec: dict):
+    # agent เล็ก ๆ ต่อ subagent (ไม่มี planning/filesystem tool ของ deep agent) เพราะงานถูกกำหนดไว้แล้ว
+    return create_agent(
+        model=spec["model"],
+        tools=spec["tools"],
+        system_prompt=spec["system_prompt"],
+        middleware=spec.get("middleware", []),
+        name=spec["name"],
+    )
+
+
+def _has_defects(detection: str) -> bool:
+    # detect_pcb_defects คืน compact JSON หรือข้อความ "Error ..." (ดู defect_analysis_agent/tools.py)
+    try:
+        return json.loads(detection).get("status") == "FAIL"
+    except (ValueError, AttributeError):
+        return False
+
+
+def build_image_pipeline():
+    """
+    StateGraph: detect -> (มี defect) cost + protocol (fan-out พร้อมกัน) -> synthesize
+                       -> (PASS / error) synthesize
+    input: {"messages": [user message], "image_path": "..."}
+    subagent แต่ละตัวรันผ่าน subagent_limiter (SUBAGENT_MAX_CONCURRENCY / SUBAGENT_TIMEOUT)
+    ถ้าตัวไหน timeout หรือ error จะได้ข้อความ error ไปสรุปแทน ไม่ทำให้ทั้ง request ล้ม
+    """
+    install_tools([detect_pcb_defects])
+    cost_agent = _build_subagent(_with_cassette(build_cost_analysis_agent()))
+    protocol_agent = _build_subagent(_with_cassette(build_test_protocol_agent()))
+
+    async def detect(state: ImageAnalysisState):
+        detection = await detect_pcb_defects.ainvoke({"image_path": state["image_path"]})
+        return {"detection": detection}
+
+    def route_after_detect(state: ImageAnalysisState) -> list[str]:
+        return ["cost", "protocol"] if _has_defects(state["detection"]) else ["synthesize"]
+
+    async def run_subagent(subagent, name: str, task: str, config) -> str:
+        try:
+            result = await subagent_limiter.run(
+                subagent.ainvoke({"messages": [{"role": "user", "content": task}]}, config=config)
+            )
+        except TimeoutError:
+            return f"Error: {name} did not finish within {subagent_limiter.timeout:.0f}s"
+        except Exception as e:
+            return f"Error: {name} failed: {e}"
+        return content_to_text(result["messages"][-1].content)
+
+    async def cost(state: ImageAnalysisState, config):
+        task = COST_TASK.format(detection=state["detection"])
+        return {"cost_report": await run_subagent(cost_agent, PIPELINE_SUBAGENT_NODES["cost"], task, config)}
+
+    async def protocol(state: ImageAnalysisState, config):
+        task = PROTOCOL_TASK.format(detection=state["detection"])
+        return {"protocol_report": await run_subagent(protocol_agent, PIPELINE_SUBAGENT_NODES["protocol"], task, config)}
+
+    async def synthesize(state: ImageAnalysisState, config):
+        request = content_to_text(state["messages"][-1].content) if state.get("messages") else ""
+        sections = [
+            f"User request: {request}",
+            f"## Defect detection\n{state['detection']}",
+        ]
+        if _has_defects(state["detection"]):
+            sections.append(f"## Cost analysis\n{state.get('cost_report') or 'Not available.'}")
+            sections.append(f"## Testing protocol\n{state.get('protocol_report') or 'Not available.'}")
+        model = get_agent_model("synthesize", current_endpoint.get())
+        async with llm_budget.slot():
+            response = await model.ainvoke(
+                [SystemMessage(pipeline_synthesis_prompt), HumanMessage("\n\n".join(sections))],
+                config=config,
+            )
+        return {"messages": [response]}
+
+    graph = StateGraph(ImageAnalysisState)
+    graph.add_node("detect", detect)
+    graph.add_node("cost", cost)
+    graph.add_node("protocol", protocol)
+    graph.add_node("synthesize", synthesize)
+    graph.add_edge(START, "detect")
+    graph.add_conditional_edges("detect", route_after_detect, ["cost", "protocol", "synthesize"])
+    # synthesize รอให้ทั้งสอง branch เสร็จก่อน แล้วค่อยรวมผล
+    graph.add_edge(["cost", "protocol"], "synthesize")
+    graph.add_edge("synthesize", END)
+    return graph.compile()
+
+
+# ---------- Lazy singletons ----------
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def _get_graph(name: str, build):
+    if name not in _graphs:
+        with _graphs_lock:
+            if name not in _graphs:
+                _graphs[name] = build()
+    return _graphs[name]
+
+
+def get_agent():
+    """supervisor แบบไม่มี checkpointer (CLI / benchmark) สร้างครั้งแรกที่เรียก"""
+    return _get_graph("agent", build_supervisor_agent)
+
+
+def get_image_pipeline():
+    return _get_graph("image_pipeline", build_image_pipeline)
+
+
+def __getattr__(name: str):
+    # รองรับโค้ดเดิมที่ import `agent` / `image_pipeline` ตรง ๆ
+    if name == "agent":
+        return get_agent()
+    if name == "image_pipeline":
+        return get_image_pipeline()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-show_prompt(supervisor_system_prompt)
 
 if __name__ == "__main__":
+    show_prompt(supervisor_system_prompt)
+    agent = get_agent()
+
     print("\n" + "="*60)
     print("🔧 PCB Supervisor Agent - Test Mode")
     print("="*60)
@@ -0,0 +1,207 @@
+"""Vectorized batch / what-if cost engine for PCB defects.
+
+คำนวณหลาย lot พร้อมกันด้วย NumPy ในครั้งเดียว:
+- defect rate แยกตาม class (รวมเป็น rate ของบอร์ดที่เสียแบบ independent: 1 - Π(1 - r_c))
+- Scrap vs Rework ต่อ lot + จุด break-even ของค่า rework
+  lot ที่ไม่ได้ให้ rework_cost_per_unit = ไม่รู้ค่า rework -> แนะนำ SCRAP, rework_loss / break-even เป็น null
+  และไม่เอาทางเลือก rework ของ lot นั้นไปคิดใน best_case_loss
+- Monte Carlo uncertainty band (p5 / p50 / p95) ของ defect rate และ unit cost
+  array ของ Monte Carlo มีขนาด lots x classes x n_samples (float64) จึงจำกัด
+  COST_MAX_LOTS และ COST_MAX_MC_CELLS (= lots * classes * n_samples) ตั้งแต่ตอน validate
+"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field, model_validator
+
+COST_MAX_LOTS = int(os.getenv("COST_MAX_LOTS", "1000"))
+# 2M cell ~ 16 MB ต่อ array (Monte Carlo สร้างหลาย array ต่อ request)
+COST_MAX_MC_CELLS = int(os.getenv("COST_MAX_MC_CELLS", "2000000"))
+
+UNCLASSIFIED = "unclassified"
+
+
+class LotInput(BaseModel):
+    lot_id: str = Field(..., description="Lot / batch identifier")
+    batch_size: int = Field(..., ge=0, description="Total PCBs in the lot")
+    unit_cost: float = Field(..., ge=0, description="Cost per PCB")
+    defect_rate: Optional[float] = Field(
+        None, ge=0, le=1, description="Overall defect rate (0.0 - 1.0); ignored if defect_rates is given"
+    )
+    defect_rates: Optional[Dict[str, float]] = Field(
+        None, description="Defect rate per defect class, e.g. {'missing_hole': 0.02, 'spur': 0.01}"
+    )
+    rework_cost_per_unit: Optional[float] = Field(
+        None, ge=0, description="Cost to rework one defective PCB; omit if unknown or not reworkable (lot is scrapped)"
+    )
+    rework_yield: float = Field(
+        1.0, ge=0, le=1, description="Fraction of reworked PCBs that pass; the rest are scrapped"
+    )
+
+
+class BatchCostRequest(BaseModel):
+    lots: List[LotInput] = Field(..., max_length=COST_MAX_LOTS)
+    n_samples: int = Field(0, ge=0, le=100_000, description="Monte Carlo samples per lot (0 = off)")
+    defect_rate_uncertainty: float = Field(
+        0.2, ge=0, description="Relative std-dev (coefficient of variation) of defect rates"
+    )
+    unit_cost_uncertainty: float = Field(
+        0.1, ge=0, description="Relative std-dev (coefficient of variation) of unit cost"
+    )
+    seed: Optional[int] = Field(None, description="Random seed for reproducible Monte Carlo")
+
+    @model_validator(mode="after")
+    def _limit_monte_carlo(self):
+        classes = {c for lot in self.lots for c in (lot.defect_rates or {})}
+        if any(not lot.defect_rates for lot in self.lots):
+            classes.add(UNCLASSIFIED)
+        cells = len(self.lots) * max(1, len(classes)) * self.n_samples
+        if cells > COST_MAX_MC_CELLS:
+            raise ValueError(
+                f"lots x defect classes x n_samples = {cells:,} exceeds {COST_MAX_MC_CELLS:,}; "
+                "reduce n_samples or split the lots"
+            )
+        return self
+
+
+def _lot_arrays(lots: List[LotInput]):
+    classes = sorted({c for lot in lots for c in (lot.defect_rates or {})})
+    # lot ที่ให้มาแค่ defect_rate รวม จะอยู่ใน column "unclassified"
+    if any(not lot.defect_rates for lot in lots):
+        classes.append(UNCLASSIFIED)
+
+    rates = np.zeros((len(lots), len(classes)), dtype=np.float64)
+    for i, lot in enumerate(lots):
+        if lot.defect_rates:
+            for j, cls in enumerate(classes):
+                rates[i, j] = lot.defect_rates.get(cls, 0.0)
+        else:
+            rates[i, classes.index(UNCLASSIFIED)] = lot.defect_rate or 0.0
+
+    batch = np.array([lot.batch_size for lot in lots], dtype=np.float64)
+    unit_cost = np.array([lot.unit_cost for lot in lots], dtype=np.float64)
+    # None -> NaN (rework_loss ของ lot นั้นเป็น NaN ไปตลอดทาง)
+    rework_cost = np.array(
+        [np.nan if lot.rework_cost_per_unit is None else lot.rework_cost_per_unit for lot in lots],
+        dtype=np.float64,
+    )
+    rework_yield = np.array([lot.rework_yield for lot in lots], dtype=np.float64)
+    return classes, np.clip(rates, 0.0, 1.0), batch, unit_cost, rework_cost, rework_yield
+
+
+def _combined_rate(rates: np.ndarray) -> np.ndarray:
+    # บอร์ดเสียถ้ามี defect อย่างน้อย 1 class (ถือว่าแต่ละ class independent)
+    return 1.0 - np.prod(1.0 - rates, axis=-1)
+
+
+def _units(x: np.ndarray) -> np.ndarray:
+    # ปัดลงเป็นจำนวนบอร์ด (กัน floating error เช่น 100 * 0.09999999 -> 9)
+    return np.floor(x + 1e-9)
+
+
+def _losses(affected, unit_cost, rework_cost, rework_yield):
+    scrap = affected * unit_cost
+    rework = affected * (rework_cost + (1.0 - rework_yield) * unit_cost)
+    return scrap, rework
+
+
+def _beta_samples(rng, mean: np.ndarray, cv: float, n: int) -> np.ndarray:
+    """สุ่ม rate ใน [0, 1] จาก Beta ที่มี mean/cv ตามที่กำหนด (cv ถูกจำกัดไม่ให้เกินที่ Beta รองรับ)"""
+    mean = np.clip(mean, 1e-9, 1 - 1e-9)
+    var = (cv * mean) ** 2
+    var = np.minimum(var, mean * (1 - mean) * 0.999)
+    common = mean * (1 - mean) / np.maximum(var, 1e-18) - 1
+    a = mean * common
+    b = (1 - mean) * common
+    return rng.beta(a[..., None], b[..., None], size=mean.shape + (n,))
+
+
+def evaluate_batch(request: BatchCostRequest) -> Dict[str, object]:
+    """
+    ประเมินทุก lot ในครั้งเดียว คืน dict:
+    {"lots": [...], "totals": {...}, "classes": [...]}
+    """
+    lots = request.lots
+    if not lots:
+        return {"lots": [], "totals": {}, "classes": []}
+
+    classes, rates, batch, unit_cost, rework_cost, rework_yield = _lot_arrays(lots)
+
+    combined = _combined_rate(rates)
+    affected = _units(batch * combined)
+    affected_by_class = _units(batch[:, None] * rates)
+    scrap_loss, rework_loss = _losses(affected, unit_cost, rework_cost, rework_yield)
+
+    # rework คุ้มกว่าเมื่อ rework_cost < unit_cost * rework_yield
+    has_rework = ~np.isnan(rework_cost)
+    break_even_rework_cost = unit_cost * rework_yield
+    rework_better = has_rework & (np.nan_to_num(rework_loss, nan=np.inf) < scrap_loss)
+
+    bands = None
+    if request.n_samples > 0:
+        rng = np.random.default_rng(request.seed)
+        n = request.n_samples
+        sampled_rates = (
+            _beta_samples(rng, rates, request.defect_rate_uncertainty, n)
+            if request.defect_rate_uncertainty > 0
+            else np.repeat(rates[..., None], n, axis=-1)
+        )
+        sampled_combined = 1.0 - np.prod(1.0 - sampled_rates, axis=1)  # (lots, n)
+
+        sigma = np.sqrt(np.log1p(request.unit_cost_uncertainty ** 2))
+        sampled_cost = unit_cost[:, None] * rng.lognormal(-(sigma ** 2) / 2, sigma, size=(len(lots), n))
+
+        mc_affected = _units(batch[:, None] * sampled_combined)
+        mc_scrap, mc_rework = _losses(
+            mc_affected, sampled_cost, rework_cost[:, None], rework_yield[:, None]
+        )
+        bands = {
+            "scrap": np.percentile(mc_scrap, [5, 50, 95], axis=1),
+            "rework": np.percentile(mc_rework, [5, 50, 95], axis=1),
+            "total_scrap": np.percentile(mc_scrap.sum(axis=0), [5, 50, 95]),
+            "total_rework": np.percentile(mc_rework.sum(axis=0), [5, 50, 95]),
+        }
+
+    rows = []
+    for i, lot in enumerate(lots):
+        row: Dict[str, object] = {
+            "lot_id": lot.lot_id,
+            "batch_size": lot.batch_size,
+            "defect_rate": round(float(combined[i]), 6),
+            "affected_units": int(affected[i]),
+            "scrap_loss": round(float(scrap_loss[i]), 2),
+            "rework_loss": round(float(rework_loss[i]), 2) if has_rework[i] else None,
+            "recommended_action": "REWORK" if rework_better[i] else "SCRAP",
+            "break_even_rework_cost": round(float(break_even_rework_cost[i]), 2) if has_rework[i] else None,
+        }
+        if lot.defect_rates:
+            row["affected_by_class"] = {
+                cls: int(affected_by_class[i, j])
+                for j, cls in enumerate(classes)
+                if cls in lot.defect_rates
+            }
+        if bands is not None:
+            row["scrap_loss_p5_p50_p95"] = [round(float(v), 2) for v in bands["scrap"][:, i]]
+            row["rework_loss_p5_p50_p95"] = (
+                [round(float(v), 2) for v in bands["rework"][:, i]] if has_rework[i] else None
+            )
+        rows.append(row)
+
+    best_loss = np.where(rework_better, rework_loss, scrap_loss)
+    totals: Dict[str, object] = {
+        "lots": len(lots),
+        "units": int(batch.sum()),
+        "affected_units": int(affected.sum()),
+        "scrap_loss": round(float(scrap_loss.sum()), 2),
+        # ถ้ามี lot ที่ไม่รู้ค่า rework ยอด "rework ทุก lot" ไม่มีความหมาย
+        "rework_loss": round(float(rework_loss.sum()), 2) if has_rework.all() else None,
+        "best_case_loss": round(float(best_loss.sum()), 2),
+    }
+    if bands is not None:
+        totals["scrap_loss_p5_p50_p95"] = [round(float(v), 2) for v in bands["total_scrap"]]
+        totals["rework_loss_p5_p50_p95"] = (
+            [round(float(v), 2) for v in bands["total_rework"]] if has_rework.all() else None
+        )
+
+    return {"lots": rows, "totals": totals, "classes": classes}
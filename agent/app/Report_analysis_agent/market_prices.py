@@ -0,0 +1,187 @@
+"""Material price service for the Cost Analysis Agent.
+
+- cache ราคาแยกตาม query มี TTL (MARKET_PRICE_TTL วินาที) ราคาทองแดง/ทองไม่ได้เปลี่ยนทุกนาที
+- background refresher คอยอัปเดตรายการที่ใช้บ่อย (MARKET_PRICE_WATCHLIST) ไว้ก่อน
+  cost analysis จึงไม่ต้องรอ finance API
+- ถามหลาย material ในครั้งเดียวได้ (ตัวที่ไม่อยู่ใน cache จะดึงพร้อมกัน)
+- backend:
+    * "google_finance" (default): LangChain GoogleFinanceQueryRun (ต้องมี SERPAPI_API_KEY)
+    * "static": ใช้ราคาจากไฟล์ JSON (MARKET_PRICE_FIXTURE) สำหรับรัน/ทดสอบแบบ offline
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+MARKET_PRICE_BACKEND = os.getenv("MARKET_PRICE_BACKEND", "google_finance")
+MARKET_PRICE_TTL = float(os.getenv("MARKET_PRICE_TTL", "900"))
+MARKET_PRICE_REFRESH_INTERVAL = float(os.getenv("MARKET_PRICE_REFRESH_INTERVAL", "600"))
+MARKET_PRICE_WATCHLIST = [
+    q.strip()
+    for q in os.getenv("MARKET_PRICE_WATCHLIST", "Gold price,Copper price").split(",")
+    if q.strip()
+]
+MARKET_PRICE_FIXTURE = os.getenv("MARKET_PRICE_FIXTURE")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class GoogleFinanceBackend:
+    """สร้าง GoogleFinanceQueryRun ครั้งเดียวแล้วใช้ซ้ำ"""
+
+    name = "google_finance"
+
+    def __init__(self):
+        self._tool = None
+        self._lock = threading.Lock()
+
+    def available(self) -> Optional[str]:
+        if not os.environ.get("SERPAPI_API_KEY"):
+            return "SERPAPI_API_KEY not found in environment variables."
+        return None
+
+    def fetch(self, query: str) -> str:
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    from langchain_community.tools.google_finance import GoogleFinanceQueryRun
+                    from langchain_community.utilities.google_finance import GoogleFinanceAPIWrapper
+
+                    self._tool = GoogleFinanceQueryRun(api_wrapper=GoogleFinanceAPIWrapper())
+        return self._tool.run(query)
+
+
+class StaticPriceBackend:
+    """
+    ราคาจาก dict / ไฟล์ JSON เช่น {"gold price": "Gold: $2,400.10 / oz", ...}
+    ใช้แทน finance API ตอน offline หรือทดสอบ
+    """
+
+    name = "static"
+
+    def __init__(self, prices: Optional[Dict[str, str]] = None, path: Optional[str] = MARKET_PRICE_FIXTURE):
+        if prices is None and path:
+            with open(path, encoding="utf-8") as f:
+                prices = json.load(f)
+        self.prices = {normalize_query(k): str(v) for k, v in (prices or {}).items()}
+
+    def available(self) -> Optional[str]:
+        return None
+
+    def fetch(self, query: str) -> str:
+        try:
+            return self.prices[normalize_query(query)]
+        except KeyError:
+            raise LookupError(f"no static price for '{query}'") from None
+
+
+class PriceService:
+    def __init__(
+        self,
+        backend,
+        ttl: float = MARKET_PRICE_TTL,
+        watchlist: Optional[List[str]] = None,
+        refresh_interval: float = MARKET_PRICE_REFRESH_INTERVAL,
+        max_workers: int = 4,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.watchlist = list(watchlist or [])
+        self.refresh_interval = refresh_interval
+        self._cache: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market-price")
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ---------- cache ----------
+
+    def _cached(self, query: str) -> Optional[Tuple[float, str]]:
+        with self._lock:
+            entry = self._cache.get(normalize_query(query))
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry
+
+    def _refresh(self, query: str) -> Tuple[float, str]:
+        value = self.backend.fetch(query)
+        entry = (time.time(), value)
+        with self._lock:
+            self._cache[normalize_query(query)] = entry
+        return entry
+
+    # ---------- public ----------
+
+    def get_many(self, queries: List[str]) -> Dict[str, Dict[str, object]]:
+        """
+        คืน {query: {"value": str, "age_seconds": float, "cached": bool}}
+        หรือ {query: {"error": str}} ถ้าดึงไม่ได้
+        """
+        results: Dict[str, Dict[str, object]] = {}
+        misses = []
+        for query in queries:
+            entry = self._cached(query)
+            if entry is not None:
+                results[query] = {"value": entry[1], "age_seconds": time.time() - entry[0], "cached": True}
+            else:
+                misses.append(query)
+
+        futures = {q: self._executor.submit(self._refresh, q) for q in misses}
+        for query, future in futures.items():
+            try:
+                fetched_at, value = future.result()
+                results[query] = {"value": value, "age_seconds": time.time() - fetched_at, "cached": False}
+            except Exception as e:
+                results[query] = {"error": str(e)}
+
+        return {q: results[q] for q in queries}
+
+    def get(self, query: str) -> Dict[str, object]:
+        return self.get_many([query])[query]
+
+    def start_refresher(self):
+        """refresh watchlist ทุก refresh_interval วินาทีใน daemon thread"""
+        if self._refresher is not None or not self.watchlist:
+            return
+
+        def _loop():
+            while not self._stop.is_set():
+                for query in self.watchlist:
+                    try:
+                        self._refresh(query)
+                    except Exception as e:
+                        print(f"[market_prices] refresh failed for '{query}': {e}")
+                self._stop.wait(self.refresh_interval)
+
+        self._refresher = threading.Thread(target=_loop, name="market-price-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_service: Optional[PriceService] = None
+_service_lock = threading.Lock()
+
+
+def get_price_service() -> PriceService:
+    """
+    PriceService ตัวเดียวทั้ง process (สร้าง + เริ่ม refresher ตอนใช้ครั้งแรก)
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                if MARKET_PRICE_BACKEND == "static":
+                    backend = StaticPriceBackend()
+                else:
+                    backend = GoogleFinanceBackend()
+                service = PriceService(backend, watchlist=MARKET_PRICE_WATCHLIST)
+                if backend.available() is None:
+                    service.start_refresher()
+                _service = service
+    return _service
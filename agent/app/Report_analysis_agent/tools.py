@@ -1,7 +1,11 @@
-import os
+import json
+from typing import List, Optional
+
 from langchain_core.tools import tool
-from langchain_community.tools.google_finance import GoogleFinanceQueryRun
-from langchain_community.utilities.google_finance import GoogleFinanceAPIWrapper
+from pydantic import ValidationError
+
+from .cost_engine import BatchCostRequest, LotInput, evaluate_batch
+from .market_prices import get_price_service
 
 
 @tool
@@ -9,48 +13,93 @@ def calculate_defect_cost_impact(
     batch_size: int,
     defect_rate: float,
     unit_cost: float,
-    rework_cost_per_unit: float = 0.0,
+    rework_cost_per_unit: Optional[float] = None,
     is_scrap: bool = True
 ) -> str:
     """
     Calculates the financial impact of PCB defects based on production data.
+    For several lots, per-class defect rates or scrap-vs-rework comparisons, use `calculate_batch_cost_impact` instead.
     Args:
         batch_size: Total PCBs in batch.
         defect_rate: Defect rate (0.0 - 1.0).
         unit_cost: Cost per unit.
-        rework_cost_per_unit: Cost to repair (if applicable).
+        rework_cost_per_unit: Cost to repair one PCB (required when is_scrap is False).
         is_scrap: True if scrap (total loss), False if reworkable.
     """
-    affected_units = int(batch_size * defect_rate)
+    try:
+        lot_input = LotInput(
+            lot_id="batch",
+            batch_size=batch_size,
+            defect_rate=defect_rate,
+            unit_cost=unit_cost,
+            rework_cost_per_unit=rework_cost_per_unit,
+        )
+    except ValidationError as e:
+        # ส่ง error กลับให้ LLM แก้ค่าเอง (เช่น defect_rate=5.0 ที่ตั้งใจหมายถึง 5%) แทนที่จะล้มทั้ง run
+        problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        return f"Error: invalid input ({problems})"
+
+    result = evaluate_batch(BatchCostRequest(lots=[lot_input]))
+    lot = result["lots"][0]
     if is_scrap:
-        total_loss = affected_units * unit_cost
+        total_loss = lot["scrap_loss"]
         action = "SCRAP (Total Loss)"
+    elif lot["rework_loss"] is None:
+        return "Error: rework_cost_per_unit is required to estimate rework loss (is_scrap=False)"
     else:
-        total_loss = affected_units * rework_cost_per_unit
+        total_loss = lot["rework_loss"]
         action = "REWORK"
 
-    return f"Action: {action}, Affected: {affected_units}, Est. Loss: ${total_loss:,.2f}"
+    return f"Action: {action}, Affected: {lot['affected_units']}, Est. Loss: ${total_loss:,.2f}"
+
+
+@tool(args_schema=BatchCostRequest)
+def calculate_batch_cost_impact(
+    lots: List[LotInput],
+    n_samples: int = 0,
+    defect_rate_uncertainty: float = 0.2,
+    unit_cost_uncertainty: float = 0.1,
+    seed: Optional[int] = None,
+) -> str:
+    """
+    Evaluates many production lots in ONE call (e.g. a whole production week).
+    For each lot it returns affected units (overall and per defect class), scrap loss, rework loss,
+    the recommended action and the break-even rework cost; plus totals across all lots.
+    Set n_samples (e.g. 2000) to add Monte Carlo p5/p50/p95 uncertainty bands on defect rate and unit cost.
+    """
+    result = evaluate_batch(
+        BatchCostRequest(
+            lots=lots,
+            n_samples=n_samples,
+            defect_rate_uncertainty=defect_rate_uncertainty,
+            unit_cost_uncertainty=unit_cost_uncertainty,
+            seed=seed,
+        )
+    )
+    return json.dumps(result, separators=(",", ":"))
 
 
 @tool
-def check_material_market_price(query: str) -> str:
+def check_material_market_price(materials: List[str]) -> str:
     """
-    Checks real-time market prices of PCB raw materials (Copper, Gold, Silver, Tin) using Google Finance.
-    
+    Checks current market prices of PCB raw materials (Copper, Gold, Silver, Tin) using Google Finance.
+    Prices are cached for several minutes, so ask for every material you need in ONE call.
+
     Args:
-        query: The material name or ticker symbol to search (e.g., "Copper price", "Gold price", "LME Copper").
+        materials: Material names or ticker queries to look up (e.g., ["Gold price", "Copper price", "LME Copper"]).
     """
-    # ตรวจสอบ API Key
-    if not os.environ.get("SERPAPI_API_KEY"):
-        return "Error: SERPAPI_API_KEY not found in environment variables."
-    
-    try:
-        # เรียกใช้ Google Finance Tool ของ LangChain
-        api_wrapper = GoogleFinanceAPIWrapper()
-        tool = GoogleFinanceQueryRun(api_wrapper=api_wrapper)
-        
-        # รันคำสั่ง
-        result = tool.run(query)
-        return result
-    except Exception as e:
-        return f"Error fetching market data: {str(e)}"
\ No newline at end of file
+    service = get_price_service()
+
+    # ตรวจสอบ API Key / backend
+    problem = service.backend.available()
+    if problem:
+        return f"Error: {problem}"
+
+    lines = []
+    for material, result in service.get_many(materials).items():
+        if "error" in result:
+            lines.append(f"- {material}: Error fetching market data: {result['error']}")
+        else:
+            age_min = float(result["age_seconds"]) / 60
+            lines.append(f"- {material} (as of {age_min:.0f} min ago): {result['value']}")
+    return "\n".join(lines)
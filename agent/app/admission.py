@@ -0,0 +1,104 @@
+# admission.py
+"""
+Admission control ของ agent API: จำกัดจำนวน request ต่อ client (token bucket)
+
+- แต่ละ client มี bucket ต่อกลุ่ม endpoint (chat / image) เติม token ตาม rate ต่อนาที
+  สะสมได้ไม่เกิน burst ถ้า token หมดตอบ 429 + Retry-After ทันที (ไม่เข้าคิว)
+- client = IP ของผู้เรียก หรือ hop แรกของ X-Forwarded-For ถ้าตั้ง RATE_LIMIT_TRUST_FORWARDED=1
+  (ใช้เมื่ออยู่หลัง reverse proxy ที่เชื่อถือได้เท่านั้น)
+- current_client: client ของ request ปัจจุบัน (contextvar) ส่งต่อให้ pcb-api เป็น X-Forwarded-For
+- current_endpoint: กลุ่ม endpoint ของ request ปัจจุบัน ใช้เลือก model profile (models.py)
+
+ส่วนคิวต่อ endpoint และ concurrency ของ LLM อยู่ใน agent_runner.py
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "30"))
+CHAT_RATE_BURST = float(os.getenv("CHAT_RATE_BURST", "10"))
+IMAGE_RATE_PER_MINUTE = float(os.getenv("IMAGE_RATE_PER_MINUTE", "10"))
+IMAGE_RATE_BURST = float(os.getenv("IMAGE_RATE_BURST", "5"))
+COST_RATE_PER_MINUTE = float(os.getenv("COST_RATE_PER_MINUTE", "30"))
+COST_RATE_BURST = float(os.getenv("COST_RATE_BURST", "10"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+
+current_client: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+# "chat" / "image" / None = ไม่ได้มาจาก HTTP (CLI / benchmark)
+current_endpoint: ContextVar[Optional[str]] = ContextVar("current_endpoint", default=None)
+
+
+class RateLimitedError(Exception):
+    """client ใช้ token หมดแล้ว"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientRateLimiter:
+    def __init__(
+        self,
+        name: str,
+        rate_per_minute: float,
+        burst: float,
+        max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+    ):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        # client -> (tokens, เวลาที่อัปเดตล่าสุด) เรียงจากใช้ล่าสุดนานที่สุด
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client: str, cost: float = 1.0):
+        """
+        หัก token ของ client / raise RateLimitedError (พร้อม retry_after) ถ้าไม่พอ
+        rate <= 0 = ไม่จำกัด
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < cost:
+                self._buckets[client] = (tokens, now)
+                retry_after = (cost - tokens) / self.rate
+                raise RateLimitedError(
+                    f"rate limit exceeded for {self.name} ({self.rate * 60:g}/min, burst {self.burst:g})",
+                    retry_after,
+                )
+            self._buckets[client] = (tokens - cost, now)
+            # client ที่ไม่ได้ใช้นานที่สุดหลุดก่อน (bucket เต็มแล้ว เหมือนไม่เคยเรียก)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+    def stats(self):
+        return {"clients": len(self._buckets), "rate_per_minute": self.rate * 60, "burst": self.burst}
+
+
+def client_id(request) -> str:
+    """client ของ FastAPI Request (ใช้เป็น key ของ bucket)"""
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+rate_limiters = {
+    "chat": ClientRateLimiter("chat", CHAT_RATE_PER_MINUTE, CHAT_RATE_BURST),
+    "image": ClientRateLimiter("image", IMAGE_RATE_PER_MINUTE, IMAGE_RATE_BURST),
+    "cost": ClientRateLimiter("cost", COST_RATE_PER_MINUTE, COST_RATE_BURST),
+}
@@ -0,0 +1,228 @@
+# agent_runner.py
+"""
+รัน supervisor agent แบบ async (agent.ainvoke) โดยจำกัดจำนวนที่รันพร้อมกัน
+แยกคิวต่อกลุ่ม endpoint (runners["chat"] / runners["image"]) งานวิเคราะห์รูปที่หนัก ๆ
+จึงไม่กินคิวของ chat
+
+- AGENT_MAX_CONCURRENCY / AGENT_MAX_QUEUE: agent run ที่รันพร้อมกัน / รอคิวได้ ของ /chat*
+- IMAGE_MAX_CONCURRENCY / IMAGE_MAX_QUEUE: เหมือนกันสำหรับ /analyze-image*
+- COST_MAX_CONCURRENCY / COST_MAX_QUEUE: งานคำนวณของ /cost/batch (ไม่ใช้ LLM แต่ Monte Carlo กิน CPU / RAM)
+  คิวเต็มตอบ 429 + Retry-After ทันที (ประมาณจากเวลารันเฉลี่ย)
+- AGENT_MAX_QUEUE_WAIT: รอคิวได้นานสุดกี่วินาที เกินแล้วตอบ 429 แทนที่จะรอจน timeout
+- AGENT_REQUEST_TIMEOUT: เวลาสูงสุดต่อ request (วินาที) นับรวมเวลารอคิว
+
+งบ concurrency ของ LLM call แยกจากจำนวน agent run (1 run มีหลาย call ทั้ง supervisor และ subagent)
+- LLM_MAX_CONCURRENCY: จำนวน Gemini call ที่ยิงพร้อมกันได้ต่อ worker (call ที่เหลือรอ slot)
+  งบของ detection (Roboflow ผ่าน pcb-api) อยู่ใน defect_analysis_agent/pcb_api_client.py
+
+subagent ที่ไม่ขึ้นต่อกัน (cost / test protocol) ถูกรันพร้อมกัน จำกัดด้วย
+- SUBAGENT_MAX_CONCURRENCY: จำนวน subagent ที่รันพร้อมกันได้ต่อ worker
+- SUBAGENT_TIMEOUT: เวลาสูงสุดต่อ subagent (วินาที ไม่นับเวลารอ slot)
+"""
+import asyncio
+import math
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", "32"))
+IMAGE_MAX_CONCURRENCY = int(os.getenv("IMAGE_MAX_CONCURRENCY", "2"))
+IMAGE_MAX_QUEUE = int(os.getenv("IMAGE_MAX_QUEUE", "8"))
+COST_MAX_CONCURRENCY = int(os.getenv("COST_MAX_CONCURRENCY", "2"))
+COST_MAX_QUEUE = int(os.getenv("COST_MAX_QUEUE", "16"))
+AGENT_MAX_QUEUE_WAIT = float(os.getenv("AGENT_MAX_QUEUE_WAIT", "30"))
+AGENT_REQUEST_TIMEOUT = float(os.getenv("AGENT_REQUEST_TIMEOUT", "300"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+SUBAGENT_MAX_CONCURRENCY = int(os.getenv("SUBAGENT_MAX_CONCURRENCY", "8"))
+SUBAGENT_TIMEOUT = float(os.getenv("SUBAGENT_TIMEOUT", "180"))
+
+
+class AgentBusyError(Exception):
+    """คิวเต็ม / รอคิวนานเกิน รับ request เพิ่มไม่ได้"""
+
+    def __init__(self, message: str, retry_after: float = 5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentRunner:
+    def __init__(
+        self,
+        name: str = "chat",
+        max_concurrency: int = AGENT_MAX_CONCURRENCY,
+        max_queue: int = AGENT_MAX_QUEUE,
+        timeout: float = AGENT_REQUEST_TIMEOUT,
+        max_wait: float = AGENT_MAX_QUEUE_WAIT,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._running = 0
+        self._rejected = 0
+        # เวลารันเฉลี่ย (EWMA) ใช้ประมาณ Retry-After
+        self._avg_seconds: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self._rejected,
+            "avg_seconds": round(self._avg_seconds, 2) if self._avg_seconds is not None else None,
+        }
+
+    def retry_after(self) -> float:
+        """ประมาณเวลาที่คิวปัจจุบันจะว่างลง 1 ที่ (วินาที)"""
+        if self._avg_seconds is None:
+            return 5.0
+        return max(1.0, math.ceil(self._avg_seconds * (self._waiting + 1) / self.max_concurrency))
+
+    def _busy(self, reason: str) -> AgentBusyError:
+        self._rejected += 1
+        return AgentBusyError(
+            f"{self.name} agent is busy: {reason} ({self._running} running, {self._waiting} waiting)",
+            self.retry_after(),
+        )
+
+    def check_capacity(self):
+        """
+        raise AgentBusyError ถ้าทุก slot ไม่ว่าง และคิวเต็มแล้ว
+        """
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise self._busy("queue is full")
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        รอจนได้ slot (ตามลำดับคิว) แล้วค่อยรันโค้ดข้างใน
+        รอเกิน max_wait -> AgentBusyError (ไม่ปล่อยให้คิวยาวจนทุก request timeout พร้อมกัน)
+        """
+        self.check_capacity()
+
+        self._waiting += 1
+        try:
+            async with asyncio.timeout(self.max_wait if self.max_wait > 0 else None):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            raise self._busy(f"waited {self.max_wait:.0f}s for a slot") from None
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = elapsed if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._running -= 1
+            self._semaphore.release()
+
+    async def run(
+        self,
+        agent,
+        payload: Dict[str, Any],
+        config: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        รอคิว แล้วรัน agent.ainvoke(payload)
+        raise AgentBusyError ถ้าคิวเต็ม, TimeoutError ถ้าเกิน self.timeout
+        """
+        async with asyncio.timeout(self.timeout):
+            async with self.slot():
+                return await agent.ainvoke(payload, config=config)
+
+    async def stream_events(
+        self,
+        agent,
+        payload: Dict[str, Any],
+        config: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        เหมือน run แต่ yield event จาก agent.astream_events ทีละตัว
+        deadline ครอบเฉพาะตอนรอ slot / รอ event ถัดไป ไม่ครอบช่วงที่ yield ออกไป
+        (ไม่งั้น cancellation ไปโผล่ใน consumer ที่กำลังส่ง event แทนที่จะเป็น TimeoutError ตรงนี้)
+        """
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        async with AsyncExitStack() as stack:
+            async with asyncio.timeout_at(deadline):
+                await stack.enter_async_context(self.slot())
+            events = agent.astream_events(payload, config=config, version="v2")
+            stack.push_async_callback(events.aclose)
+            while True:
+                async with asyncio.timeout_at(deadline):
+                    try:
+                        event = await events.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield event
+
+
+runners = {
+    "chat": AgentRunner("chat", AGENT_MAX_CONCURRENCY, AGENT_MAX_QUEUE),
+    "image": AgentRunner("image", IMAGE_MAX_CONCURRENCY, IMAGE_MAX_QUEUE),
+    "cost": AgentRunner("cost", COST_MAX_CONCURRENCY, COST_MAX_QUEUE),
+}
+
+
+# ---------- LLM call budget ----------
+
+class CallBudget:
+    """
+    จำกัดจำนวน call ที่ยิงไป service ภายนอกพร้อมกัน (เกินแล้วรอ slot)
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self._in_flight, "waiting": self._waiting, "max_concurrency": self.max_concurrency}
+
+    @asynccontextmanager
+    async def slot(self):
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+
+llm_budget = CallBudget("llm", LLM_MAX_CONCURRENCY)
+
+
+# ---------- Subagent fan-out ----------
+
+class SubagentLimiter:
+    def __init__(self, max_concurrency: int = SUBAGENT_MAX_CONCURRENCY, timeout: float = SUBAGENT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, awaitable: Awaitable[Any]) -> Any:
+        """
+        รอ slot แล้ว await งานของ subagent 1 ตัว
+        raise TimeoutError ถ้าเกิน self.timeout (นับหลังได้ slot)
+        """
+        async with self._semaphore:
+            async with asyncio.timeout(self.timeout):
+                return await awaitable
+
+
+subagent_limiter = SubagentLimiter()
@@ -0,0 +1,334 @@
+# cassettes.py
+"""
+Record / replay ของ LLM + tool สำหรับวัด orchestration แบบ offline
+
+- record: ใช้ Gemini / tool จริง แล้วบันทึก response + เวลาที่ใช้ของทุก LLM call และทุก tool call
+  ของ subagent (detect_pcb_defects, tavily_search, finance, ...) ลง cassette (JSON)
+- replay: ไม่ต่อ network เลย model เป็น ReplayChatModel และ tool ถูกแทนด้วยผลที่บันทึกไว้
+  แต่ supervisor (create_deep_agent) / subagent / middleware / pipeline ยังเป็นของจริงทั้งหมด
+  จึงใช้วัด overhead ของ orchestration ได้ซ้ำ ๆ แบบ deterministic
+
+การจับคู่ตอน replay:
+1. exact: messages ที่ส่งให้ model (หรือ args ของ tool) ตรงกับที่บันทึกไว้
+2. ไม่ตรง (เช่น แก้ prompt / context budget): ใช้ entry ถัดไปที่ยังไม่ถูกใช้ของ agent (หรือ tool) เดียวกัน
+   ตามลำดับที่บันทึก / CASSETTE_STRICT=1 = ไม่ยอม fallback (raise CassetteMissError)
+
+latency injection: รอ = เวลาที่บันทึกไว้ x latency_scale หรือค่าคงที่ (llm_latency / tool_latency)
+
+ใช้กับ service: CASSETTE_MODE=record|replay, CASSETTE_PATH=.cache/cassette.json
+(record จะเขียนไฟล์ทุกครั้งที่มี entry ใหม่) / benchmark: benchmarks/orchestration.py
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumpd, load
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from utils import content_to_text
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(".cache", "cassette.json"))
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+CASSETTE_STRICT = os.getenv("CASSETTE_STRICT", "0") == "1"
+
+MAIN_AGENT = "main"  # LLM call ที่ไม่ได้อยู่ใน subagent (supervisor / synthesize ของ pipeline)
+
+
+class CassetteMissError(RuntimeError):
+    """ไม่มี entry ที่ใช้ replay call นี้ได้"""
+
+
+def _digest(data: Any) -> str:
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False, default=_jsonable)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+def messages_key(messages: Iterable[BaseMessage]) -> str:
+    """key ของ LLM call: type + ข้อความ + tool call (ไม่สน id ที่เปลี่ยนทุกรอบ)"""
+    return _digest([
+        [
+            message.type,
+            content_to_text(message.content),
+            [[c.get("name"), c.get("args")] for c in getattr(message, "tool_calls", None) or []],
+        ]
+        for message in messages
+    ])
+
+
+# ---------- Cassette ----------
+
+class Cassette:
+    def __init__(self, path: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.path = path
+        data = data or {}
+        self.meta: Dict[str, Any] = data.get("meta", {})
+        self.llm: List[Dict[str, Any]] = data.get("llm", [])
+        self.tools: List[Dict[str, Any]] = data.get("tools", [])
+        self.autosave = False
+        self.stats = {"exact": 0, "fallback": 0}
+        self._used: set = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            data = {"meta": self.meta, "llm": list(self.llm), "tools": list(self.tools)}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    # --- record ---
+
+    def _append(self, entries: List[Dict[str, Any]], entry: Dict[str, Any]):
+        with self._lock:
+            entries.append(entry)
+        if self.autosave and self.path:
+            self.save()
+
+    def add_llm(self, agent: str, key: str, message: BaseMessage, seconds: float):
+        self._append(self.llm, {"agent": agent, "key": key, "message": dumpd(message), "seconds": round(seconds, 4)})
+
+    def add_tool(self, name: str, key: str, seconds: float, output: Any = None, error: Optional[str] = None):
+        entry = {"tool": name, "key": key, "seconds": round(seconds, 4)}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["output"] = output if isinstance(output, (str, int, float, bool, list, dict)) else str(output)
+        self._append(self.tools, entry)
+
+    # --- replay ---
+
+    def _take(self, kind: str, entries: List[Dict[str, Any]], group_field: str, group: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            candidates = [
+                (i, e) for i, e in enumerate(entries) if (kind, i) not in self._used and e[group_field] == group
+            ]
+            match = next(((i, e) for i, e in candidates if e["key"] == key), None)
+            if match is not None:
+                self.stats["exact"] += 1
+            elif candidates and not CASSETTE_STRICT:
+                match = candidates[0]
+                self.stats["fallback"] += 1
+            if match is None:
+                raise CassetteMissError(f"no recorded {kind} response left for {group_field}={group}")
+            self._used.add((kind, match[0]))
+            return match[1]
+
+    def take_llm(self, agent: str, key: str) -> Dict[str, Any]:
+        return self._take("llm", self.llm, "agent", agent, key)
+
+    def take_tool(self, name: str, key: str) -> Dict[str, Any]:
+        return self._take("tool", self.tools, "tool", name, key)
+
+
+# ---------- state ของ process ----------
+
+class Latency:
+    def __init__(self, scale: float = CASSETTE_LATENCY_SCALE, llm: Optional[float] = None, tool: Optional[float] = None):
+        self.scale = scale
+        self.llm = llm
+        self.tool = tool
+
+    def seconds(self, kind: str, recorded: float) -> float:
+        fixed = self.llm if kind == "llm" else self.tool
+        return fixed if fixed is not None else recorded * self.scale
+
+
+_mode = CASSETTE_MODE
+_cassette: Optional[Cassette] = None
+_latency = Latency()
+_patched_tools: Dict[int, Any] = {}
+
+
+def configure(mode: str, cassette: Optional[Cassette] = None, latency: Optional[Latency] = None):
+    """ตั้ง mode / cassette / latency ของ process (benchmark เรียกก่อนสร้าง agent)"""
+    global _mode, _cassette, _latency
+    _mode = mode
+    _cassette = cassette
+    if latency is not None:
+        _latency = latency
+
+
+def current() -> Cassette:
+    """cassette ที่ใช้อยู่ (service: โหลด / สร้างจาก CASSETTE_PATH ครั้งแรกที่เรียก)"""
+    global _cassette
+    if _cassette is None:
+        if _mode == "replay":
+            _cassette = Cassette.load(CASSETTE_PATH)
+        else:
+            _cassette = Cassette(CASSETTE_PATH)
+            _cassette.autosave = True
+    return _cassette
+
+
+# ---------- LLM ----------
+
+class CassetteRecorder(BaseCallbackHandler):
+    """callback ของ chat model ตอน record: จับคู่ start / end ด้วย run_id"""
+
+    run_inline = True
+
+    def __init__(self):
+        self._pending: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        agent = (metadata or {}).get("lc_agent_name") or MAIN_AGENT
+        self._pending[run_id] = (agent, messages_key(messages[0]), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        agent, key, started = pending
+        message = response.generations[0][0].message
+        current().add_llm(agent, key, message, time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._pending.pop(run_id, None)
+
+
+class ReplayChatModel(BaseChatModel):
+    """chat model ที่ตอบจาก cassette (ไม่ต่อ network)"""
+
+    model: str = "cassette-replay"
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-replay"
+
+    def bind_tools(self, tools, **kwargs):
+        # response ที่บันทึกไว้มี tool_calls อยู่แล้ว ไม่ต้องรู้ schema ของ tool
+        return self
+
+    def _replay(self, messages: List[BaseMessage], run_manager) -> tuple:
+        metadata = getattr(run_manager, "metadata", None) or {}
+        agent = metadata.get("lc_agent_name") or MAIN_AGENT
+        entry = current().take_llm(agent, messages_key(messages))
+        message = load(entry["message"], allowed_objects="messages")
+        return ChatResult(generations=[ChatGeneration(message=message)]), _latency.seconds("llm", entry["seconds"])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        result, delay = self._replay(messages, run_manager)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        result, delay = self._replay(messages, run_manager)
+        await asyncio.sleep(delay)
+        return result
+
+
+def wrap_chat_model(factory: Callable[..., BaseChatModel]) -> BaseChatModel:
+    """
+    สร้าง chat model ตาม mode: replay = ReplayChatModel (ไม่เรียก factory) /
+    record = model จริง + CassetteRecorder / off = model จริง
+    """
+    if _mode == "replay":
+        return ReplayChatModel()
+    if _mode == "record":
+        return factory(callbacks=[CassetteRecorder()])
+    return factory()
+
+
+# ---------- Tools ----------
+
+def install_tools(tools: Iterable[Any]):
+    """
+    แทน func / coroutine ของ tool ตาม mode (ทำครั้งเดียวต่อ tool object / off = ไม่ทำอะไร)
+    """
+    if _mode not in ("record", "replay"):
+        return
+    for tool in tools:
+        if id(tool) in _patched_tools:
+            continue
+        _patched_tools[id(tool)] = tool
+        if _mode == "record":
+            _record_tool(tool)
+        else:
+            _replay_tool(tool)
+
+
+def _record_tool(tool):
+    func, coroutine = tool.func, tool.coroutine
+
+    def record(started: float, kwargs: Dict[str, Any], output: Any = None, error: Optional[BaseException] = None):
+        current().add_tool(
+            tool.name,
+            _digest(kwargs),
+            time.perf_counter() - started,
+            output=output,
+            error=f"{type(error).__name__}: {error}" if error is not None else None,
+        )
+
+    if func is not None:
+        def recorded_func(**kwargs):
+            started = time.perf_counter()
+            try:
+                output = func(**kwargs)
+            except Exception as e:
+                record(started, kwargs, error=e)
+                raise
+            record(started, kwargs, output=output)
+            return output
+
+        tool.func = recorded_func
+
+    if coroutine is not None:
+        async def recorded_coroutine(**kwargs):
+            started = time.perf_counter()
+            try:
+                output = await coroutine(**kwargs)
+            except Exception as e:
+                record(started, kwargs, error=e)
+                raise
+            record(started, kwargs, output=output)
+            return output
+
+        tool.coroutine = recorded_coroutine
+
+
+def _replay_tool(tool):
+    def replay(kwargs: Dict[str, Any]) -> tuple:
+        entry = current().take_tool(tool.name, _digest(kwargs))
+        return entry, _latency.seconds("tool", entry["seconds"])
+
+    def result(entry: Dict[str, Any]) -> Any:
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return entry["output"]
+
+    def replayed_func(**kwargs):
+        entry, delay = replay(kwargs)
+        time.sleep(delay)
+        return result(entry)
+
+    async def replayed_coroutine(**kwargs):
+        entry, delay = replay(kwargs)
+        await asyncio.sleep(delay)
+        return result(entry)
+
+    tool.func = replayed_func
+    tool.coroutine = replayed_coroutine
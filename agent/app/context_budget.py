@@ -0,0 +1,161 @@
+# context_budget.py
+"""
+จำกัดขนาด context ที่ส่งให้ LLM ในแต่ละ call (supervisor + subagent)
+
+session ยาว ๆ จะสะสม tool output ใหญ่ ๆ (ผล detection, หน้าเว็บจาก tavily_search, ข้อมูลราคา)
+ทุก call ถัดไปจะส่งซ้ำทั้งหมด middleware นี้ตัด context ก่อนส่งให้ model ทุกครั้ง
+(state / checkpoint ยังเก็บข้อความเต็มไว้เหมือนเดิม):
+
+1. แทน tool output เก่า ๆ ด้วยสรุปสั้น ๆ (ชื่อ tool + ขนาดเดิม + ต้นข้อความ หรือ field สำคัญของ JSON
+   เช่น status / counts / artifact_id ของ detect_pcb_defects) เริ่มจากตัวเก่าสุด
+   tool output ล่าสุด CONTEXT_KEEP_RECENT_TOOL_OUTPUTS ตัวไม่ถูกแตะ (model ยังต้องใช้)
+2. ถ้ายังเกิน ตัดข้อความเก่าที่ยาว (human / ai) ให้เหลือแค่ต้นข้อความ
+3. ถ้ายังเกินอีก สรุป tool output ล่าสุดที่เหลือด้วย (ยังเก็บบทสนทนาไว้ครบทุก turn)
+4. ถ้ายังเกินอยู่ ทิ้ง turn เก่าสุดทั้ง turn (ตัดที่ HumanMessage เพื่อไม่ให้ tool call กับ tool result แยกกัน)
+
+- CONTEXT_TOKEN_BUDGET: token สูงสุดของ messages ต่อ call (ไม่นับ system prompt / tool schema)
+- CONTEXT_SUMMARY_CHARS: ความยาวของต้นข้อความที่เก็บไว้ในสรุป
+"""
+import json
+import os
+from typing import Any, List
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+
+from retrieval import estimate_tokens
+from utils import content_to_text
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "24000"))
+CONTEXT_KEEP_RECENT_TOOL_OUTPUTS = int(os.getenv("CONTEXT_KEEP_RECENT_TOOL_OUTPUTS", "3"))
+CONTEXT_SUMMARY_CHARS = int(os.getenv("CONTEXT_SUMMARY_CHARS", "400"))
+
+# field ที่เก็บไว้เมื่อ tool output เป็น JSON (พอให้อ้างอิงต่อได้ เช่น get_detection_artifacts(artifact_id))
+SUMMARY_JSON_KEYS = ("status", "total", "counts", "artifact_id", "totals", "error")
+
+
+def message_tokens(message: AnyMessage) -> int:
+    tokens = estimate_tokens(content_to_text(message.content))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(json.dumps(tool_call.get("args", {}), ensure_ascii=False, default=str))
+    return tokens + 4
+
+
+def total_tokens(messages: List[AnyMessage]) -> int:
+    return sum(message_tokens(m) for m in messages)
+
+
+def summarize_tool_output(message: ToolMessage, max_chars: int = CONTEXT_SUMMARY_CHARS) -> str:
+    text = content_to_text(message.content)
+    header = f"[compacted output of `{message.name or 'tool'}`, originally ~{estimate_tokens(text)} tokens]"
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and any(k in data for k in SUMMARY_JSON_KEYS):
+        kept = {k: data[k] for k in SUMMARY_JSON_KEYS if k in data}
+        return f"{header} {json.dumps(kept, ensure_ascii=False, separators=(',', ':'), default=str)}"
+    snippet = " ".join(text.split())[:max_chars]
+    return f"{header} {snippet}..."
+
+
+def _truncate(message: AnyMessage, max_chars: int) -> AnyMessage:
+    text = content_to_text(message.content)
+    if len(text) <= max_chars:
+        return message
+    return message.model_copy(update={"content": text[:max_chars] + " ...[truncated]"})
+
+
+def compact_messages(
+    messages: List[AnyMessage],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    keep_recent_tool_outputs: int = CONTEXT_KEEP_RECENT_TOOL_OUTPUTS,
+    summary_chars: int = CONTEXT_SUMMARY_CHARS,
+) -> List[AnyMessage]:
+    """คืน list ใหม่ที่ขนาดไม่เกิน budget (ถ้าทำได้) ไม่แก้ message เดิม"""
+    if budget <= 0 or total_tokens(messages) <= budget:
+        return messages
+
+    messages = list(messages)
+    sizes = [message_tokens(m) for m in messages]
+    total = sum(sizes)
+
+    # 1. tool output เก่า -> สรุป
+    tool_indexes = [i for i, m in enumerate(messages) if isinstance(m, ToolMessage)]
+    protected = set(tool_indexes[-keep_recent_tool_outputs:]) if keep_recent_tool_outputs > 0 else set()
+    for i in tool_indexes:
+        if total <= budget:
+            return messages
+        if i in protected:
+            continue
+        compacted = messages[i].model_copy(update={"content": summarize_tool_output(messages[i], summary_chars)})
+        new_size = message_tokens(compacted)
+        if new_size < sizes[i]:
+            total -= sizes[i] - new_size
+            messages[i], sizes[i] = compacted, new_size
+
+    # 2. ข้อความเก่าที่ยาว -> ต้นข้อความ (ไม่แตะคำถามล่าสุดของ user และข้อความสุดท้าย)
+    turn_starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if turn_starts:
+        protected.add(turn_starts[-1])
+    for i in range(len(messages) - 1):
+        if total <= budget:
+            return messages
+        if i in protected:
+            continue
+        truncated = _truncate(messages[i], summary_chars)
+        if truncated is not messages[i]:
+            new_size = message_tokens(truncated)
+            total -= sizes[i] - new_size
+            messages[i], sizes[i] = truncated, new_size
+
+    # 3. สรุป tool output ล่าสุดที่กันไว้ด้วย ก่อนจะยอมทิ้งทั้ง turn (เสียแค่รายละเอียด ไม่เสียบทสนทนา)
+    for i in tool_indexes:
+        if total <= budget:
+            return messages
+        if not content_to_text(messages[i].content).startswith("[compacted"):
+            compacted = messages[i].model_copy(update={"content": summarize_tool_output(messages[i], summary_chars)})
+            new_size = message_tokens(compacted)
+            if new_size < sizes[i]:
+                total -= sizes[i] - new_size
+                messages[i], sizes[i] = compacted, new_size
+
+    # 4. ยังเกินอยู่ -> ทิ้ง turn เก่าสุด (เริ่ม turn ใหม่ที่ HumanMessage) จนกว่าจะไม่เกิน หรือเหลือ turn สุดท้าย
+    cut = 0
+    for start in turn_starts[1:]:
+        if total <= budget:
+            break
+        total -= sum(sizes[cut:start])
+        cut = start
+    return messages[cut:]
+
+
+class ContextBudgetMiddleware(AgentMiddleware):
+    """
+    ใส่ใน middleware ของ supervisor (create_deep_agent) และของ subagent แต่ละตัว
+    """
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        keep_recent_tool_outputs: int = CONTEXT_KEEP_RECENT_TOOL_OUTPUTS,
+        summary_chars: int = CONTEXT_SUMMARY_CHARS,
+    ):
+        super().__init__()
+        self.budget = budget
+        self.keep_recent_tool_outputs = keep_recent_tool_outputs
+        self.summary_chars = summary_chars
+
+    def _compact(self, request: Any):
+        messages = compact_messages(
+            request.messages, self.budget, self.keep_recent_tool_outputs, self.summary_chars
+        )
+        if messages is request.messages:
+            return request
+        return request.override(messages=messages)
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._compact(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._compact(request))
@@ -3,11 +3,10 @@ from dotenv import load_dotenv
 from typing_extensions import Annotated, Literal
 from langchain import tools
 from langchain.tools import tool
-from langchain.chat_models import init_chat_model
-from langchain_google_genai import ChatGoogleGenerativeAI
-from deepagents import create_deep_agent
 from .prompts import DEFECT_ANALYSIS_PROMPT
-from .tools import detect_pcb_defects
+from .tools import detect_pcb_defects, get_detection_artifacts
+from context_budget import ContextBudgetMiddleware
+from models import LLMBudgetMiddleware, ModelProfileMiddleware, get_agent_model
 
 from rich.console import Console
 from rich.markdown import Markdown
@@ -15,17 +14,17 @@ from rich.panel import Panel
 
 load_dotenv()
 
-# Model Gemini 
-model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.0)
-
 # Sub Agent
-defect_analysis_agent = {
-    "name": "defect-analysis-agent",
-    "description": "Uses computer vision to detect physical defects on PCB images. Returns a list of defects.",
-    "system_prompt": DEFECT_ANALYSIS_PROMPT,
-    "tools": [detect_pcb_defects],
-    "model": model,
-}
+def build_defect_analysis_agent() -> dict:
+    """spec ของ subagent (สร้างตอนใช้งาน ใช้ model ตาม profile ของ agent ใน models.py)"""
+    return {
+        "name": "defect-analysis-agent",
+        "description": "Uses computer vision to detect physical defects on PCB images. Returns a list of defects.",
+        "system_prompt": DEFECT_ANALYSIS_PROMPT,
+        "tools": [detect_pcb_defects, get_detection_artifacts],
+        "model": get_agent_model("defect-analysis-agent"),
+        "middleware": [ModelProfileMiddleware("defect-analysis-agent"), ContextBudgetMiddleware(), LLMBudgetMiddleware()],
+    }
 
 # # Main agent (for test)
 # agent = create_deep_agent(
@@ -96,4 +95,4 @@ defect_analysis_agent = {
 #     except Exception as e:
 #         print(f"💥 เกิดข้อผิดพลาด: {e}")
 #         import traceback
-#         traceback.print_exc()  # แสดง full error traceback เพื่อ debug
\ No newline at end of file
+#         traceback.print_exc()  # แสดง full error traceback เพื่อ debug
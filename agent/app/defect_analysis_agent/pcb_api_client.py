@@ -0,0 +1,293 @@
+# defect_analysis_agent/pcb_api_client.py
+"""
+Client ของ pcb-api (detection service)
+
+detect_pcb_defects ไม่ได้รัน Roboflow / วาดกล่อง / crop / อัปโหลด Supabase เองแล้ว
+แต่ส่งรูปไปที่ POST /detect-image ของ pcb-api แทน
+ทำให้ optimization ทุกอย่างของ detection service ใช้กับ agent ได้ด้วยทันที
+
+มี 2 เส้นทาง:
+- HTTP (default): ใช้ httpx.Client ตัวเดียวทั้ง process (connection pool + keep-alive)
+- in-process (optional): ถ้าตั้ง PCB_API_INPROCESS_DIR ชี้ไปที่โฟลเดอร์ pcb_model/app
+  จะ import pipeline ของ pcb-api มาเรียกตรง ๆ ไม่ต้องผ่าน HTTP
+  (container ต้องติดตั้ง requirements ของ pcb_model ด้วย)
+
+งบ concurrency ของ detection แยกจาก LLM (agent_runner.llm_budget):
+- INFERENCE_MAX_CONCURRENCY: จำนวน detect_image ที่ยิงพร้อมกันได้ต่อ worker
+- INFERENCE_QUEUE_TIMEOUT: รอ slot ได้นานสุดกี่วินาที เกินแล้ว error ทันที (tool ตอบ error ให้ agent)
+HTTP request ส่ง client ของ request ต้นทางไปเป็น X-Forwarded-For (ใช้ทำ rate limit ต่อ client ที่ pcb-api)
+
+ความทนทานของ HTTP (ฝั่ง Roboflow มี deadline / hedging / circuit breaker อยู่ใน pcb-api แล้ว):
+- retry สูงสุด PCB_API_MAX_ATTEMPTS ครั้ง เว้นช่วงแบบ exponential backoff + full jitter
+  หรือตาม Retry-After (ไม่เกิน PCB_API_RETRY_AFTER_MAX) เมื่อ pcb-api ตอบ 429 / 503
+  POST /detect-image ไม่ idempotent (insert DB) จึง retry เฉพาะกรณีที่ pcb-api ยังไม่ได้ประมวลผล
+  (ต่อไม่ติด / 429 / 503) ส่วน GET retry ได้ทุก transport error และ 5xx / ไม่ยิง hedge ซ้ำ
+- circuit breaker: fail ติดกัน PCB_API_BREAKER_FAILURES ครั้ง (ต่อไม่ติด / timeout / 5xx)
+  -> ไม่เรียก pcb-api PCB_API_BREAKER_RESET วินาที tool ตอบ error ทันทีแทนการรอ timeout
+"""
+import importlib
+import mimetypes
+import os
+import random
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+import httpx
+
+from admission import current_client
+
+# --- Configuration ---
+PCB_API_URL = os.getenv("PCB_API_URL", "http://pcb-api:8010")
+PCB_API_TIMEOUT = float(os.getenv("PCB_API_TIMEOUT", "120"))
+PCB_API_MAX_CONNECTIONS = int(os.getenv("PCB_API_MAX_CONNECTIONS", "10"))
+PCB_API_INPROCESS_DIR = os.getenv("PCB_API_INPROCESS_DIR")
+INFERENCE_MAX_CONCURRENCY = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "4"))
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv("INFERENCE_QUEUE_TIMEOUT", "30"))
+PCB_API_MAX_ATTEMPTS = int(os.getenv("PCB_API_MAX_ATTEMPTS", "3"))
+PCB_API_BACKOFF_BASE = float(os.getenv("PCB_API_BACKOFF_BASE", "0.5"))
+PCB_API_BACKOFF_MAX = float(os.getenv("PCB_API_BACKOFF_MAX", "4"))
+PCB_API_RETRY_AFTER_MAX = float(os.getenv("PCB_API_RETRY_AFTER_MAX", "10"))
+PCB_API_BREAKER_FAILURES = int(os.getenv("PCB_API_BREAKER_FAILURES", "5"))
+PCB_API_BREAKER_RESET = float(os.getenv("PCB_API_BREAKER_RESET", "30"))
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+_inprocess_module: Optional[ModuleType] = None
+_inprocess_loaded = False
+
+# detect_image ถูกเรียกใน thread ของ tool จึงใช้ threading semaphore
+_inference_slots = threading.BoundedSemaphore(INFERENCE_MAX_CONCURRENCY)
+
+
+def get_http_client() -> httpx.Client:
+    """
+    คืน httpx.Client ที่แชร์กันทั้ง process (สร้างครั้งแรกที่เรียก)
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=PCB_API_URL,
+                    timeout=httpx.Timeout(PCB_API_TIMEOUT, connect=10.0),
+                    limits=httpx.Limits(
+                        max_connections=PCB_API_MAX_CONNECTIONS,
+                        max_keepalive_connections=PCB_API_MAX_CONNECTIONS,
+                    ),
+                )
+    return _client
+
+
+def _load_inprocess_module() -> Optional[ModuleType]:
+    """
+    import pcb_db จาก pcb_model/app
+    ถ้าไม่ได้ตั้งค่า หรือ import ไม่ได้ จะคืน None แล้วไปใช้ HTTP แทน
+    """
+    global _inprocess_module, _inprocess_loaded
+    if _inprocess_loaded:
+        return _inprocess_module
+
+    _inprocess_loaded = True
+    if not PCB_API_INPROCESS_DIR:
+        return None
+
+    app_dir = os.path.abspath(PCB_API_INPROCESS_DIR)
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+
+    try:
+        _inprocess_module = importlib.import_module("pcb_db")
+    except Exception as e:
+        print(f"[pcb_api_client] in-process pipeline unavailable, fallback to HTTP: {e}")
+        return None
+
+    return _inprocess_module
+
+
+# ---------- Retry + circuit breaker ----------
+
+class _CircuitBreaker:
+    """closed -> (fail ติดกัน N ครั้ง) -> open -> (ครบ reset) -> ปล่อย probe 1 ตัว"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"[pcb_api_client] circuit opened after {self._failures} failure(s)")
+                self._opened_at = time.monotonic()
+
+
+_breaker = _CircuitBreaker(PCB_API_BREAKER_FAILURES, PCB_API_BREAKER_RESET)
+
+# status ที่ pcb-api ตอบก่อนประมวลผล / ประมวลผลไม่สำเร็จโดยยังไม่บันทึกอะไร -> POST retry ได้
+_RETRY_ANY_STATUS = {429, 503}
+_RETRY_IDEMPOTENT_STATUS = {500, 502, 504}
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    if response is not None and response.headers.get("retry-after", "").isdigit():
+        return min(float(response.headers["retry-after"]), PCB_API_RETRY_AFTER_MAX)
+    # full jitter
+    return random.uniform(0, min(PCB_API_BACKOFF_MAX, PCB_API_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _send(method: str, url: str, idempotent: bool, **kwargs) -> httpx.Response:
+    """
+    ส่ง request ไป pcb-api พร้อม retry / circuit breaker
+    คืน response สุดท้าย (อาจเป็น 4xx / 5xx ให้ _raise_for_status จัดการ)
+    """
+    attempts = max(1, PCB_API_MAX_ATTEMPTS)
+    for attempt in range(attempts):
+        if not _breaker.allow():
+            raise RuntimeError("pcb-api is unavailable (circuit open), try again later")
+        last_attempt = attempt == attempts - 1
+        response = None
+        try:
+            response = get_http_client().request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            # request ยังไม่ถูกส่ง retry ได้เสมอ
+            _breaker.record(False)
+            if last_attempt:
+                raise RuntimeError(f"cannot reach pcb-api: {e}") from e
+        except httpx.TransportError as e:
+            _breaker.record(False)
+            if last_attempt or not idempotent:
+                raise RuntimeError(f"pcb-api request failed: {e}") from e
+        else:
+            _breaker.record(response.status_code < 500)
+            retryable = response.status_code in _RETRY_ANY_STATUS or (
+                idempotent and response.status_code in _RETRY_IDEMPOTENT_STATUS
+            )
+            if not retryable or last_attempt:
+                return response
+        delay = _retry_delay(attempt, response)
+        print(f"[pcb_api_client] {method} {url} attempt {attempt + 1} failed, retry in {delay:.1f}s")
+        time.sleep(delay)
+    raise AssertionError("retry loop ended without a response")
+
+
+def _forwarded_headers() -> Dict[str, str]:
+    client = current_client.get()
+    return {"X-Forwarded-For": client} if client else {}
+
+
+def _raise_for_status(response: httpx.Response):
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        raise RuntimeError(f"pcb-api returned {response.status_code}: {detail}")
+
+
+def detect_image(
+    image_path: str,
+    board_code: str | None = None,
+    note: str | None = None,
+    min_confidence: float = 0.0,
+    debug_dir: str | None = None,
+) -> Dict[str, Any]:
+    """
+    ส่งรูปให้ pcb-api detect + บันทึกลง Supabase
+    คืน payload รูปแบบเดียวกับ /detect-image:
+        {"main_image": {...}, "crops": [{...}, ...]}
+    debug_dir: ใช้ได้เฉพาะ in-process (ผ่าน HTTP ให้ตั้ง PCB_DEBUG_DIR ที่ฝั่ง pcb-api แทน)
+    raise RuntimeError ถ้ารอ slot ของ INFERENCE_MAX_CONCURRENCY เกิน INFERENCE_QUEUE_TIMEOUT
+    """
+    if not _inference_slots.acquire(timeout=INFERENCE_QUEUE_TIMEOUT):
+        raise RuntimeError(
+            f"detection service is busy (no inference slot within {INFERENCE_QUEUE_TIMEOUT:.0f}s), try again later"
+        )
+    try:
+        return _detect_image(image_path, board_code, note, min_confidence, debug_dir)
+    finally:
+        _inference_slots.release()
+
+
+def _detect_image(
+    image_path: str,
+    board_code: str | None,
+    note: str | None,
+    min_confidence: float,
+    debug_dir: str | None,
+) -> Dict[str, Any]:
+    pcb_db = _load_inprocess_module()
+    if pcb_db is not None:
+        return pcb_db.save_detection_to_supabase_and_get_urls(
+            image_path=image_path,
+            model_path=os.path.join(os.path.abspath(PCB_API_INPROCESS_DIR), "best.pt"),
+            board_code=board_code,
+            note=note,
+            min_confidence=min_confidence,
+            debug_dir=debug_dir,
+        )
+
+    filename = os.path.basename(image_path)
+    content_type = mimetypes.guess_type(filename)[0] or "image/png"
+
+    data: Dict[str, Any] = {"min_confidence": str(min_confidence)}
+    if board_code:
+        data["board_code"] = board_code
+    if note:
+        data["note"] = note
+
+    # อ่านเป็น bytes ครั้งเดียว retry แล้วส่งซ้ำได้
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    response = _send(
+        "POST",
+        "/detect-image",
+        idempotent=False,
+        files={"file": (filename, image_bytes, content_type)},
+        data=data,
+        headers=_forwarded_headers(),
+    )
+
+    _raise_for_status(response)
+    return response.json()
+
+
+def fetch_detection(main_image_id: str) -> Dict[str, Any]:
+    """
+    ดึง detection ที่บันทึกไว้แล้วตาม id ของรูปหลัก (GET /detections/{id})
+    """
+    pcb_db = _load_inprocess_module()
+    if pcb_db is not None:
+        payload = pcb_db.get_detection(main_image_id)
+        if payload is None:
+            raise RuntimeError(f"detection {main_image_id} not found")
+        return payload
+
+    response = _send("GET", f"/detections/{main_image_id}", idempotent=True, headers=_forwarded_headers())
+    _raise_for_status(response)
+    return response.json()
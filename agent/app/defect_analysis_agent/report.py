@@ -0,0 +1,112 @@
+# defect_analysis_agent/report.py
+"""
+แปลง payload จาก pcb-api ({"main_image": {...}, "crops": [...]}) เป็นข้อความที่ส่งให้ LLM
+
+- format_compact_summary: JSON สั้น ๆ (นับตาม class + top-k defect + artifact_id)
+  URL ของรูปไม่ใส่ใน output แต่ resolve ทีหลังได้ด้วย get_detection_artifacts
+- format_markdown_summary: รูปแบบ Markdown เดิม (ยาว มี URL ทุกรูป)
+"""
+import json
+import os
+from collections import Counter
+from typing import Any, Dict
+
+
+def _bbox_center(bbox: Dict[str, Any]) -> tuple[float, float]:
+    return bbox["x"] + bbox["w"] / 2, bbox["y"] + bbox["h"] / 2
+
+
+def format_compact_summary(image_path: str, payload: Dict[str, Any], top_k: int = 10) -> str:
+    """
+    JSON summary แบบกระชับ เช่น
+    {"status": "FAIL", "image": "Test1.png", "artifact_id": "...", "total": 3,
+     "counts": {"missing_hole": 2, "spur": 1},
+     "top": [{"cls": "missing_hole", "conf": 0.955, "bbox": [x, y, w, h]}, ...]}
+    """
+    main_image = payload.get("main_image") or {}
+    crops = payload.get("crops") or []
+
+    ranked = sorted(crops, key=lambda c: float(c.get("confidence", 0.0)), reverse=True)
+
+    top = []
+    for crop in ranked[:top_k]:
+        bbox = crop.get("bbox") or {}
+        item: Dict[str, Any] = {
+            "cls": crop.get("prediction"),
+            "conf": round(float(crop.get("confidence", 0.0)), 3),
+        }
+        if bbox:
+            item["bbox"] = [bbox.get("x"), bbox.get("y"), bbox.get("w"), bbox.get("h")]
+        top.append(item)
+
+    summary: Dict[str, Any] = {
+        "status": "FAIL" if crops else "PASS",
+        "image": os.path.basename(image_path),
+        "artifact_id": main_image.get("id"),
+        "total": len(crops),
+        "counts": dict(Counter(c.get("prediction") for c in crops)),
+        "top": top,
+    }
+    if len(crops) > top_k:
+        summary["omitted"] = len(crops) - top_k
+
+    return json.dumps(summary, ensure_ascii=False, separators=(",", ":"))
+
+
+def format_markdown_summary(image_path: str, payload: Dict[str, Any]) -> str:
+    """
+    Markdown summary แบบเดิม (มี Supabase URL ของทุกรูป)
+    """
+    main_image = payload.get("main_image") or {}
+    crops = payload.get("crops") or []
+
+    if not crops:
+        return "Analysis complete: No defects detected in this image."
+
+    summary = f"✅ Analysis complete for `{image_path}`.\n\n"
+    summary += f"📊 **Total Defects Found: {len(crops)}**\n\n"
+
+    if main_image:
+        summary += "**Main Detected Image (Supabase):**\n"
+        summary += f"- ID: `{main_image.get('id')}`\n"
+        summary += f"- URL: {main_image.get('public_url')}\n"
+        summary += f"- Size: {main_image.get('width')} x {main_image.get('height')}\n\n"
+
+    summary += "**Detailed Defect List (with Supabase crop URLs):**\n"
+    for i, crop in enumerate(crops, start=1):
+        bbox = crop.get("bbox") or {}
+        confidence_pct = float(crop.get("confidence", 0.0)) * 100
+        summary += f"\n**Defect #{i}:**\n"
+        summary += f"  - Type: {crop.get('prediction')}\n"
+        summary += f"  - Confidence: {confidence_pct:.2f}%\n"
+        if bbox:
+            xc, yc = _bbox_center(bbox)
+            summary += f"  - Location (center): X={xc:.1f}, Y={yc:.1f}\n"
+            summary += f"  - Size: Width={bbox['w']:.1f}, Height={bbox['h']:.1f}\n"
+        summary += f"  - Supabase Crop URL: {crop.get('crop_public_url')}\n"
+
+    return summary
+
+
+def format_artifact_urls(payload: Dict[str, Any]) -> str:
+    """
+    URL ของรูปทั้งหมดใน detection หนึ่งครั้ง (ใช้ตอน resolve artifact_id)
+    """
+    main_image = payload.get("main_image") or {}
+    crops = payload.get("crops") or []
+    return json.dumps(
+        {
+            "artifact_id": main_image.get("id"),
+            "main_image_url": main_image.get("public_url"),
+            "crops": [
+                {
+                    "cls": c.get("prediction"),
+                    "conf": round(float(c.get("confidence", 0.0)), 3),
+                    "url": c.get("crop_public_url"),
+                }
+                for c in crops
+            ],
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
@@ -0,0 +1 @@
+"""Offline IPC standards / internal QA knowledge base package."""
@@ -0,0 +1,217 @@
+# knowledge_base/index.py
+"""
+Persistent retrieval index ของเอกสาร IPC (IPC-A-600, IPC-6012 excerpts) และเอกสาร QA ภายใน
+
+โครงสร้างไฟล์ใน index_dir:
+- chunks.jsonl      : chunk ละบรรทัด {"source", "index", "text"}
+- vocab.json        : {term: term_id}
+- idf.npy           : idf ของแต่ละ term
+- indptr.npy        : postings แบบ CSR (term_id -> ช่วงใน doc_ids/tfs)
+- doc_ids.npy, tfs.npy, doc_len.npy
+- embeddings.npy    : (optional) embedding ที่ normalize แล้ว (n_chunks, dim)
+- meta.json         : avgdl, k1, b, จำนวน chunk, embedding model
+
+ไฟล์ .npy ถูกเปิดแบบ memory-mapped ตอน search จึงโหลดเร็วและไม่กิน RAM ตามขนาด index
+"""
+import glob
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from retrieval import Chunk, split_into_chunks, tokenize
+
+BASE_DIR = os.path.dirname(__file__)
+KB_DOCS_DIR = os.getenv("KB_DOCS_DIR", os.path.join(BASE_DIR, "docs"))
+KB_INDEX_DIR = os.getenv("KB_INDEX_DIR", os.path.join(BASE_DIR, "index"))
+KB_CHUNK_TOKENS = int(os.getenv("KB_CHUNK_TOKENS", "250"))
+KB_EMBEDDING_MODEL = os.getenv("KB_EMBEDDING_MODEL", "models/text-embedding-004")
+
+DOC_PATTERNS = ("*.md", "*.txt")
+
+
+def load_documents(docs_dir: str = KB_DOCS_DIR) -> List[tuple[str, str]]:
+    """อ่านไฟล์ .md / .txt ทั้งหมดใต้ docs_dir คืน [(source, text), ...]"""
+    paths: List[str] = []
+    for pattern in DOC_PATTERNS:
+        paths.extend(glob.glob(os.path.join(docs_dir, "**", pattern), recursive=True))
+
+    documents = []
+    for path in sorted(paths):
+        with open(path, encoding="utf-8") as f:
+            documents.append((os.path.relpath(path, docs_dir), f.read()))
+    return documents
+
+
+def build_index(
+    docs_dir: str = KB_DOCS_DIR,
+    index_dir: str = KB_INDEX_DIR,
+    embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> Dict[str, object]:
+    """
+    สร้าง index ใหม่ทั้งหมดจากเอกสารใน docs_dir แล้วเขียนลง index_dir
+    embed_documents: ถ้าใส่ จะสร้าง embeddings.npy สำหรับ vector score ด้วย
+    """
+    chunks: List[Chunk] = []
+    for source, text in load_documents(docs_dir):
+        chunks.extend(split_into_chunks(source, text, KB_CHUNK_TOKENS))
+
+    tokenized = [tokenize(c.text) for c in chunks]
+    vocab: Dict[str, int] = {}
+    postings: Dict[int, List[tuple[int, int]]] = {}
+    for doc_id, tokens in enumerate(tokenized):
+        for term, tf in Counter(tokens).items():
+            term_id = vocab.setdefault(term, len(vocab))
+            postings.setdefault(term_id, []).append((doc_id, tf))
+
+    n_docs = len(chunks)
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    doc_ids: List[int] = []
+    tfs: List[int] = []
+    idf = np.zeros(len(vocab), dtype=np.float32)
+    for term_id in range(len(vocab)):
+        plist = postings[term_id]
+        indptr[term_id + 1] = indptr[term_id] + len(plist)
+        doc_ids.extend(d for d, _ in plist)
+        tfs.extend(f for _, f in plist)
+        df = len(plist)
+        idf[term_id] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    doc_len = np.array([len(t) for t in tokenized], dtype=np.float32)
+
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, "chunks.jsonl"), "w", encoding="utf-8") as f:
+        for c in chunks:
+            f.write(json.dumps({"source": c.source, "index": c.index, "text": c.text}, ensure_ascii=False) + "\n")
+    with open(os.path.join(index_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+
+    np.save(os.path.join(index_dir, "idf.npy"), idf)
+    np.save(os.path.join(index_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(index_dir, "doc_ids.npy"), np.array(doc_ids, dtype=np.int32))
+    np.save(os.path.join(index_dir, "tfs.npy"), np.array(tfs, dtype=np.float32))
+    np.save(os.path.join(index_dir, "doc_len.npy"), doc_len)
+
+    embedding_model = None
+    embeddings_path = os.path.join(index_dir, "embeddings.npy")
+    if embed_documents is not None and chunks:
+        vectors = np.asarray(embed_documents([c.text for c in chunks]), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        np.save(embeddings_path, vectors)
+        embedding_model = KB_EMBEDDING_MODEL
+    elif os.path.exists(embeddings_path):
+        os.remove(embeddings_path)
+
+    meta = {
+        "n_chunks": n_docs,
+        "n_terms": len(vocab),
+        "avgdl": float(doc_len.mean()) if n_docs else 0.0,
+        "k1": k1,
+        "b": b,
+        "embedding_model": embedding_model,
+        "built_at": time.time(),
+    }
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class StandardsIndex:
+    """
+    โหลด index ที่ build แล้ว (memory-mapped) แล้ว search ด้วย BM25
+    (+ cosine ของ embedding ถ้ามี embeddings.npy และส่ง embed_query มา)
+    """
+
+    def __init__(
+        self,
+        index_dir: str = KB_INDEX_DIR,
+        embed_query: Optional[Callable[[str], List[float]]] = None,
+        vector_weight: float = 0.5,
+    ):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "vocab.json"), encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        with open(os.path.join(index_dir, "chunks.jsonl"), encoding="utf-8") as f:
+            self.chunks = [json.loads(line) for line in f]
+
+        def _load(name: str):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self.idf = _load("idf.npy")
+        self.indptr = _load("indptr.npy")
+        self.doc_ids = _load("doc_ids.npy")
+        self.tfs = _load("tfs.npy")
+        self.doc_len = _load("doc_len.npy")
+
+        embeddings_path = os.path.join(index_dir, "embeddings.npy")
+        self.embeddings = np.load(embeddings_path, mmap_mode="r") if os.path.exists(embeddings_path) else None
+        self.embed_query = embed_query if self.embeddings is not None else None
+        self.vector_weight = vector_weight
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        k1, b = self.meta["k1"], self.meta["b"]
+        avgdl = self.meta["avgdl"] or 1.0
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            norm = k1 * (1 - b + b * self.doc_len[docs] / avgdl)
+            np.add.at(scores, docs, self.idf[term_id] * tf * (k1 + 1) / (tf + norm))
+        return scores
+
+    def _cosine(self, query: str) -> Optional[np.ndarray]:
+        if self.embed_query is None:
+            return None
+        try:
+            query_vec = np.asarray(self.embed_query(query), dtype=np.float32)
+        except Exception as e:
+            print(f"[knowledge_base] query embedding failed, BM25 only: {e}")
+            return None
+        query_vec /= np.linalg.norm(query_vec) + 1e-12
+        return np.asarray(self.embeddings @ query_vec, dtype=np.float32)
+
+    def search(self, query: str, top_k: int = 4) -> List[Dict[str, object]]:
+        """
+        คืน chunk ที่เกี่ยวข้องที่สุด [{"source", "index", "text", "score", "bm25", "cosine"}, ...]
+        score = BM25 หรือ (ถ้ามี vector) BM25 ที่ normalize ด้วยค่าสูงสุด + vector_weight * cosine
+        ใช้แค่เรียงลำดับ / ถ้าจะตัดด้วย threshold ให้ใช้ bm25 (ค่าดิบ) หรือ cosine (None ถ้าไม่มี vector)
+        """
+        if not self.chunks:
+            return []
+
+        bm25 = self.bm25_scores(query)
+        cosine = self._cosine(query)
+        scores = bm25
+        if cosine is not None:
+            top = bm25.max()
+            scores = (bm25 / top if top > 0 else bm25) + self.vector_weight * cosine
+
+        top_k = min(top_k, len(self.chunks))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {
+                **self.chunks[i],
+                "score": float(scores[i]),
+                "bm25": float(bm25[i]),
+                "cosine": float(cosine[i]) if cosine is not None else None,
+            }
+            for i in best
+            if scores[i] > 0
+        ]
@@ -0,0 +1,40 @@
+# knowledge_base/ingest.py
+"""
+สร้าง index ของ knowledge base จากเอกสารใน knowledge_base/docs
+
+    python -m knowledge_base.ingest                 # BM25 อย่างเดียว
+    python -m knowledge_base.ingest --embeddings    # + vector (ต้องมี GOOGLE_API_KEY)
+"""
+import argparse
+import time
+
+from dotenv import load_dotenv
+
+from .index import KB_DOCS_DIR, KB_EMBEDDING_MODEL, KB_INDEX_DIR, build_index
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the standards knowledge base index.")
+    parser.add_argument("--docs", default=KB_DOCS_DIR, help="folder of .md/.txt documents")
+    parser.add_argument("--index", default=KB_INDEX_DIR, help="output index folder")
+    parser.add_argument("--embeddings", action="store_true", help="also build embedding vectors")
+    args = parser.parse_args()
+
+    embed_documents = None
+    if args.embeddings:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        embed_documents = GoogleGenerativeAIEmbeddings(model=KB_EMBEDDING_MODEL).embed_documents
+
+    started = time.perf_counter()
+    meta = build_index(args.docs, args.index, embed_documents=embed_documents)
+    print(
+        f"Indexed {meta['n_chunks']} chunks / {meta['n_terms']} terms "
+        f"from {args.docs} -> {args.index} in {time.perf_counter() - started:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
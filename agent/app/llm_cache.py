@@ -0,0 +1,297 @@
+# llm_cache.py
+"""
+Response cache ของ ChatGoogleGenerativeAI ที่ supervisor และ subagent ใช้
+
+ใช้ผ่าน argument `cache=` ของ chat model (LangChain BaseCache) เช่น
+    ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.0, cache=get_llm_cache())
+
+- Exact match: key = sha256(messages ที่ normalize แล้ว + llm_string)
+  llm_string ของ LangChain มีชื่อ model, parameter และ schema ของ tools ที่ bind ไว้อยู่แล้ว
+  ตอน normalize จะตัด field ที่เปลี่ยนทุกครั้ง (id, tool_call_id, usage/response metadata) ทิ้ง
+- Similarity (optional, LLM_CACHE_SEMANTIC=1): ใช้เฉพาะคำถามแรกของ conversation
+  (system + human 1 ข้อความ) เทียบ embedding ของคำถามกับที่เคยถาม ถ้า cosine >= threshold ถือว่า hit
+  เก็บ embedding เฉพาะคำตอบสุดท้าย (ไม่มี tool_calls) และข้ามคำถามที่มี path / id / ตัวเลข
+  (เช่น "Analyze the PCB image located at: <path>" หรือ task ที่แนบ detection JSON)
+  เพราะคำถามพวกนี้ embed ออกมาเกือบเท่ากันแม้จะเป็นคนละรูป / คนละ lot
+- เก็บใน SQLite (persistent) มี TTL และ LRU eviction ตามจำนวน entry
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "0") == "1"
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.95"))
+LLM_CACHE_EMBEDDING_MODEL = os.getenv("LLM_CACHE_EMBEDDING_MODEL", "models/text-embedding-004")
+
+# field ที่ไม่ควรมีผลกับ cache key
+_VOLATILE_KEYS = {"id", "tool_call_id", "response_metadata", "usage_metadata"}
+
+# ตัวเลข / path (มี / หรือ \) / JSON / ชื่อไฟล์ที่มีนามสกุล -> คำถามเจาะจงข้อมูล ห้ามใช้ similarity
+_SPECIFIC_RE = re.compile(r"\d|[/\\{}]|\w\.[A-Za-z]{2,4}\b")
+
+
+def _strip_volatile(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _strip_volatile(v) for k, v in obj.items() if k not in _VOLATILE_KEYS}
+    if isinstance(obj, list):
+        return [_strip_volatile(v) for v in obj]
+    return obj
+
+
+def _parse_messages(prompt: str) -> Optional[list]:
+    # chat model ส่ง prompt เป็น dumps(messages)
+    try:
+        data = json.loads(prompt)
+    except ValueError:
+        return None
+    return data if isinstance(data, list) else None
+
+
+def _message_type(message: Any) -> Optional[str]:
+    if not isinstance(message, dict):
+        return None
+    ids = message.get("id")
+    if isinstance(ids, list) and ids:
+        return ids[-1]  # เช่น "HumanMessage"
+    return message.get("type")
+
+
+def _message_text(message: dict) -> str:
+    content = (message.get("kwargs") or {}).get("content", "")
+    if isinstance(content, list):
+        return "\n".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return str(content)
+
+
+def _sha256(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _semantic_question(text: str) -> Optional[str]:
+    """คำถามที่ใช้ similarity ได้ / None ถ้าว่าง หรือมี path / id / ตัวเลข"""
+    if not text.strip() or _SPECIFIC_RE.search(text):
+        return None
+    return text
+
+
+def _is_final_answer(return_val: RETURN_VAL_TYPE) -> bool:
+    """ไม่มี tool_calls (tool call ผูกกับ input ของคำถามนั้น ๆ ห้าม replay ให้คำถามอื่น)"""
+    return all(not getattr(getattr(gen, "message", None), "tool_calls", None) for gen in return_val)
+
+
+class AgentLLMCache(BaseCache):
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl: float = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        similarity_threshold: float = LLM_CACHE_SIMILARITY,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                scope TEXT,
+                value TEXT NOT NULL,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_scope ON llm_cache(scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_access ON llm_cache(last_access)")
+        self._conn.commit()
+
+    # ---------- keys ----------
+
+    def _keys(self, prompt: str, llm_string: str) -> tuple[str, Optional[str], Optional[str]]:
+        """
+        คืน (exact_key, semantic_scope, question)
+        semantic_scope/question เป็น None ถ้า prompt ไม่ใช่คำถามแรกของ conversation
+        question เป็น None ถ้าคำถามมี path / id / ตัวเลข (ดู _semantic_question)
+        """
+        messages = _parse_messages(prompt)
+        if messages is None:
+            return _sha256(prompt, llm_string), None, None
+
+        normalized = json.dumps(_strip_volatile(messages), sort_keys=True, ensure_ascii=False)
+        exact_key = _sha256(normalized, llm_string)
+
+        types = [_message_type(m) for m in messages]
+        if types.count("HumanMessage") == 1 and types[-1] == "HumanMessage" and set(types) <= {
+            "SystemMessage",
+            "HumanMessage",
+        }:
+            context = json.dumps(_strip_volatile(messages[:-1]), sort_keys=True, ensure_ascii=False)
+            return exact_key, _sha256(context, llm_string), _semantic_question(_message_text(messages[-1]))
+
+        return exact_key, None, None
+
+    # ---------- BaseCache ----------
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        exact_key, scope, question = self._keys(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (exact_key,)
+            ).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                self._conn.execute(
+                    "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, exact_key)
+                )
+                self._conn.commit()
+                return self._decode(row[0])
+
+        if self.embed is None or scope is None or not question:
+            return None
+        return self._semantic_lookup(scope, question, now)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        exact_key, scope, question = self._keys(prompt, llm_string)
+
+        embedding = None
+        if self.embed is not None and scope is not None and question and _is_final_answer(return_val):
+            try:
+                embedding = self._to_blob(self.embed(question))
+            except Exception as e:
+                print(f"[llm_cache] embedding failed, exact-match only: {e}")
+
+        now = time.time()
+        value = json.dumps([dumps(gen) for gen in return_val])
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache (key, scope, value, embedding, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (exact_key, scope, value, embedding, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    # ---------- internals ----------
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?
+                )
+                """,
+                (count - self.max_entries,),
+            )
+
+    def _semantic_lookup(self, scope: str, question: str, now: float) -> Optional[RETURN_VAL_TYPE]:
+        import numpy as np
+
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT key, value, embedding FROM llm_cache
+                WHERE scope = ? AND embedding IS NOT NULL AND created_at >= ?
+                """,
+                (scope, now - self.ttl),
+            ).fetchall()
+        if not rows:
+            return None
+
+        try:
+            query = np.asarray(self.embed(question), dtype=np.float32)
+        except Exception as e:
+            print(f"[llm_cache] embedding failed, skip similarity lookup: {e}")
+            return None
+
+        matrix = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+
+        with self._lock:
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, rows[best][0])
+            )
+            self._conn.commit()
+        cached = self._decode(rows[best][1])
+        # entry ที่เก็บก่อนมีเงื่อนไข final answer
+        return cached if cached is not None and _is_final_answer(cached) else None
+
+    @staticmethod
+    def _decode(value: str) -> Optional[Sequence[Any]]:
+        try:
+            return [loads(gen) for gen in json.loads(value)]
+        except Exception:
+            # entry เก่าที่ deserialize ไม่ได้ (เช่น langchain เปลี่ยน version) ถือว่า miss
+            return None
+
+    @staticmethod
+    def _to_blob(vector: List[float]) -> bytes:
+        import numpy as np
+
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+_cache: Optional[AgentLLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def _default_embedder() -> Callable[[str], List[float]]:
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    embeddings = GoogleGenerativeAIEmbeddings(model=LLM_CACHE_EMBEDDING_MODEL)
+    return embeddings.embed_query
+
+
+def get_llm_cache() -> Optional[AgentLLMCache]:
+    """
+    cache ตัวเดียวทั้ง process (None ถ้าปิดด้วย LLM_CACHE_ENABLED=0)
+    """
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AgentLLMCache(embed=_default_embedder() if LLM_CACHE_SEMANTIC else None)
+    return _cache
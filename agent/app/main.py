@@ -1,32 +1,113 @@
 # app/main.py
-import os
-import glob
-import shutil
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-# ดึง agent จากไฟล์เดิม
-from PCB_supervisor_agent import agent
+from admission import RateLimitedError, client_id, current_client, current_endpoint, rate_limiters, retry_after_header
+from agent_runner import AgentBusyError, llm_budget, runners
+from Report_analysis_agent.cost_engine import BatchCostRequest, evaluate_batch
+from sessions import SessionStore
+from streaming import agent_sse_stream
+from tracing import metrics, trace_run
+import workspaces
+
+sessions = SessionStore()
+
+
+async def sweep_workspaces():
+    # ลบ workspace ของ /analyze-image ที่เกิน retention (รันใน thread ไม่บล็อก event loop)
+    while True:
+        try:
+            await asyncio.to_thread(workspaces.sweep)
+        except Exception as e:
+            print(f"[workspaces] sweep failed: {e}")
+        await asyncio.sleep(workspaces.WORKSPACE_SWEEP_INTERVAL)
+
+
+# --------- Warm-up: สร้าง agent ใน background ---------
+# import langchain / deepagents + สร้าง graph ใช้เวลาหลายวินาที จึงไม่ทำก่อนเปิดรับ request
+# health check ตอบได้ทันที ส่วน request ที่ต้องใช้ agent จะรอ warm-up ให้เสร็จก่อน
+def _build_agents():
+    # ดึง agent จากไฟล์เดิม
+    from PCB_supervisor_agent import build_supervisor_agent, get_image_pipeline
+
+    # supervisor ที่ผูกกับ checkpointer ของ sessions (ประวัติแชทต่อ session_id)
+    return build_supervisor_agent(checkpointer=sessions.checkpointer), get_image_pipeline()
+
+
+async def warm_up():
+    await sessions.open()
+    app.state.agent, app.state.image_pipeline = await asyncio.to_thread(_build_agents)
+
+
+async def ensure_ready():
+    try:
+        # shield: request ที่ถูกยกเลิกไม่ทำให้ warm-up ถูกยกเลิกไปด้วย
+        await asyncio.shield(app.state.warm_up)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"agent is not available: {e}", headers={"Retry-After": "5"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.warm_up = asyncio.create_task(warm_up())
+    sweeper = asyncio.create_task(sweep_workspaces())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        app.state.warm_up.cancel()
+        await sessions.close()
+
 
 app = FastAPI(
     title="PCB Supervisor Agent API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --------- Pydantic models ---------
 class TextRequest(BaseModel):
     text: str
+    session_id: Optional[str] = None
 
 class TextResponse(BaseModel):
     reply: str
+    session_id: str
 
 class ImageResponse(BaseModel):
     reply: str
+    session_id: str
+    workspace_id: str
     input_image: str
     processed_images: list[str]
 
 
+# --------- Admission control ---------
+def admit(request: Request, group: str):
+    """
+    เช็คก่อนรับงาน (ตอบ 429 + Retry-After ทันที ไม่ต้องรอคิว):
+    - token bucket ของ client สำหรับกลุ่ม endpoint นี้
+    - คิวของกลุ่ม endpoint นี้ยังไม่เต็ม
+    """
+    client = client_id(request)
+    # ส่งต่อให้ pcb-api (X-Forwarded-For) ผ่าน contextvar
+    current_client.set(client)
+    # เลือก model profile "<endpoint>:<agent>" (ดู models.py)
+    current_endpoint.set(group)
+    try:
+        rate_limiters[group].check(client)
+        runners[group].check_capacity()
+    except RateLimitedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+
+
 # --------- Helper: ดึงข้อความสุดท้ายของ assistant ---------
 def extract_last_assistant_text(messages) -> str:
     """
@@ -73,80 +154,316 @@ def extract_last_assistant_text(messages) -> str:
     return str(content)
 
 
+# --------- Helper: session ---------
+async def remember_turn(config, user_content: str, reply: str):
+    """
+    pipeline ไม่มี checkpointer ของตัวเอง จึงเขียนคำถาม + คำตอบต่อท้าย thread ของ supervisor
+    follow-up ผ่าน /chat จะเห็นผล detection (counts, artifact_id) โดยไม่ต้องรันใหม่
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    await app.state.agent.aupdate_state(
+        config, {"messages": [HumanMessage(content=user_content), AIMessage(content=reply)]}
+    )
+
+
+def _final_reply(event) -> Optional[str]:
+    # event on_chain_end ของ graph ชั้นนอกสุด = state สุดท้าย
+    if event["event"] != "on_chain_end" or event.get("parent_ids"):
+        return None
+    output = (event.get("data") or {}).get("output")
+    if isinstance(output, dict) and "messages" in output:
+        return extract_last_assistant_text(output["messages"])
+    return None
+
+
+# --------- Helper: รัน agent ผ่าน runner (async + จำกัด concurrency) ---------
+async def run_agent(user_content: str, session_id: str, group: str = "chat", graph=None, **inputs) -> str:
+    """
+    group: คิวที่ใช้ ("chat" / "image")
+    graph: None = supervisor agent (ต่อประวัติของ session), หรือ image_pipeline (ส่ง image_path มาใน inputs)
+    """
+    runner = runners[group]
+    agent_name = "supervisor" if graph is None else "image-pipeline"
+    payload = {
+        "messages": [
+            {"role": "user", "content": user_content}
+        ],
+        **inputs,
+    }
+    await ensure_ready()
+    try:
+        async with sessions.use(session_id) as config:
+            with trace_run(group, agent_name, {"session.id": session_id}) as tracer:
+                if graph is None:
+                    result = await runner.run(app.state.agent, payload, config={**config, "callbacks": [tracer]})
+                else:
+                    result = await runner.run(graph, payload, config={"callbacks": [tracer]})
+            if graph is not None:
+                await remember_turn(config, user_content, extract_last_assistant_text(result["messages"]))
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+    except TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"agent did not finish within {runner.timeout:.0f}s",
+        )
+    except Exception as e:
+        # โยน error ออกไปให้ client เห็น
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return extract_last_assistant_text(result["messages"])
+
+
 # --------- Health check ---------
 @app.get("/")
 def root():
-    return {"status": "ok", "message": "PCB Supervisor Agent API is running"}
+    warm_up = app.state.warm_up
+    return {
+        "status": "ok",
+        "message": "PCB Supervisor Agent API is running",
+        # ready = warm-up (สร้าง agent) เสร็จแล้ว
+        "ready": warm_up.done() and not warm_up.cancelled() and warm_up.exception() is None,
+        "agent": {group: runner.stats() for group, runner in runners.items()},
+        "llm": llm_budget.stats(),
+        "rate_limits": {group: limiter.stats() for group, limiter in rate_limiters.items()},
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    metrics รวมของ process (Prometheus text): จำนวน / เวลา agent run, LLM call + token ต่อ agent,
+    tool call ต่อ tool, สถานะคิว / งบ LLM
+    """
+    gauges = {
+        "agent_runner_running": {(("queue", g),): r.stats()["running"] for g, r in runners.items()},
+        "agent_runner_waiting": {(("queue", g),): r.stats()["waiting"] for g, r in runners.items()},
+        "agent_runner_rejected_total": {(("queue", g),): r.stats()["rejected"] for g, r in runners.items()},
+        "agent_llm_in_flight": {(): llm_budget.stats()["in_flight"]},
+    }
+    return metrics.render(gauges)
 
 
 # --------- Text endpoint ---------
 @app.post("/chat", response_model=TextResponse)
-async def chat(req: TextRequest):
+async def chat(req: TextRequest, request: Request):
     """
     ใช้คุยกับ Supervisor ด้วยข้อความธรรมดา
+    ส่ง session_id เดิมเพื่อถามต่อจากคำตอบก่อนหน้า (ไม่ส่ง = เริ่ม session ใหม่)
     """
-    try:
-        result = agent.invoke({
-            "messages": [
-                {"role": "user", "content": req.text}
-            ]
-        })
-        reply_text = extract_last_assistant_text(result["messages"])
-        return {"reply": reply_text}
-    except Exception as e:
-        # โยน error ออกไปให้ client เห็น
-        raise HTTPException(status_code=500, detail=str(e))
+    admit(request, "chat")
+    session_id = req.session_id or sessions.new_session_id()
+    reply_text = await run_agent(req.text, session_id)
+    return {"reply": reply_text, "session_id": session_id}
 
 
-# --------- Image endpoint ---------
-@app.post("/analyze-image", response_model=ImageResponse)
-async def analyze_image(file: UploadFile = File(...)):
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
     """
-    อัพโหลดรูป PCB ให้ agent วิเคราะห์
+    ลบประวัติของ session ทันที (ไม่ต้องรอ eviction)
     """
-    # โฟลเดอร์ input image
-    data_dir = os.path.join("defect_analysis_agent", "data")
-    os.makedirs(data_dir, exist_ok=True)
+    await ensure_ready()
+    if not await sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"deleted": session_id}
 
-    input_path = os.path.join(data_dir, file.filename)
 
+# --------- Helper: เซฟรูปที่อัพโหลดลง workspace ของ request ---------
+def save_uploaded_image(file: UploadFile) -> tuple[workspaces.Workspace, str]:
+    """
+    สร้าง workspace ใหม่ต่อ request แล้วเซฟรูปลง input/ (ชื่อไฟล์ซ้ำกันข้าม request ได้)
+    processed images ของ request นี้อ่านจาก manifest ของ workspace (workspaces.list_artifacts)
+    """
     try:
-        with open(input_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        workspace = workspaces.create_workspace()
+        input_path = workspaces.save_input(workspace, file.filename, file.file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Cannot save uploaded file: {e}")
 
+    return workspace, input_path
+
+
+AnalyzeMode = Literal["pipeline", "supervisor"]
+
+
+def image_graph(mode: Optional[str], input_path: str):
+    """
+    pipeline   : detect -> cost -> protocol -> สรุป แบบ fix ลำดับ (LLM ใช้แค่ใน subagent + ตอนสรุป)
+    supervisor : ให้ supervisor LLM เลือก subagent เองแบบเดิม
+    คืน (graph, inputs เพิ่มเติม, subagent_nodes สำหรับ streaming) / graph None = supervisor
+    เรียกหลัง ensure_ready() เท่านั้น
+    """
+    from PCB_supervisor_agent import ANALYZE_IMAGE_MODE, PIPELINE_SUBAGENT_NODES
+
+    if (mode or ANALYZE_IMAGE_MODE) == "pipeline":
+        return app.state.image_pipeline, {"image_path": input_path}, PIPELINE_SUBAGENT_NODES
+    return None, {}, None
+
+
+# --------- Image endpoint ---------
+@app.post("/analyze-image", response_model=ImageResponse)
+async def analyze_image(
+    request: Request,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    mode: Optional[AnalyzeMode] = None,
+):
+    """
+    อัพโหลดรูป PCB ให้ agent วิเคราะห์
+    mode: "pipeline" | "supervisor" (default ตาม ANALYZE_IMAGE_MODE)
+    """
+    admit(request, "image")
+    workspace, input_path = save_uploaded_image(file)
+    session_id = session_id or sessions.new_session_id()
+    await ensure_ready()
+
     # สร้างข้อความให้ supervisor เหมือนที่ CLI ใช้
     user_input = f"Analyze the PCB image located at: {input_path}"
 
-    try:
-        result = agent.invoke({
-            "messages": [
-                {"role": "user", "content": user_input}
-            ]
-        })
-        reply_text = extract_last_assistant_text(result["messages"])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    # หาไฟล์ processed images
-    processed_dirs = [
-        os.path.join("defect_analysis_agent", "processed_images"),
-        "processed_images",
-    ]
-    processed_files: list[str] = []
-
-    for d in processed_dirs:
-        if os.path.exists(d):
-            processed_files.extend(
-                sorted(
-                    glob.glob(os.path.join(d, "*.jpg"))
-                    + glob.glob(os.path.join(d, "*.png"))
-                )
-            )
+    graph, inputs, _ = image_graph(mode, input_path)
+    reply_text = await run_agent(user_input, session_id, "image", graph=graph, **inputs)
 
     return {
         "reply": reply_text,
+        "session_id": session_id,
+        "workspace_id": workspace.id,
         "input_image": input_path,
-        "processed_images": processed_files,
+        "processed_images": workspaces.list_artifacts(workspace),
     }
+
+
+@app.get("/workspaces/{workspace_id}")
+def get_workspace_manifest(workspace_id: str):
+    """
+    manifest ของ workspace (input + detection artifact) จนกว่าจะถูกลบตาม WORKSPACE_RETENTION
+    """
+    workspace = workspaces.get_workspace(workspace_id)
+    if workspace is None:
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_id} not found")
+    return workspaces.read_manifest(workspace)
+
+
+# --------- Streaming endpoints (Server-Sent Events) ---------
+def stream_agent(
+    user_content: str,
+    session_id: str,
+    group: str = "chat",
+    final_extra=None,
+    graph=None,
+    subagent_nodes=None,
+    **inputs,
+) -> StreamingResponse:
+    """
+    ส่ง progress ของ supervisor/subagent + token ของคำตอบเป็น SSE
+    เช็คคิวก่อนเริ่ม stream เพื่อให้ยังตอบ 429 เป็น HTTP status ได้
+    """
+    runner = runners[group]
+    try:
+        runner.check_capacity()
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+
+    payload = {
+        "messages": [
+            {"role": "user", "content": user_content}
+        ],
+        **inputs,
+    }
+
+    agent_name = "supervisor" if graph is None else "image-pipeline"
+
+    async def events():
+        async with sessions.use(session_id) as config:
+            reply = None
+            with trace_run(group, agent_name, {"session.id": session_id, "agent.stream": True}) as tracer:
+                if graph is None:
+                    async for event in runner.stream_events(
+                        app.state.agent, payload, config={**config, "callbacks": [tracer]}
+                    ):
+                        yield event
+                    return
+                async for event in runner.stream_events(graph, payload, config={"callbacks": [tracer]}):
+                    reply = _final_reply(event) or reply
+                    yield event
+            if reply is not None:
+                await remember_turn(config, user_content, reply)
+
+    def final():
+        extra = {"session_id": session_id}
+        if final_extra is not None:
+            extra.update(final_extra())
+        return extra
+
+    return StreamingResponse(
+        agent_sse_stream(
+            events(),
+            extract_last_assistant_text,
+            final_extra=final,
+            subagent_nodes=subagent_nodes,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id},
+    )
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: TextRequest, request: Request):
+    """
+    เหมือน /chat แต่ stream ผลเป็น Server-Sent Events
+    """
+    admit(request, "chat")
+    await ensure_ready()
+    return stream_agent(req.text, req.session_id or sessions.new_session_id())
+
+
+@app.post("/analyze-image/stream")
+async def analyze_image_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    mode: Optional[AnalyzeMode] = None,
+):
+    """
+    เหมือน /analyze-image แต่ stream ผลเป็น Server-Sent Events
+    event สุดท้าย (final) มี session_id + workspace_id + input_image + processed_images เหมือน response ปกติ
+    """
+    admit(request, "image")
+    workspace, input_path = save_uploaded_image(file)
+    user_input = f"Analyze the PCB image located at: {input_path}"
+
+    await ensure_ready()
+    graph, inputs, subagent_nodes = image_graph(mode, input_path)
+    return stream_agent(
+        user_input,
+        session_id or sessions.new_session_id(),
+        "image",
+        final_extra=lambda: {
+            "workspace_id": workspace.id,
+            "input_image": input_path,
+            "processed_images": workspaces.list_artifacts(workspace),
+        },
+        graph=graph,
+        subagent_nodes=subagent_nodes,
+        **inputs,
+    )
+
+
+# --------- Cost engine endpoint ---------
+@app.post("/cost/batch")
+async def cost_batch(req: BatchCostRequest, request: Request):
+    """
+    คำนวณ cost impact หลาย lot / หลาย scenario ในครั้งเดียว (ไม่ผ่าน LLM)
+    ใช้ engine ตัวเดียวกับ tool calculate_batch_cost_impact ของ cost-analysis-agent
+    ผ่าน rate limit / คิวของกลุ่ม "cost" (ขนาดงานถูกจำกัดใน BatchCostRequest)
+    """
+    admit(request, "cost")
+    runner = runners["cost"]
+    try:
+        async with asyncio.timeout(runner.timeout):
+            async with runner.slot():
+                return await asyncio.to_thread(evaluate_batch, req)
+    except AgentBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="cost evaluation timed out")
@@ -0,0 +1,160 @@
+# models.py
+"""
+Chat model pool ที่ supervisor และ subagent ทุกตัวใช้ร่วมกัน
+
+เดิมแต่ละไฟล์สร้าง ChatGoogleGenerativeAI ของตัวเองตอน import (4 client)
+ตอนนี้สร้างครั้งแรกที่มีคนขอ แล้วใช้ instance เดิมซ้ำสำหรับ config เดียวกัน
+(bind_tools ของแต่ละ agent ไม่แก้ instance กลาง)
+
+LLMBudgetMiddleware: ทุก model call ของ agent (supervisor + subagent) ต้องได้ slot จาก
+agent_runner.llm_budget ก่อน (LLM_MAX_CONCURRENCY)
+
+CASSETTE_MODE=record|replay: บันทึก / เล่นซ้ำ response ของ model (ดู cassettes.py)
+
+Model profile ต่อ agent / endpoint (model, temperature, max_output_tokens, thinking_budget):
+agent ที่งานง่าย (เช่น cost-analysis-agent ที่แค่เรียก calculator tool) ใช้ tier ที่เร็ว / ถูกกว่าได้
+- agent: supervisor, defect-analysis-agent, cost-analysis-agent, test-protocol-agent,
+  synthesize (ขั้นสรุปของ image pipeline)
+- ลำดับที่ใช้ (ตัวหลังทับตัวก่อน): "default" -> "<agent>" -> "<endpoint>:<agent>"
+  endpoint = "chat" (/chat) หรือ "image" (/analyze-image) เช่น "image:supervisor"
+- MODEL_PROFILES = JSON หรือ path ของไฟล์ JSON ทับค่าใน DEFAULT_PROFILES เช่น
+  {"cost-analysis-agent": {"model": "gemini-2.5-flash"}, "chat:supervisor": {"thinking_budget": 1024}}
+- thinking_budget: 0 = ปิด thinking / -1 = ให้ model เลือกเอง / None = ค่าเริ่มต้นของ model
+เทียบ latency / คุณภาพของแต่ละชุดได้ด้วย benchmarks/model_tiering.py
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware
+
+from admission import current_endpoint
+from agent_runner import llm_budget
+
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gemini-2.5-flash")
+FAST_AGENT_MODEL = os.getenv("FAST_AGENT_MODEL", "gemini-2.5-flash-lite")
+MODEL_PROFILES = os.getenv("MODEL_PROFILES", "")
+
+PROFILE_FIELDS = ("model", "temperature", "max_output_tokens", "thinking_budget")
+
+DEFAULT_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {"model": AGENT_MODEL, "temperature": 0.0},
+    # เรียก calculate_* แล้วรายงานตัวเลขตาม tool ไม่ต้องคิดเยอะ
+    "cost-analysis-agent": {"model": FAST_AGENT_MODEL, "thinking_budget": 0, "max_output_tokens": 2048},
+    # สรุปผล detection (compact JSON) เป็นรายงาน defect
+    "defect-analysis-agent": {"thinking_budget": 0, "max_output_tokens": 2048},
+}
+
+_models: Dict[Tuple[Any, ...], Any] = {}
+_models_lock = threading.Lock()
+
+
+def load_profiles(source: str = MODEL_PROFILES) -> Dict[str, Dict[str, Any]]:
+    """DEFAULT_PROFILES + ค่าจาก MODEL_PROFILES (JSON string หรือ path ของไฟล์ JSON)"""
+    profiles = {name: dict(profile) for name, profile in DEFAULT_PROFILES.items()}
+    if not source:
+        return profiles
+    if source.lstrip().startswith("{"):
+        overrides = json.loads(source)
+    else:
+        with open(source, encoding="utf-8") as f:
+            overrides = json.load(f)
+    for name, profile in overrides.items():
+        unknown = set(profile) - set(PROFILE_FIELDS)
+        if unknown:
+            raise ValueError(f"model profile {name!r}: unknown field(s) {', '.join(sorted(unknown))}")
+        profiles.setdefault(name, {}).update(profile)
+    return profiles
+
+
+_profiles = load_profiles()
+
+
+def set_profiles(profiles: Dict[str, Dict[str, Any]]):
+    """แทน profile ทั้งชุด (benchmark ใช้สลับ config) / graph ที่สร้างแล้วยังใช้ model ตอน build"""
+    global _profiles
+    _profiles = profiles
+
+
+def resolve_profile(agent: str, endpoint: Optional[str] = None) -> Dict[str, Any]:
+    names = ["default", agent] + ([f"{endpoint}:{agent}"] if endpoint else [])
+    profile: Dict[str, Any] = {}
+    for name in names:
+        profile.update(_profiles.get(name, {}))
+    return profile
+
+
+def get_agent_model(agent: str, endpoint: Optional[str] = None):
+    """chat model ตาม profile ของ agent (และ endpoint ถ้ามี)"""
+    return get_chat_model(**resolve_profile(agent, endpoint))
+
+
+def get_chat_model(
+    model: str = AGENT_MODEL,
+    temperature: float = 0.0,
+    max_output_tokens: Optional[int] = None,
+    thinking_budget: Optional[int] = None,
+):
+    """
+    คืน ChatGoogleGenerativeAI ที่แชร์กันตาม (model, temperature, max_output_tokens, thinking_budget)
+    """
+    key = (model, temperature, max_output_tokens, thinking_budget)
+    if key not in _models:
+        with _models_lock:
+            if key not in _models:
+                from cassettes import wrap_chat_model
+
+                def factory(**kwargs):
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+
+                    from llm_cache import get_llm_cache
+
+                    if max_output_tokens is not None:
+                        kwargs["max_output_tokens"] = max_output_tokens
+                    if thinking_budget is not None:
+                        kwargs["thinking_budget"] = thinking_budget
+                    return ChatGoogleGenerativeAI(
+                        model=model, temperature=temperature, cache=get_llm_cache(), **kwargs
+                    )
+
+                # CASSETTE_MODE=replay ได้ ReplayChatModel แทน (ไม่ต่อ Gemini) / record ติด recorder
+                _models[key] = wrap_chat_model(factory)
+    return _models[key]
+
+
+class LLMBudgetMiddleware(AgentMiddleware):
+    """
+    รอ slot ของ llm_budget ก่อนเรียก model (async เท่านั้น / CLI แบบ sync ผ่านตรง)
+    """
+
+    def wrap_model_call(self, request, handler):
+        return handler(request)
+
+    async def awrap_model_call(self, request, handler):
+        async with llm_budget.slot():
+            return await handler(request)
+
+
+class ModelProfileMiddleware(AgentMiddleware):
+    """
+    เลือก model ตาม profile "<endpoint>:<agent>" ของ request ปัจจุบัน (current_endpoint)
+    ไม่มี endpoint หรือได้ model เดิม = ใช้ model ที่ agent สร้างไว้ตอน build
+    """
+
+    def __init__(self, agent: str):
+        super().__init__()
+        self.agent = agent
+
+    def _profiled(self, request):
+        endpoint = current_endpoint.get()
+        if endpoint is None:
+            return request
+        model = get_agent_model(self.agent, endpoint)
+        return request if model is request.model else request.override(model=model)
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._profiled(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._profiled(request))
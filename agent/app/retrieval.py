@@ -0,0 +1,155 @@
+# retrieval.py
+"""
+เครื่องมือ retrieval แบบเบา ๆ (ไม่ต้องใช้ model) สำหรับลดขนาด context ที่ส่งให้ LLM
+
+- split_into_chunks: ตัด markdown เป็นก้อนตามหัวข้อ/ย่อหน้า ขนาดประมาณ chunk_tokens
+- BM25: ให้คะแนน chunk เทียบกับ query
+- select_relevant_chunks: เลือก chunk ที่คะแนนสูงสุดภายใน token budget
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_HEADING_RE = re.compile(r"^#{1,6}\s")
+
+# คำที่เจอบ่อยจนไม่ช่วยแยกความเกี่ยวข้อง
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were "
+    "will with what which how when where who why can should".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """lowercase แล้วตัดเป็นคำ (เก็บรูปแบบเช่น ipc-a-600, 6012 ไว้เป็นคำเดียว)"""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """ประมาณจำนวน token (~4 ตัวอักษร / token)"""
+    return (len(text) + 3) // 4
+
+
+def link_density(text: str) -> float:
+    """สัดส่วนตัวอักษรที่เป็น link (เมนู/footer มักเป็น link เกือบทั้งหมด)"""
+    if not text:
+        return 0.0
+    linked = sum(len(m.group(0)) for m in _LINK_RE.finditer(text))
+    return linked / len(text)
+
+
+@dataclass
+class Chunk:
+    source: str
+    index: int
+    text: str
+
+
+def split_into_chunks(source: str, text: str, chunk_tokens: int = 200) -> List[Chunk]:
+    """
+    ตัด markdown เป็นก้อน: เริ่มก้อนใหม่ที่หัวข้อ หรือเมื่อขนาดเกิน chunk_tokens
+    ย่อหน้าที่ยาวเกินจะถูกตัดตามประโยค
+    """
+    max_chars = chunk_tokens * 4
+    paragraphs: List[str] = []
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            cut = para.rfind(". ", 0, max_chars)
+            cut = cut + 1 if cut > max_chars // 2 else max_chars
+            paragraphs.append(para[:cut].strip())
+            para = para[cut:].strip()
+        if para:
+            paragraphs.append(para)
+
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    size = 0
+    for para in paragraphs:
+        if current and (_HEADING_RE.match(para) or size + len(para) > max_chars):
+            chunks.append(Chunk(source, len(chunks), "\n\n".join(current)))
+            current, size = [], 0
+        current.append(para)
+        size += len(para)
+    if current:
+        chunks.append(Chunk(source, len(chunks), "\n\n".join(current)))
+    return chunks
+
+
+class BM25:
+    """Okapi BM25 บน list ของเอกสารที่ tokenize แล้ว"""
+
+    def __init__(self, docs: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_tfs = [Counter(d) for d in docs]
+        self.doc_lens = [len(d) for d in docs]
+        self.avgdl = (sum(self.doc_lens) / len(docs)) if docs else 0.0
+
+        df: Counter = Counter()
+        for tf in self.doc_tfs:
+            df.update(tf.keys())
+        n = len(docs)
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()
+        }
+
+    def scores(self, query_tokens: Iterable[str]) -> List[float]:
+        terms = [t for t in set(query_tokens) if t in self.idf]
+        result = []
+        for tf, dl in zip(self.doc_tfs, self.doc_lens):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * dl / (self.avgdl or 1.0))
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    score += self.idf[term] * f * (self.k1 + 1) / (f + norm)
+            result.append(score)
+        return result
+
+
+def select_relevant_chunks(
+    query: str,
+    documents: Sequence[Tuple[str, str]],
+    token_budget: int = 3000,
+    chunk_tokens: int = 200,
+    max_link_density: float = 0.5,
+) -> Dict[str, List[Chunk]]:
+    """
+    documents: [(source, text), ...]
+    คืน {source: [chunk, ...]} เฉพาะ chunk ที่เกี่ยวกับ query มากที่สุดรวมกันไม่เกิน token_budget
+    (chunk ในแต่ละ source เรียงตามลำดับเดิมในหน้า)
+    """
+    chunks = [
+        c
+        for source, text in documents
+        for c in split_into_chunks(source, text, chunk_tokens)
+        if link_density(c.text) <= max_link_density
+    ]
+    if not chunks:
+        return {}
+
+    bm25 = BM25([tokenize(c.text) for c in chunks])
+    scores = bm25.scores(tokenize(query))
+    ranked = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+
+    selected: List[Chunk] = []
+    used = 0
+    for i in ranked:
+        if scores[i] <= 0:
+            break
+        cost = estimate_tokens(chunks[i].text)
+        if used + cost > token_budget:
+            continue
+        selected.append(chunks[i])
+        used += cost
+
+    by_source: Dict[str, List[Chunk]] = {}
+    for c in sorted(selected, key=lambda c: (c.source, c.index)):
+        by_source.setdefault(c.source, []).append(c)
+    return by_source
@@ -0,0 +1,155 @@
+# sessions.py
+"""
+Conversation session ของ agent API (session_id = thread_id ของ LangGraph checkpointer)
+
+- เก็บ checkpoint ของ supervisor ไว้ใน SQLite (AsyncSqliteSaver) ข้าม request / restart
+  follow-up เช่น "now estimate cost for a batch of 5000" จึงเห็นผล detection เดิมโดยไม่ต้องรันใหม่
+- ตาราง sessions เก็บ last_seen ของแต่ละ session ไว้ทำ eviction:
+    * SESSION_TTL: ไม่มี request เกินกี่วินาทีถึงลบทิ้ง
+    * SESSION_MAX: เก็บได้สูงสุดกี่ session (เกินแล้วลบตัวที่ใช้ล่าสุดนานที่สุด)
+    * SESSION_SWEEP_INTERVAL: ลบ session เก่าทุกกี่วินาที (background task)
+- request ใน session เดียวกันถูกรันทีละตัว (checkpoint ของ thread เดียวกันห้ามเขียนพร้อมกัน)
+"""
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(".cache", "sessions.sqlite"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+
+
+class SessionStore:
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        ttl: float = SESSION_TTL,
+        max_sessions: int = SESSION_MAX,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.checkpointer = None  # AsyncSqliteSaver (สร้างใน open)
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    # ---------- lifecycle ----------
+
+    async def open(self):
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = await aiosqlite.connect(self.path)
+        self.checkpointer = AsyncSqliteSaver(self._conn)
+        await self.checkpointer.setup()
+        await self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        await self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions(last_seen)")
+        await self._conn.commit()
+
+        await self.evict()
+        if self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    # ---------- sessions ----------
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def config(session_id: str) -> Dict[str, Dict[str, str]]:
+        return {"configurable": {"thread_id": session_id}}
+
+    async def touch(self, session_id: str):
+        now = time.time()
+        await self._conn.execute(
+            """
+            INSERT INTO sessions (session_id, created_at, last_seen) VALUES (?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET last_seen = excluded.last_seen
+            """,
+            (session_id, now, now),
+        )
+        await self._conn.commit()
+
+    @asynccontextmanager
+    async def use(self, session_id: str):
+        """
+        อัปเดต last_seen แล้วรันโค้ดข้างในทีละ request ต่อ session
+        """
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            await self.touch(session_id)
+            yield self.config(session_id)
+
+    async def delete(self, session_id: str) -> bool:
+        await self.checkpointer.adelete_thread(session_id)
+        cursor = await self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        await self._conn.commit()
+        lock = self._locks.get(session_id)
+        if lock is not None and not lock.locked():
+            self._locks.pop(session_id, None)
+        return cursor.rowcount > 0
+
+    # ---------- eviction ----------
+
+    async def _expired(self) -> List[str]:
+        expired: List[str] = []
+        if self.ttl > 0:
+            async with self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_seen < ?", (time.time() - self.ttl,)
+            ) as cursor:
+                expired.extend(row[0] for row in await cursor.fetchall())
+        if self.max_sessions > 0:
+            async with self._conn.execute(
+                "SELECT session_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?",
+                (self.max_sessions,),
+            ) as cursor:
+                expired.extend(row[0] for row in await cursor.fetchall())
+        return list(dict.fromkeys(expired))
+
+    async def evict(self) -> int:
+        """ลบ session ที่หมดอายุ / เกินจำนวน (ข้าม session ที่กำลังรันอยู่)"""
+        evicted = 0
+        for session_id in await self._expired():
+            lock = self._locks.get(session_id)
+            if lock is not None and lock.locked():
+                continue
+            await self.delete(session_id)
+            evicted += 1
+        if evicted:
+            print(f"[sessions] evicted {evicted} session(s)")
+        return evicted
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.evict()
+            except Exception as e:
+                print(f"[sessions] eviction failed: {e}")
@@ -0,0 +1,147 @@
+# streaming.py
+"""
+แปลง event จาก agent.astream_events (v2) เป็น Server-Sent Events
+
+event ที่ส่งให้ client:
+- start             : รับ request แล้ว (ส่งทันที ก่อนรอ slot ของ AgentRunner)
+- subagent_start    : supervisor ส่งงานให้ subagent (task tool) หรือ pipeline เข้า node ของ subagent
+- subagent_end      : subagent ทำงานเสร็จ
+- tool_result       : tool ของ subagent ทำงานเสร็จ (detect_pcb_defects จะมีจำนวน defect ติดมาด้วย)
+- token             : token ของคำตอบ supervisor ที่กำลัง generate
+- final             : คำตอบสุดท้าย (เหมือน reply ของ endpoint ปกติ)
+- error             : เกิด error ระหว่างรัน
+"""
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from agent_runner import AgentBusyError
+from utils import content_to_text
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _is_supervisor_event(event: Dict[str, Any]) -> bool:
+    # event ของ subagent (ที่ถูกเรียกผ่าน task tool) จะมี checkpoint namespace ซ้อนกัน เช่น "tools:...|model:..."
+    ns = (event.get("metadata") or {}).get("langgraph_checkpoint_ns", "")
+    return "|" not in ns
+
+
+def _tool_output_text(output: Any) -> str:
+    # on_tool_end อาจได้ ToolMessage หรือ Command (task tool ของ deepagents) หรือ str
+    if hasattr(output, "content"):
+        return content_to_text(output.content)
+    update = getattr(output, "update", None)
+    if isinstance(update, dict) and update.get("messages"):
+        return content_to_text(getattr(update["messages"][-1], "content", ""))
+    return str(output)
+
+
+def _defect_summary(text: str) -> Dict[str, Any]:
+    # detect_pcb_defects คืน JSON แบบ compact (ดู defect_analysis_agent/report.py)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {"preview": text[:200]}
+    return {
+        "status": data.get("status"),
+        "total": data.get("total"),
+        "counts": data.get("counts"),
+        "artifact_id": data.get("artifact_id"),
+    }
+
+
+async def agent_sse_stream(
+    events: AsyncIterator[Dict[str, Any]],
+    extract_reply: Callable[[list], str],
+    final_extra: Optional[Callable[[], Dict[str, Any]]] = None,
+    subagent_nodes: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[str]:
+    """
+    รับ async iterator ของ event (จาก AgentRunner.stream_events) แล้ว yield เป็นข้อความ SSE
+    subagent_nodes: {node: subagent name} ของ graph แบบ pipeline (เช่น PIPELINE_SUBAGENT_NODES)
+    """
+    subagent_nodes = subagent_nodes or {}
+    started = time.perf_counter()
+    tool_started: Dict[str, float] = {}
+    final_messages = None
+
+    yield sse_event("start", {})
+
+    try:
+        async for event in events:
+            kind = event["event"]
+            name = event.get("name")
+            run_id = event.get("run_id")
+            data = event.get("data") or {}
+
+            if (
+                kind in ("on_chain_start", "on_chain_end")
+                and name in subagent_nodes
+                and (event.get("metadata") or {}).get("langgraph_node") == name
+            ):
+                if kind == "on_chain_start":
+                    tool_started[run_id] = time.perf_counter()
+                    yield sse_event("subagent_start", {"subagent": subagent_nodes[name], "description": ""})
+                else:
+                    elapsed = time.perf_counter() - tool_started.pop(run_id, time.perf_counter())
+                    yield sse_event(
+                        "subagent_end",
+                        {"subagent": subagent_nodes[name], "seconds": round(elapsed, 2)},
+                    )
+
+            elif kind == "on_tool_start":
+                tool_started[run_id] = time.perf_counter()
+                if name == "task":
+                    tool_input = data.get("input") or {}
+                    yield sse_event(
+                        "subagent_start",
+                        {
+                            "subagent": tool_input.get("subagent_type"),
+                            "description": str(tool_input.get("description", ""))[:200],
+                        },
+                    )
+
+            elif kind == "on_tool_end":
+                elapsed = time.perf_counter() - tool_started.pop(run_id, time.perf_counter())
+                if name == "task":
+                    tool_input = data.get("input") or {}
+                    yield sse_event(
+                        "subagent_end",
+                        {"subagent": tool_input.get("subagent_type"), "seconds": round(elapsed, 2)},
+                    )
+                else:
+                    payload: Dict[str, Any] = {"tool": name, "seconds": round(elapsed, 2)}
+                    if name == "detect_pcb_defects":
+                        payload.update(_defect_summary(_tool_output_text(data.get("output"))))
+                    yield sse_event("tool_result", payload)
+
+            elif kind == "on_chat_model_stream" and _is_supervisor_event(event):
+                text = content_to_text(getattr(data.get("chunk"), "content", ""))
+                if text:
+                    yield sse_event("token", {"text": text})
+
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = data.get("output")
+                if isinstance(output, dict) and "messages" in output:
+                    final_messages = output["messages"]
+
+    except AgentBusyError as e:
+        yield sse_event("error", {"status": 429, "detail": str(e), "retry_after": e.retry_after})
+        return
+    except TimeoutError:
+        yield sse_event("error", {"status": 504, "detail": "agent run timed out"})
+        return
+    except Exception as e:
+        yield sse_event("error", {"status": 500, "detail": str(e)})
+        return
+
+    final: Dict[str, Any] = {
+        "reply": extract_reply(final_messages or []),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    if final_extra is not None:
+        final.update(final_extra())
+    yield sse_event("final", final)
@@ -1,27 +1,46 @@
 """Testing Protocol Tools.
 
-This module provides external search and strategic planning utilities 
-for the Testing Protocol Agent, using Tavily for external context discovery
-and internal reflection for quality assurance planning.
+This module provides local standards retrieval, external search and strategic
+planning utilities for the Testing Protocol Agent, using the offline knowledge base
+for IPC standards, Tavily for external context discovery and internal reflection
+for quality assurance planning.
 """
+import json
 import os
-import httpx
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from markdownify import markdownify
 from tavily import TavilyClient
 from typing import Literal
 
+from retrieval import select_relevant_chunks
+from .web_fetch import WEB_FETCH_TIMEOUT, fetch_page_markdown, fetch_pages
+
 load_dotenv()
 
-# Initialize Tavily Client
+# token budget รวมของเนื้อหาเว็บที่ส่งกลับไปใน tavily_search หนึ่งครั้ง
+WEB_CONTENT_TOKEN_BUDGET = int(os.getenv("WEB_CONTENT_TOKEN_BUDGET", "3000"))
+WEB_CONTENT_CHUNK_TOKENS = int(os.getenv("WEB_CONTENT_CHUNK_TOKENS", "200"))
+# คะแนน BM25 ขั้นต่ำของ search_standards ที่ถือว่าตอบได้จาก knowledge base
+KB_MIN_SCORE = float(os.getenv("KB_MIN_SCORE", "1.0"))  # BM25 ดิบ
+KB_MIN_COSINE = float(os.getenv("KB_MIN_COSINE", "0.65"))  # ใช้เมื่อ index มี embeddings
+
+# Tavily Client (สร้างตอนค้นหาครั้งแรก)
 # ตรวจสอบให้แน่ใจว่าได้ set env TAVILY_API_KEY แล้ว หรือใส่ key ตรงนี้ (ไม่แนะนำสำหรับ prod)
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+_tavily_client = None
+
 
+def get_tavily_client() -> TavilyClient:
+    global _tavily_client
+    if _tavily_client is None:
+        _tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    return _tavily_client
 
-def fetch_webpage_content(url: str, timeout: float = 10.0) -> str:
+
+def fetch_webpage_content(url: str, timeout: float = WEB_FETCH_TIMEOUT) -> str:
     """Fetch and convert webpage content to markdown.
 
+    Uses the shared pooled client and the on-disk page cache (see web_fetch.py).
+
     Args:
         url: URL to fetch
         timeout: Request timeout in seconds
@@ -29,17 +48,7 @@ def fetch_webpage_content(url: str, timeout: float = 10.0) -> str:
     Returns:
         Webpage content as markdown or error message
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
-    try:
-        response = httpx.get(url, headers=headers, timeout=timeout)
-        response.raise_for_status()
-        # แปลง HTML เป็น Markdown เพื่อให้อ่านง่ายและประหยัด Token
-        return markdownify(response.text)
-    except Exception as e:
-        return f"Error fetching content from {url}: {str(e)}"
+    return fetch_page_markdown(url, timeout=timeout)
 
 
 @tool(parse_docstring=True)
@@ -51,7 +60,8 @@ def tavily_search(
     """Search the web for supplementary external context, emerging best practices, 
     or industry news related to PCB testing and standards compliance.
 
-    Uses Tavily to discover relevant URLs, then fetches and returns full webpage content as markdown.
+    Uses Tavily to discover relevant URLs, fetches the pages, and returns only the passages
+    most relevant to the query (BM25-ranked, within a fixed token budget) as markdown.
     This tool should be used for information not available in internal QA documents.
 
     Args:
@@ -60,11 +70,11 @@ def tavily_search(
         topic: Topic filter - 'general', 'news', or 'finance' (default: 'general').
 
     Returns:
-        Formatted search results with full webpage content.
+        Formatted search results with the most relevant webpage excerpts.
     """
     try:
         # Use Tavily to discover URLs
-        search_results = tavily_client.search(
+        search_results = get_tavily_client().search(
             query,
             max_results=max_results,
             topic=topic,
@@ -72,25 +82,41 @@ def tavily_search(
     except Exception as e:
         return f"Error connecting to search engine: {str(e)}"
 
+    results = [r for r in search_results.get("results", []) if r.get("url")]
+
+    # Fetch all webpages concurrently (cached, size-capped, with an overall deadline)
+    contents = fetch_pages([r["url"] for r in results])
+
+    # Keep only the chunks most relevant to the query, within the token budget
+    pages = [(url, text) for url, text in contents.items() if not text.startswith("Error fetching")]
+    relevant = select_relevant_chunks(
+        query,
+        pages,
+        token_budget=WEB_CONTENT_TOKEN_BUDGET,
+        chunk_tokens=WEB_CONTENT_CHUNK_TOKENS,
+    )
+
     result_texts = []
-    
-    # Loop through results safely using .get()
-    for result in search_results.get("results", []):
-        url = result.get("url")
+    for result in results:
+        url = result["url"]
         title = result.get("title", "No Title")
 
-        if url:
-            # Fetch webpage content
-            content = fetch_webpage_content(url)
+        if url in relevant:
+            content = "\n\n[...]\n\n".join(c.text for c in relevant[url])
+        elif contents[url].startswith("Error fetching"):
+            content = contents[url]
+        else:
+            # ไม่มีส่วนไหนของหน้าที่เกี่ยวข้อง ใช้ snippet จาก Tavily แทน
+            content = result.get("content") or "No relevant content found on this page."
 
-            result_text = f"""## {title}
+        result_text = f"""## {title}
 **URL:** {url}
 
 {content}
 
 ---
 """
-            result_texts.append(result_text)
+        result_texts.append(result_text)
 
     # Handle case where no results are found
     if not result_texts:
@@ -104,6 +130,74 @@ def tavily_search(
     return response
 
 
+_standards_index = None
+
+
+def _get_standards_index():
+    """โหลด knowledge base index ครั้งแรกที่ถูกเรียก (None ถ้ายังไม่ได้ build)"""
+    global _standards_index
+    if _standards_index is None:
+        from knowledge_base.index import KB_INDEX_DIR, StandardsIndex
+
+        meta_path = os.path.join(KB_INDEX_DIR, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            embedding_model = json.load(f).get("embedding_model")
+        _standards_index = StandardsIndex(KB_INDEX_DIR, embed_query=_query_embedder(embedding_model))
+    return _standards_index
+
+
+def _query_embedder(embedding_model):
+    """embed_query ของ model เดียวกับที่ ingest.py --embeddings ใช้ / None = BM25 อย่างเดียว"""
+    if not embedding_model:
+        return None
+    try:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=embedding_model).embed_query
+    except Exception as e:
+        print(f"[search_standards] embeddings unavailable ({e}), BM25 only")
+        return None
+
+
+def _is_good_match(hit) -> bool:
+    # score แบบ hybrid ถูก normalize (ตัวบนสุดได้ ~1 เสมอ) จึงตัดด้วยค่าดิบของแต่ละฝั่งแทน
+    if hit["bm25"] >= KB_MIN_SCORE:
+        return True
+    return hit.get("cosine") is not None and hit["cosine"] >= KB_MIN_COSINE
+
+
+@tool(parse_docstring=True)
+def search_standards(query: str, top_k: int = 4) -> str:
+    """Search the local knowledge base of IPC standards excerpts (IPC-A-600, IPC-6012)
+    and internal QA documents.
+
+    This is fast and offline. Use it FIRST for any standards, acceptance criteria or
+    internal procedure question; only fall back to tavily_search when it reports no good match.
+
+    Args:
+        query: What to look up, e.g. 'IPC-6012 class 2 minimum annular ring'.
+        top_k: Number of passages to return (default: 4).
+
+    Returns:
+        The most relevant passages with their source document.
+    """
+    index = _get_standards_index()
+    if index is None or len(index) == 0:
+        return "Local knowledge base is empty or not built. Use tavily_search instead."
+
+    hits = index.search(query, top_k=top_k)
+    if not any(_is_good_match(hit) for hit in hits):
+        return f"No good local match for '{query}'. Use tavily_search for this question."
+
+    passages = [
+        f"### [{hit['source']} #{hit['index']}] (score {hit['score']:.2f})\n{hit['text']}"
+        for hit in hits
+    ]
+    return f"📚 Local knowledge base results for '{query}':\n\n" + "\n\n".join(passages)
+
+
 @tool(parse_docstring=True)
 def think_tool(reflection: str) -> str:
     """Tool for strategic reflection on testing protocol design and decision-making.
@@ -116,7 +210,7 @@ def think_tool(reflection: str) -> str:
     1. Analysis of current findings - What mandatory standards (IPC) or external best practices have I gathered?
     2. Gap assessment - What crucial testing steps or compliance checks are still missing?
     3. Quality evaluation - Is the current protocol robust enough for the PCB class?
-    4. Strategic decision - Should I use RAG, use external search, or finalize the protocol?
+    4. Strategic decision - Should I use search_standards (local knowledge base), use external search, or finalize the protocol?
 
     Args:
         reflection: Your detailed reflection on protocol progress, findings, gaps, and next steps
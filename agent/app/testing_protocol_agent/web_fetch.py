@@ -0,0 +1,170 @@
+"""Concurrent, cached webpage fetching for the Testing Protocol tools.
+
+- ใช้ httpx.Client ตัวเดียวทั้ง process (connection pool + keep-alive)
+- โหลดหลาย URL พร้อมกันใน thread pool มี deadline รวม ไม่ต้องรอเว็บที่ช้าที่สุด
+  timeout ของ httpx นับต่อการอ่านแต่ละครั้ง จึงตัดเวลารวมใน loop อ่านเองด้วย
+  (หน้าที่ส่งข้อมูลทีละนิดจะไม่ค้าง thread เกิน timeout / deadline)
+- อ่าน response ไม่เกิน WEB_FETCH_MAX_BYTES ต่อหน้า
+- cache ผลที่แปลงเป็น markdown แล้วลงดิสก์ (key = URL) มี TTL
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import httpx
+from markdownify import markdownify
+
+WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "10"))
+WEB_FETCH_DEADLINE = float(os.getenv("WEB_FETCH_DEADLINE", "15"))
+WEB_FETCH_MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+WEB_FETCH_WORKERS = int(os.getenv("WEB_FETCH_WORKERS", "8"))
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", os.path.join(".cache", "pages"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", str(7 * 24 * 3600)))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+_client: Optional[httpx.Client] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_init_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    headers=HEADERS,
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                )
+    return _client
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=WEB_FETCH_WORKERS,
+                    thread_name_prefix="web-fetch",
+                )
+    return _executor
+
+
+# ---------- Disk cache ----------
+
+def _cache_path(url: str) -> str:
+    return os.path.join(PAGE_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def get_cached_page(url: str) -> Optional[str]:
+    """คืน markdown ที่ cache ไว้ ถ้ายังไม่หมดอายุ"""
+    path = _cache_path(url)
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # ไฟล์เสีย / format อื่น ถือว่า miss
+    if not isinstance(entry, dict) or not isinstance(entry.get("content"), str):
+        return None
+    fetched_at = entry.get("fetched_at")
+    if not isinstance(fetched_at, (int, float)) or time.time() - fetched_at > PAGE_CACHE_TTL:
+        return None
+    return entry["content"]
+
+
+def put_cached_page(url: str, content: str):
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    path = _cache_path(url)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "fetched_at": time.time(), "content": content}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# ---------- Fetching ----------
+
+def _download_html(url: str, timeout: float, stop_at: Optional[float] = None) -> str:
+    """
+    โหลดหน้าเว็บ อ่านไม่เกิน WEB_FETCH_MAX_BYTES
+    ใช้เวลารวมไม่เกิน timeout และไม่เกิน stop_at (time.monotonic()) ถ้าระบุ
+    """
+    started = time.monotonic()
+    stop_at = min(stop_at, started + timeout) if stop_at is not None else started + timeout
+    with _get_client().stream("GET", url, timeout=max(0.1, stop_at - started)) as response:
+        response.raise_for_status()
+
+        content_type = response.headers.get("content-type", "")
+        if content_type and "html" not in content_type and not content_type.startswith("text/"):
+            raise ValueError(f"unsupported content type {content_type}")
+
+        chunks: List[bytes] = []
+        size = 0
+        for chunk in response.iter_bytes():
+            if time.monotonic() > stop_at:
+                raise TimeoutError(f"fetch exceeded {stop_at - started:.1f}s")
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= WEB_FETCH_MAX_BYTES:
+                break
+
+        body = b"".join(chunks)[:WEB_FETCH_MAX_BYTES]
+        return body.decode(response.encoding or "utf-8", errors="replace")
+
+
+def fetch_page_markdown(url: str, timeout: float = WEB_FETCH_TIMEOUT, stop_at: Optional[float] = None) -> str:
+    """
+    โหลดหน้าเว็บแล้วแปลงเป็น markdown (ใช้ cache ถ้ามี)
+    error จะคืนเป็นข้อความ (ไม่ cache)
+    """
+    cached = get_cached_page(url)
+    if cached is not None:
+        return cached
+    if stop_at is not None and time.monotonic() >= stop_at:
+        # รอคิว thread pool จนเลย deadline ของ fetch_pages แล้ว
+        return f"Error fetching content from {url}: fetch deadline passed before start"
+
+    try:
+        # แปลง HTML เป็น Markdown เพื่อให้อ่านง่ายและประหยัด Token
+        content = markdownify(_download_html(url, timeout, stop_at))
+    except Exception as e:
+        return f"Error fetching content from {url}: {str(e)}"
+
+    try:
+        put_cached_page(url, content)
+    except OSError as e:
+        print(f"[web_fetch] cannot write page cache for {url}: {e}")
+    return content
+
+
+def fetch_pages(
+    urls: List[str],
+    timeout: float = WEB_FETCH_TIMEOUT,
+    deadline: float = WEB_FETCH_DEADLINE,
+) -> Dict[str, str]:
+    """
+    โหลดหลาย URL พร้อมกัน คืน {url: markdown}
+    หน้าที่ยังไม่เสร็จเมื่อครบ deadline จะได้ข้อความ error แทน (ไม่รอ)
+    """
+    stop_at = time.monotonic() + deadline
+    futures = {url: _get_executor().submit(fetch_page_markdown, url, timeout, stop_at) for url in urls}
+    wait(futures.values(), timeout=deadline)
+
+    results: Dict[str, str] = {}
+    for url, future in futures.items():
+        if future.done():
+            results[url] = future.result()
+        else:
+            future.cancel()
+            results[url] = f"Error fetching content from {url}: exceeded the {deadline:.0f}s fetch deadline"
+    return results
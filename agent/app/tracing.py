@@ -0,0 +1,401 @@
+# tracing.py
+"""
+Tracing + metrics ของ agent run (supervisor, subagent, pipeline)
+
+TraceHandler เป็น LangChain callback ที่แนบไปกับ config ของแต่ละ request แล้วสร้าง span ซ้อนกัน:
+
+    agent.run (endpoint)
+      └─ cost-analysis-agent / detect / synthesize ...   (graph ของ subagent + node ของ pipeline)
+           ├─ chat gemini-2.5-flash                       (token input / output)
+           └─ execute_tool tavily_search / detect_pcb_defects ...
+
+node ภายในของ LangGraph (model, tools, middleware) ไม่ถูกสร้างเป็น span ลูกของมันจะต่อกับ span ที่ใกล้ที่สุดแทน
+attribute ใช้ชื่อตาม OpenTelemetry GenAI semantic conventions (gen_ai.*)
+
+- TRACE_FILE: ถ้าตั้งไว้ เขียน trace ที่จบแล้วลงไฟล์เป็น OTLP/JSON (1 บรรทัด = 1 trace)
+  เปิดดู / ส่งต่อได้ด้วย OpenTelemetry Collector (receiver otlpjsonfile) ไม่ต้องติดตั้ง SDK ใน service
+- TRACE_FILE_MAX_BYTES: ไฟล์ใหญ่เกินนี้ย้ายไปเป็น <TRACE_FILE>.1 แล้วเริ่มไฟล์ใหม่
+
+metrics (รวมทั้ง process) ดูได้ที่ GET /metrics ในรูปแบบ Prometheus text
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACE_FILE = os.getenv("TRACE_FILE") or None
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "pcb-agent-api")
+
+# node ของ image pipeline ที่ต้องการเห็นเป็น span (ดู PCB_supervisor_agent.build_image_pipeline)
+TRACED_NODES = ("detect", "cost", "protocol", "synthesize")
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+# ---------- Metrics ----------
+
+class Metrics:
+    """counter + histogram แบบง่าย ๆ (label เป็น tuple ของ (key, value))"""
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], List[float]] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, text: str):
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Dict[str, str], value: float):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # [count ต่อ bucket..., count รวม, sum]
+            hist = self._histograms.setdefault(key, [0.0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += value
+
+    def render(self, gauges: Optional[Dict[str, Dict[tuple, float]]] = None) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+        described = set()
+
+        def header(name: str):
+            if name in described or name not in self._help:
+                return
+            kind, text = self._help[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        for (name, labels), hist in histograms:
+            header(name)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {hist[i]:g}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-2]:g}")
+            lines.append(f"{name}_count{_labels(labels)} {hist[-2]:g}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist[-1]:.6f}")
+        for name, series in (gauges or {}).items():
+            header(name)
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+metrics = Metrics()
+metrics.describe("agent_requests_total", "counter", "Agent runs by endpoint group and status")
+metrics.describe("agent_request_duration_seconds", "histogram", "Agent run duration by endpoint group")
+metrics.describe("agent_llm_calls_total", "counter", "LLM calls by agent, model and status")
+metrics.describe("agent_llm_call_duration_seconds", "histogram", "LLM call duration by agent and model")
+metrics.describe("agent_llm_tokens_total", "counter", "LLM tokens by agent, model and type (input/output)")
+metrics.describe("agent_tool_calls_total", "counter", "Tool calls by tool, agent and status")
+metrics.describe("agent_tool_call_duration_seconds", "histogram", "Tool call duration by tool")
+metrics.describe("agent_runner_running", "gauge", "Agent runs in progress per queue")
+metrics.describe("agent_runner_waiting", "gauge", "Agent runs waiting for a slot per queue")
+metrics.describe("agent_runner_rejected_total", "counter", "Agent runs rejected by admission control per queue")
+metrics.describe("agent_llm_in_flight", "gauge", "LLM calls in flight (LLM_MAX_CONCURRENCY budget)")
+
+
+# ---------- Spans ----------
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str]
+    start_ns: int
+    kind: str = "internal"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    end_ns: Optional[int] = None
+    error: Optional[str] = None
+
+    def end(self, error: Optional[str] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = error
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            # 1 = INTERNAL, 3 = CLIENT (เรียก service ภายนอก: Gemini / tool)
+            "kind": 3 if self.kind == "client" else 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class SpanFileExporter:
+    """เขียน trace เป็น OTLP/JSON ต่อท้ายไฟล์ (หมุนไฟล์เมื่อเกิน max_bytes)"""
+
+    def __init__(self, path: str, max_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "pcb-agent-api.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.max_bytes > 0 and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+exporter: Optional[SpanFileExporter] = SpanFileExporter(TRACE_FILE) if TRACE_FILE else None
+
+
+# ---------- LangChain callback ----------
+
+class TraceHandler(BaseCallbackHandler):
+    """
+    callback ต่อ 1 request: เก็บ span ทั้งหมดของ run แล้ว export ตอน finish()
+    """
+
+    run_inline = True
+
+    def __init__(self, name: str, agent: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(
+            name=f"agent.run {name}",
+            trace_id=self.trace_id,
+            span_id=secrets.token_hex(8),
+            parent_span_id=None,
+            start_ns=time.time_ns(),
+            attributes={"agent.endpoint": name, "gen_ai.agent.name": agent, **(attributes or {})},
+        )
+        self.endpoint = name
+        self._spans: List[Span] = [self.root]
+        # run_id ของ LangChain -> span (เฉพาะ run ที่สร้าง span)
+        self._runs: Dict[UUID, Span] = {}
+        # run_id ที่ไม่ได้สร้าง span -> span ที่ลูกของมันต้องต่อด้วย
+        self._passthrough: Dict[UUID, Span] = {}
+        self._lock = threading.Lock()
+
+    # --- helpers ---
+
+    def _parent(self, parent_run_id: Optional[UUID]) -> Span:
+        if parent_run_id is None:
+            return self.root
+        return self._runs.get(parent_run_id) or self._passthrough.get(parent_run_id) or self.root
+
+    def _agent_name(self, span: Span) -> str:
+        return span.attributes.get("gen_ai.agent.name") or self.root.attributes["gen_ai.agent.name"]
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: str, attributes: Dict[str, Any]) -> Span:
+        with self._lock:
+            parent = self._parent(parent_run_id)
+            attributes.setdefault("gen_ai.agent.name", self._agent_name(parent))
+            span = Span(
+                name=name,
+                trace_id=self.trace_id,
+                span_id=secrets.token_hex(8),
+                parent_span_id=parent.span_id,
+                start_ns=time.time_ns(),
+                kind=kind,
+                attributes=attributes,
+            )
+            self._spans.append(span)
+            self._runs[run_id] = span
+            return span
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Span]:
+        with self._lock:
+            span = self._runs.pop(run_id, None)
+            self._passthrough.pop(run_id, None)
+        if span is not None:
+            span.end(f"{type(error).__name__}: {error}" if error is not None else None)
+        return span
+
+    # --- chains (graph / node) ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs):
+        metadata = metadata or {}
+        name = name or (serialized or {}).get("name") or "chain"
+        is_agent = name == metadata.get("lc_agent_name")
+        is_node = name in TRACED_NODES and metadata.get("langgraph_node") == name
+        if is_agent or is_node:
+            attributes = {"gen_ai.agent.name": name} if is_agent else {"langgraph.node": name}
+            self._start(run_id, parent_run_id, name, "internal", attributes)
+            return
+        with self._lock:
+            self._passthrough[run_id] = self._parent(parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    # --- LLM ---
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or ((serialized or {}).get("kwargs") or {}).get("model") or "unknown"
+        self._start(
+            run_id,
+            parent_run_id,
+            f"chat {model}",
+            "client",
+            {
+                "gen_ai.operation.name": "chat",
+                "gen_ai.request.model": model,
+                "gen_ai.system": metadata.get("ls_provider"),
+                "gen_ai.request.message_count": sum(len(batch) for batch in messages),
+            },
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._end(run_id)
+        if span is None:
+            return
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        span.attributes["gen_ai.usage.input_tokens"] = input_tokens
+        span.attributes["gen_ai.usage.output_tokens"] = output_tokens
+
+        labels = {"agent": self._agent_name(span), "model": span.attributes["gen_ai.request.model"]}
+        metrics.inc("agent_llm_calls_total", {**labels, "status": "ok"})
+        metrics.observe("agent_llm_call_duration_seconds", labels, span.seconds)
+        metrics.inc("agent_llm_tokens_total", {**labels, "type": "input"}, input_tokens)
+        metrics.inc("agent_llm_tokens_total", {**labels, "type": "output"}, output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._end(run_id, error)
+        if span is not None:
+            labels = {"agent": self._agent_name(span), "model": span.attributes["gen_ai.request.model"]}
+            metrics.inc("agent_llm_calls_total", {**labels, "status": "error"})
+
+    # --- tools ---
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, name=None, **kwargs):
+        tool = name or (serialized or {}).get("name") or "tool"
+        self._start(
+            run_id,
+            parent_run_id,
+            f"execute_tool {tool}",
+            "client",
+            {
+                "gen_ai.operation.name": "execute_tool",
+                "gen_ai.tool.name": tool,
+                "tool.input_chars": len(input_str or ""),
+            },
+        )
+
+    def _tool_done(self, run_id: UUID, error: Optional[BaseException] = None, output: Any = None):
+        span = self._end(run_id, error)
+        if span is None:
+            return
+        tool = span.attributes["gen_ai.tool.name"]
+        if output is not None:
+            content = getattr(output, "content", output)
+            span.attributes["tool.output_chars"] = len(content if isinstance(content, str) else str(content))
+        status = "error" if error is not None else "ok"
+        metrics.inc("agent_tool_calls_total", {"tool": tool, "agent": self._agent_name(span), "status": status})
+        metrics.observe("agent_tool_call_duration_seconds", {"tool": tool}, span.seconds)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._tool_done(run_id, output=output)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._tool_done(run_id, error=error)
+
+    # --- trace ---
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.root.end(f"{type(error).__name__}: {error}" if error is not None else None)
+        status = "ok" if error is None else type(error).__name__
+        metrics.inc("agent_requests_total", {"endpoint": self.endpoint, "status": status})
+        metrics.observe("agent_request_duration_seconds", {"endpoint": self.endpoint}, self.root.seconds)
+        if exporter is not None:
+            # span ที่ยังไม่จบ (เช่น request ถูกยกเลิกกลางทาง) ปิดที่เวลาเดียวกับ root
+            for span in self._spans:
+                if span.end_ns is None:
+                    span.end_ns = self.root.end_ns
+            try:
+                exporter.export(self._spans)
+            except OSError as e:
+                print(f"[tracing] cannot write {exporter.path}: {e}")
+
+
+@contextmanager
+def trace_run(name: str, agent: str, attributes: Optional[Dict[str, Any]] = None) -> Iterator[TraceHandler]:
+    """
+    with trace_run("chat", "supervisor", {"session.id": ...}) as handler:
+        await graph.ainvoke(payload, config={"callbacks": [handler]})
+    """
+    handler = TraceHandler(name, agent, attributes)
+    try:
+        yield handler
+    except BaseException as e:
+        handler.finish(e)
+        raise
+    handler.finish()
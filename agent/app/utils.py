@@ -9,6 +9,18 @@ from rich.text import Text
 console = Console()
 
 
+def content_to_text(content):
+    """Join message/chunk content (str or list of {"type": "text", ...} blocks) into plain text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return str(content or "")
+
+
 def format_message_content(message):
     """Convert message content to displayable string."""
     parts = []
@@ -0,0 +1,172 @@
+# workspaces.py
+"""
+Workspace แยกต่อ request ของ /analyze-image
+
+    <WORKSPACE_ROOT>/<workspace_id>/
+        input/          รูปที่อัปโหลด (ชื่อไฟล์ซ้ำกันข้าม request ได้ ไม่ทับกัน)
+        artifacts/      ไฟล์ local ของ detection (ถ้าเปิด DEFECT_DEBUG_DIR)
+        manifest.json   input + ผล detection (artifact_id, URL รูป annotated / crop, ไฟล์ local)
+
+response ของ request อ่าน artifact จาก manifest ของ workspace ตัวเองเท่านั้น
+ไม่ต้อง glob โฟลเดอร์รวม เวลาตอบจึงไม่โตตามจำนวนรูปที่เคยประมวลผล
+
+- WORKSPACE_RETENTION: ลบ workspace ที่ไม่มีการเขียนไฟล์นานกว่านี้ (วินาที)
+- WORKSPACE_SWEEP_INTERVAL: รอบการลบ (วินาที) ใน background
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "workspaces")
+WORKSPACE_RETENTION = float(os.getenv("WORKSPACE_RETENTION", str(24 * 3600)))
+WORKSPACE_SWEEP_INTERVAL = float(os.getenv("WORKSPACE_SWEEP_INTERVAL", "900"))
+
+MANIFEST_NAME = "manifest.json"
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_manifest_lock = threading.Lock()
+
+
+@dataclass
+class Workspace:
+    id: str
+    path: str
+
+    @property
+    def input_dir(self) -> str:
+        return os.path.join(self.path, "input")
+
+    @property
+    def artifacts_dir(self) -> str:
+        return os.path.join(self.path, "artifacts")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+
+def safe_filename(name: Optional[str]) -> str:
+    # เอาแค่ชื่อไฟล์ (กัน ../) และตัดตัวอักษรแปลก ๆ ออก
+    name = os.path.basename(name or "") or "image.png"
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).lstrip(".")
+    return name or "image.png"
+
+
+def _write_manifest(workspace: Workspace, manifest: Dict[str, Any]):
+    tmp_path = workspace.manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, workspace.manifest_path)
+
+
+def create_workspace(root: str = WORKSPACE_ROOT) -> Workspace:
+    workspace_id = uuid.uuid4().hex
+    workspace = Workspace(workspace_id, os.path.join(root, workspace_id))
+    os.makedirs(workspace.input_dir)
+    os.makedirs(workspace.artifacts_dir)
+    _write_manifest(workspace, {"id": workspace_id, "created_at": time.time(), "inputs": [], "detections": []})
+    return workspace
+
+
+def get_workspace(workspace_id: str, root: str = WORKSPACE_ROOT) -> Optional[Workspace]:
+    if not _ID_RE.match(workspace_id or ""):
+        return None
+    workspace = Workspace(workspace_id, os.path.join(root, workspace_id))
+    return workspace if os.path.exists(workspace.manifest_path) else None
+
+
+def workspace_for_path(path: str, root: str = WORKSPACE_ROOT) -> Optional[Workspace]:
+    """
+    หา workspace จาก path ของรูป input (<root>/<id>/input/<file>) / None ถ้าไม่ได้อยู่ใน workspace
+    """
+    input_dir = os.path.dirname(os.path.abspath(path))
+    workspace_dir = os.path.dirname(input_dir)
+    if os.path.basename(input_dir) != "input":
+        return None
+    if os.path.dirname(workspace_dir) != os.path.abspath(root):
+        return None
+    return get_workspace(os.path.basename(workspace_dir), root)
+
+
+def read_manifest(workspace: Workspace) -> Dict[str, Any]:
+    with open(workspace.manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _update_manifest(workspace: Workspace, key: str, entry: Dict[str, Any]):
+    with _manifest_lock:
+        manifest = read_manifest(workspace)
+        manifest.setdefault(key, []).append(entry)
+        _write_manifest(workspace, manifest)
+
+
+def save_input(workspace: Workspace, filename: Optional[str], fileobj) -> str:
+    """copy ไฟล์ที่อัปโหลดลง input/ ของ workspace คืน path"""
+    input_path = os.path.join(workspace.input_dir, safe_filename(filename))
+    with open(input_path, "wb") as f:
+        shutil.copyfileobj(fileobj, f)
+    _update_manifest(workspace, "inputs", {"path": input_path, "original_filename": filename})
+    return input_path
+
+
+def record_detection(workspace: Workspace, image_path: str, payload: Dict[str, Any]):
+    """บันทึกผล detection (artifact_id + URL + ไฟล์ local ใน artifacts/) ลง manifest"""
+    main_image = payload.get("main_image") or {}
+    crops = payload.get("crops") or []
+    files = sorted(
+        os.path.join(workspace.artifacts_dir, name) for name in os.listdir(workspace.artifacts_dir)
+    )
+    _update_manifest(
+        workspace,
+        "detections",
+        {
+            "image": image_path,
+            "artifact_id": main_image.get("id"),
+            "main_image_url": main_image.get("public_url"),
+            "crop_urls": [c["crop_public_url"] for c in crops if c.get("crop_public_url")],
+            "files": files,
+            "created_at": time.time(),
+        },
+    )
+
+
+def list_artifacts(workspace: Workspace) -> List[str]:
+    """
+    artifact ของ request นี้: ไฟล์ local ถ้ามี ไม่งั้น URL ของรูป annotated + crop
+    """
+    artifacts: List[str] = []
+    for detection in read_manifest(workspace).get("detections", []):
+        if detection.get("files"):
+            artifacts.extend(detection["files"])
+            continue
+        if detection.get("main_image_url"):
+            artifacts.append(detection["main_image_url"])
+        artifacts.extend(detection.get("crop_urls") or [])
+    return list(dict.fromkeys(artifacts))
+
+
+def sweep(root: str = WORKSPACE_ROOT, retention: float = WORKSPACE_RETENTION) -> int:
+    """ลบ workspace ที่ไม่ถูกแก้ไขนานกว่า retention (ดูจาก mtime ของโฟลเดอร์) คืนจำนวนที่ลบ"""
+    if retention <= 0 or not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - retention
+    removed = 0
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if not entry.is_dir() or not _ID_RE.match(entry.name):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path)
+                    removed += 1
+            except OSError as e:
+                print(f"[workspaces] cannot remove {entry.path}: {e}")
+    if removed:
+        print(f"[workspaces] removed {removed} expired workspace(s)")
+    return removed
@@ -0,0 +1,86 @@
+"""Cold start of pcb-agent-api: import time / first response / ready.
+
+รันแต่ละรอบใน process ใหม่ (เหมือน container เพิ่ง start) แล้ววัด
+    import      เวลา `import main`
+    first /     ตั้งแต่เริ่ม import จนตอบ GET / ได้ (ผ่าน lifespan แล้ว)
+    ready       ตั้งแต่เริ่ม import จน GET / ตอบ ready=true (สร้าง agent + เปิด session DB เสร็จ)
+
+ไม่ต่อ network (สร้าง client เฉย ๆ ไม่ได้เรียก Gemini / Tavily) ใช้ key ปลอมได้:
+    python benchmarks/cold_start.py --repeat 5
+    python benchmarks/cold_start.py --max-seconds 1.0   # exit 1 ถ้า first / ช้ากว่านี้ (ใช้ใน CI)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+
+# รันใน process ลูก: พิมพ์ผลเป็น JSON บรรทัดสุดท้าย
+PROBE = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/").raise_for_status()
+    first = time.perf_counter()
+    ready = None
+    if {wait_ready}:
+        while not client.get("/").json().get("ready"):
+            time.sleep(0.01)
+        ready = time.perf_counter() - started
+print(json.dumps({{"import": imported - started, "first": first - started, "ready": ready}}))
+"""
+
+
+def run_once(wait_ready: bool, workdir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "benchmark")
+    env.setdefault("TAVILY_API_KEY", "benchmark")
+    env["SESSION_DB_PATH"] = os.path.join(workdir, "sessions.sqlite")
+    env["WORKSPACE_ROOT"] = os.path.join(workdir, "workspaces")
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(wait_ready=wait_ready)],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-ready", action="store_true", help="ไม่รอ warm-up (วัดแค่ import / first /)")
+    parser.add_argument("--max-seconds", type=float, default=None, help="threshold ของ first / (p50)")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for i in range(args.repeat):
+            row = run_once(not args.no_ready, workdir)
+            rows.append(row)
+            ready = f"{row['ready']:.2f}s" if row["ready"] is not None else "-"
+            print(f"[{i + 1}] import {row['import']:.2f}s, first / {row['first']:.2f}s, ready {ready}")
+
+    first_p50 = statistics.median(r["first"] for r in rows)
+    print(f"\np50: import {statistics.median(r['import'] for r in rows):.2f}s, first / {first_p50:.2f}s", end="")
+    if not args.no_ready:
+        print(f", ready {statistics.median(r['ready'] for r in rows):.2f}s", end="")
+    print()
+
+    if args.max_seconds is not None and first_p50 > args.max_seconds:
+        print(f"FAIL: first / p50 {first_p50:.2f}s > {args.max_seconds:.2f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
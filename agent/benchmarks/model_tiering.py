@@ -0,0 +1,168 @@
+"""Latency / token usage / answer quality per model profile configuration (see app/models.py).
+
+รัน scenario ชุดเดียวกับ orchestration.py แบบ live กับแต่ละ config แล้วเทียบ
+- เวลา (p50), จำนวน LLM call, token เข้า / ออก
+- คุณภาพเทียบกับคำตอบของ config แรก (baseline):
+  score = LLM judge ให้คะแนน 1-5 (ถูกต้อง / ครบถ้วนเมื่อเทียบกับคำตอบ baseline)
+  figures = สัดส่วนตัวเลขในคำตอบ baseline ที่คำตอบนี้ยังมีอยู่ (ต้นทุน, จำนวน defect, ...)
+  รอบที่ 2+ ของ baseline ก็ถูกให้คะแนนด้วย ใช้ดูว่าคะแนนแกว่งเองแค่ไหน
+
+config ในตัว: uniform (ทุก agent ใช้ AGENT_MODEL แบบเดิม), tiered (DEFAULT_PROFILES + MODEL_PROFILES),
+all-fast (ทุก agent ใช้ FAST_AGENT_MODEL ไม่มี thinking) / เพิ่มเองได้ด้วย --config name=profiles.json
+
+ต้องมี GOOGLE_API_KEY, TAVILY_API_KEY และ pcb-api รันอยู่ (PCB_API_URL):
+    python benchmarks/model_tiering.py --image path/to/board.jpg --repeat 2
+    python benchmarks/model_tiering.py --configs uniform,tiered --config lite-protocol=lite.json --json tiering.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+from typing import Any, Dict, List, Optional
+
+from orchestration import SCENARIOS, _build_graphs, run_session
+
+JUDGE_PROMPT = """You are grading an assistant's answer for a PCB quality / cost analysis system.
+Compare the CANDIDATE answer with the REFERENCE answer to the same conversation.
+Score 1-5: 5 = same facts, figures and recommendations; 3 = main conclusion right but missing or
+changed details; 1 = wrong or unusable. Differences in wording or formatting do not matter.
+Reply with JSON only: {"score": <1-5>, "reason": "<one sentence>"}"""
+
+
+def builtin_configs() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    from models import AGENT_MODEL, FAST_AGENT_MODEL, load_profiles
+
+    return {
+        "uniform": {"default": {"model": AGENT_MODEL, "temperature": 0.0}},
+        "tiered": load_profiles(),
+        "all-fast": {"default": {"model": FAST_AGENT_MODEL, "temperature": 0.0, "thinking_budget": 0}},
+    }
+
+
+def figures_kept(reference: str, candidate: str) -> Optional[float]:
+    """สัดส่วนตัวเลข (2 หลักขึ้นไป) ในคำตอบ reference ที่อยู่ในคำตอบ candidate ด้วย"""
+    def numbers(text: str) -> set:
+        return {n.replace(",", "").rstrip(".") for n in re.findall(r"\d[\d,]*\.?\d*", text) if len(n) >= 2}
+
+    expected = numbers(reference)
+    if not expected:
+        return None
+    return len(expected & numbers(candidate)) / len(expected)
+
+
+async def judge(turns: List[str], reference: str, candidate: str, judge_model: str) -> Optional[int]:
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    from models import get_chat_model
+    from utils import content_to_text
+
+    conversation = "\n".join(f"USER: {turn}" for turn in turns)
+    response = await get_chat_model(judge_model).ainvoke([
+        SystemMessage(JUDGE_PROMPT),
+        HumanMessage(f"{conversation}\n\nREFERENCE:\n{reference}\n\nCANDIDATE:\n{candidate}"),
+    ])
+    match = re.search(r'"score"\s*:\s*([1-5])', content_to_text(response.content))
+    return int(match.group(1)) if match else None
+
+
+async def run_config(name: str, profiles, scenarios: List[str], image: Optional[str], repeat: int):
+    from admission import current_endpoint
+    from models import set_profiles
+
+    set_profiles(profiles)
+    graphs = _build_graphs()
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    for scenario_name in scenarios:
+        scenario = SCENARIOS[scenario_name]
+        meta = {
+            "mode": scenario["mode"],
+            "turns": [turn.format(image=image) for turn in scenario["turns"]],
+            "image": image,
+        }
+        # profile "<endpoint>:<agent>" เหมือนตอนเรียกผ่าน API
+        current_endpoint.set("image" if scenario.get("image") else "chat")
+        rows = results.setdefault(scenario_name, [])
+        for _ in range(repeat):
+            row = await run_session(graphs, meta)
+            row["turns"] = meta["turns"]
+            rows.append(row)
+            print(f"[{name}/{scenario_name}] {row['seconds']:.2f}s, {row['llm_calls']} calls, "
+                  f"{row['input_tokens']}+{row['output_tokens']} tokens")
+    return results
+
+
+async def score(results, judge_model: str):
+    """ให้คะแนนทุกรอบเทียบกับรอบแรกของ config แรก (baseline)"""
+    baseline = next(iter(results.values()))
+    for scenario_name, reference_rows in baseline.items():
+        reference = reference_rows[0]["reply"]
+        for rows in results.values():
+            for row in rows.get(scenario_name, []):
+                if row is reference_rows[0]:
+                    continue
+                row["figures"] = figures_kept(reference, row["reply"])
+                row["score"] = await judge(row["turns"], reference, row["reply"], judge_model)
+
+
+def _mean(rows: List[Dict[str, Any]], key: str) -> str:
+    values = [r[key] for r in rows if r.get(key) is not None]
+    if not values:
+        return f"{'-':>8}"
+    if key == "seconds":
+        return f"{statistics.median(values):8.2f}"
+    if key in ("score", "figures"):
+        return f"{statistics.mean(values):8.2f}"
+    return f"{statistics.mean(values):8.0f}"
+
+
+async def main():
+    from models import AGENT_MODEL
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", help="board image (image scenarios are skipped without it)")
+    parser.add_argument("--configs", default="uniform,tiered,all-fast", help="built-in configs; first = baseline")
+    parser.add_argument("--config", action="append", default=[], metavar="NAME=PATH",
+                        help="extra config from a MODEL_PROFILES JSON file (repeatable)")
+    parser.add_argument("--scenarios", help=f"comma separated (default: all of {','.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--judge-model", default=AGENT_MODEL)
+    parser.add_argument("--json", help="write per-run results (including replies) to this file")
+    args = parser.parse_args()
+
+    from models import load_profiles
+
+    available = builtin_configs()
+    configs = {}
+    for name in filter(None, args.configs.split(",")):
+        if name not in available:
+            parser.error(f"unknown config {name!r} (built-in: {', '.join(available)})")
+        configs[name] = available[name]
+    for item in args.config:
+        name, _, path = item.partition("=")
+        configs[name] = load_profiles(path)
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    if not args.image:
+        names = [name for name in names if not SCENARIOS[name].get("image")]
+    image = os.path.abspath(args.image) if args.image else None
+
+    results = {name: await run_config(name, profiles, names, image, args.repeat) for name, profiles in configs.items()}
+    await score(results, args.judge_model)
+
+    keys = ("seconds", "llm_calls", "input_tokens", "output_tokens", "score", "figures")
+    print(f"\nbaseline = {next(iter(configs))}, {args.repeat} repeat(s), judge {args.judge_model}")
+    print(f"{'config':<14}{'scenario':<18}{'p50 s':>8}{'calls':>8}{'in tok':>8}{'out tok':>8}{'score':>8}{'figures':>8}")
+    for config_name, scenarios in results.items():
+        for scenario_name, rows in scenarios.items():
+            print(f"{config_name:<14}{scenario_name:<18}" + "".join(_mean(rows, key) for key in keys))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"configs": configs, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"results -> {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""Offline orchestration benchmark: replay recorded LLM / tool responses through the real agents.
+
+แต่ละ scenario บันทึก session จริงครั้งเดียวลง benchmarks/cassettes/<scenario>.json (ดู app/cassettes.py)
+จากนั้น replay ผ่าน supervisor (create_deep_agent) + subagent + pipeline ตัวจริงได้ไม่จำกัดรอบ
+โดยไม่ต่อ network แล้วรายงานเวลา จำนวน LLM call / token / tool call ต่อ scenario
+ใช้เทียบผลของการแก้ orchestration (prompt, middleware, fan-out, context budget) แบบ deterministic
+
+record (ต้องมี GOOGLE_API_KEY, TAVILY_API_KEY และ pcb-api รันอยู่):
+    python benchmarks/orchestration.py --record --image path/to/board.jpg
+replay:
+    python benchmarks/orchestration.py --repeat 5
+    python benchmarks/orchestration.py --latency-scale 0 --json after.json   # วัดเฉพาะ overhead ของ orchestration
+
+latency ตอน replay = เวลาที่บันทึกไว้ x --latency-scale หรือค่าคงที่ --llm-latency / --tool-latency
+ถ้า "fallback" ไม่เป็น 0 แปลว่า request ที่ส่งให้ model ต่างจากตอนบันทึก (response ถูกจับคู่ตามลำดับแทน)
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from pipeline_vs_supervisor import APP_DIR, BENCH_DIR, UsageCounter  # noqa: F401 (ตั้ง sys.path + ปิด LLM cache)
+
+CASSETTE_DIR = os.path.join(BENCH_DIR, "cassettes")
+
+IMAGE_PROMPT = "Analyze the PCB image located at: {image}"
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "chat-standards": {
+        "mode": "supervisor",
+        "turns": ["Which IPC-A-610 class applies to automotive control boards, and how should we test them?"],
+    },
+    "image-supervisor": {"mode": "supervisor", "image": True, "turns": [IMAGE_PROMPT]},
+    "image-pipeline": {"mode": "pipeline", "image": True, "turns": [IMAGE_PROMPT]},
+    "image-followup": {
+        "mode": "supervisor",
+        "image": True,
+        "turns": [IMAGE_PROMPT, "What would these defects cost us on a batch of 5,000 boards?"],
+    },
+}
+
+
+class OrchestrationCounter(UsageCounter):
+    """UsageCounter + จำนวน tool call (รวม task() ของ supervisor)"""
+
+    def __init__(self):
+        super().__init__()
+        self.tool_calls = 0
+
+    def on_tool_start(self, serialized, input_str, **kwargs: Any):
+        self.tool_calls += 1
+
+
+def _build_graphs() -> Dict[str, Any]:
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from PCB_supervisor_agent import build_image_pipeline, build_supervisor_agent
+
+    # checkpointer ใน memory ให้ scenario หลาย turn ต่อบทสนทนาเดิมได้ (thread_id ใหม่ทุกรอบ)
+    return {"supervisor": build_supervisor_agent(checkpointer=InMemorySaver()), "pipeline": build_image_pipeline()}
+
+
+async def run_session(graphs: Dict[str, Any], meta: Dict[str, Any]) -> Dict[str, Any]:
+    counter = OrchestrationCounter()
+    config = {"callbacks": [counter], "configurable": {"thread_id": str(uuid.uuid4())}}
+    from utils import content_to_text
+
+    started = time.perf_counter()
+    for turn in meta["turns"]:
+        payload: Dict[str, Any] = {"messages": [{"role": "user", "content": turn}]}
+        if meta["mode"] == "pipeline":
+            payload["image_path"] = meta["image"]
+        result = await graphs[meta["mode"]].ainvoke(payload, config=config)
+    return {
+        "seconds": time.perf_counter() - started,
+        "llm_calls": counter.calls,
+        "input_tokens": counter.input_tokens,
+        "output_tokens": counter.output_tokens,
+        "tool_calls": counter.tool_calls,
+        "reply": content_to_text(result["messages"][-1].content),
+    }
+
+
+async def record(names: List[str], image: str):
+    import cassettes
+    from models import AGENT_MODEL
+
+    cassettes.configure("record")
+    graphs = _build_graphs()
+    for name in names:
+        scenario = SCENARIOS[name]
+        if scenario.get("image") and not image:
+            print(f"[{name}] skipped (needs --image)")
+            continue
+        cassette = cassettes.Cassette(os.path.join(CASSETTE_DIR, f"{name}.json"))
+        cassette.meta = {
+            "scenario": name,
+            "mode": scenario["mode"],
+            "turns": [turn.format(image=image) for turn in scenario["turns"]],
+            "image": image,
+            "model": AGENT_MODEL,
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        cassettes.configure("record", cassette)
+        row = await run_session(graphs, cassette.meta)
+        cassette.save()
+        print(f"[{name}] recorded {len(cassette.llm)} LLM / {len(cassette.tools)} tool responses "
+              f"in {row['seconds']:.2f}s -> {cassette.path}")
+
+
+async def replay(names: List[str], repeat: int, latency) -> Dict[str, List[Dict[str, float]]]:
+    import cassettes
+
+    cassettes.configure("replay", latency=latency)
+    graphs = _build_graphs()
+    results: Dict[str, List[Dict[str, float]]] = {}
+    for name in names:
+        path = os.path.join(CASSETTE_DIR, f"{name}.json")
+        if not os.path.exists(path):
+            print(f"[{name}] no cassette (run with --record first)")
+            continue
+        rows = results.setdefault(name, [])
+        for _ in range(repeat):
+            # โหลดใหม่ทุกรอบ (entry ที่ใช้แล้วจะไม่ถูกใช้ซ้ำภายในรอบเดียวกัน)
+            cassette = cassettes.Cassette.load(path)
+            cassettes.configure("replay", cassette, latency)
+            try:
+                row = await run_session(graphs, cassette.meta)
+            except cassettes.CassetteMissError as e:
+                print(f"[{name}] replay failed: {e}")
+                break
+            row["fallback"] = cassette.stats["fallback"]
+            rows.append(row)
+            print(f"[{name}] {row['seconds']:.2f}s, {row['llm_calls']} calls, "
+                  f"{row['input_tokens']}+{row['output_tokens']} tokens, {row['tool_calls']} tools, "
+                  f"{row['fallback']} fallback")
+    return results
+
+
+def _summary(rows: List[Dict[str, float]], key: str) -> str:
+    values = [r[key] for r in rows]
+    if key == "seconds":
+        return f"{statistics.median(values):8.2f}"
+    return f"{statistics.mean(values):8.0f}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="run live and write cassettes")
+    parser.add_argument("--image", help="board image for image scenarios (record only)")
+    parser.add_argument("--scenarios", help=f"comma separated (default: all of {','.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="x recorded latency (0 = no waiting)")
+    parser.add_argument("--llm-latency", type=float, help="fixed seconds per LLM call")
+    parser.add_argument("--tool-latency", type=float, help="fixed seconds per tool call")
+    parser.add_argument("--json", help="write per-run results to this file")
+    args = parser.parse_args()
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    if args.record:
+        await record(names, os.path.abspath(args.image) if args.image else None)
+        return
+
+    import cassettes
+
+    latency = cassettes.Latency(args.latency_scale, llm=args.llm_latency, tool=args.tool_latency)
+    results = await replay(names, args.repeat, latency)
+    if not results:
+        print(f"No cassettes in {CASSETTE_DIR}")
+        return
+
+    keys = ("seconds", "llm_calls", "input_tokens", "output_tokens", "tool_calls", "fallback")
+    print(f"\nreplay x {args.repeat} (latency scale {args.latency_scale:g}"
+          f", llm {args.llm_latency}, tool {args.tool_latency})")
+    print(f"{'scenario':<18}{'p50 s':>8}{'calls':>8}{'in tok':>8}{'out tok':>8}{'tools':>8}{'fallbk':>8}")
+    for name, rows in results.items():
+        if rows:
+            print(f"{name:<18}" + "".join(_summary(rows, key) for key in keys))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latency": vars(latency), "repeat": args.repeat, "scenarios": results}, f, indent=2)
+        print(f"results -> {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
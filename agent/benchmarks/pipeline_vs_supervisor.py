@@ -0,0 +1,108 @@
+"""Latency / token usage of /analyze-image: deterministic pipeline vs LLM supervisor.
+
+รันรูปชุดเดียวกันผ่านทั้งสองโหมด แล้วเทียบเวลา จำนวน LLM call และ token
+(ปิด LLM cache ระหว่างวัด ไม่งั้นรอบหลัง ๆ จะไม่ได้เรียก Gemini จริง)
+
+ต้องมี GOOGLE_API_KEY, TAVILY_API_KEY และ pcb-api รันอยู่ (PCB_API_URL):
+    python benchmarks/pipeline_vs_supervisor.py path/to/benchmark_images --repeat 2
+"""
+import argparse
+import asyncio
+import glob
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+
+sys.path.insert(0, APP_DIR)
+os.environ["LLM_CACHE_ENABLED"] = "0"
+
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+
+
+class UsageCounter(BaseCallbackHandler):
+    """นับจำนวน LLM call + token จาก usage_metadata ของทุก model ใน run (รวม subagent)"""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def on_llm_end(self, response, **kwargs: Any):
+        self.calls += 1
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+
+
+async def run_once(mode: str, image_path: str) -> Dict[str, float]:
+    from PCB_supervisor_agent import get_agent, get_image_pipeline
+
+    user_input = f"Analyze the PCB image located at: {image_path}"
+    payload: Dict[str, Any] = {"messages": [{"role": "user", "content": user_input}]}
+    graph = get_agent()
+    if mode == "pipeline":
+        graph = get_image_pipeline()
+        payload["image_path"] = image_path
+
+    counter = UsageCounter()
+    started = time.perf_counter()
+    await graph.ainvoke(payload, config={"callbacks": [counter]})
+    return {
+        "seconds": time.perf_counter() - started,
+        "llm_calls": counter.calls,
+        "input_tokens": counter.input_tokens,
+        "output_tokens": counter.output_tokens,
+    }
+
+
+def _summary(rows: List[Dict[str, float]], key: str) -> str:
+    values = [r[key] for r in rows]
+    if key == "seconds":
+        return f"{statistics.median(values):8.2f}"
+    return f"{statistics.mean(values):8.0f}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images_dir")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--modes", default="supervisor,pipeline")
+    args = parser.parse_args()
+
+    paths = sorted(
+        glob.glob(os.path.join(args.images_dir, "*.jpg")) + glob.glob(os.path.join(args.images_dir, "*.png"))
+    )
+    if not paths:
+        print(f"No images in {args.images_dir}")
+        return
+
+    results: Dict[str, List[Dict[str, float]]] = {}
+    for mode in args.modes.split(","):
+        rows = results.setdefault(mode, [])
+        for _ in range(args.repeat):
+            for path in paths:
+                row = await run_once(mode, path)
+                rows.append(row)
+                print(f"[{mode}] {os.path.basename(path)}: {row['seconds']:.2f}s, "
+                      f"{row['llm_calls']} calls, {row['input_tokens']}+{row['output_tokens']} tokens")
+
+    print(f"\n{len(paths)} images x {args.repeat} repeat(s)")
+    print(f"{'mode':<12}{'p50 s':>8}{'calls':>8}{'in tok':>8}{'out tok':>8}")
+    for mode, rows in results.items():
+        print(
+            f"{mode:<12}"
+            + "".join(_summary(rows, key) for key in ("seconds", "llm_calls", "input_tokens", "output_tokens"))
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
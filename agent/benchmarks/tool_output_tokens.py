@@ -0,0 +1,90 @@
+"""Token usage of detect_pcb_defects output: Markdown vs compact JSON.
+
+ใช้ชุดรูป benchmark ที่ record ผลจาก pcb-api ไว้แล้ว (ไม่ต้องต่อ network ตอนวัด)
+
+Record (ต้องมี pcb-api รันอยู่):
+    python benchmarks/tool_output_tokens.py --record path/to/benchmark_images
+
+วัดผล:
+    python benchmarks/tool_output_tokens.py
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+RECORDINGS_DIR = os.path.join(BENCH_DIR, "recordings", "detections")
+
+sys.path.insert(0, APP_DIR)
+
+from defect_analysis_agent.report import format_compact_summary, format_markdown_summary  # noqa: E402
+
+
+def _token_counter():
+    """
+    ใช้ tiktoken ถ้ามี (cl100k_base ใกล้เคียง tokenizer ของ LLM ส่วนใหญ่)
+    ไม่งั้นประมาณ 4 ตัวอักษร / token
+    """
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken/cl100k_base", lambda text: len(enc.encode(text))
+    except ImportError:
+        return "approx(chars/4)", lambda text: (len(text) + 3) // 4
+
+
+def record(images_dir: str):
+    from defect_analysis_agent.pcb_api_client import detect_image
+
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    paths = sorted(
+        glob.glob(os.path.join(images_dir, "*.jpg")) + glob.glob(os.path.join(images_dir, "*.png"))
+    )
+    for path in paths:
+        payload = detect_image(path, note="benchmark recording", min_confidence=0.3)
+        out = os.path.join(RECORDINGS_DIR, os.path.splitext(os.path.basename(path))[0] + ".json")
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"image_path": path, "payload": payload}, f, ensure_ascii=False, indent=2)
+        print(f"recorded {path} -> {out}")
+
+
+def measure(top_k: int):
+    recordings = sorted(glob.glob(os.path.join(RECORDINGS_DIR, "*.json")))
+    if not recordings:
+        print(f"No recordings in {RECORDINGS_DIR}. Run with --record <images_dir> first.")
+        return
+
+    counter_name, count = _token_counter()
+    print(f"tokenizer: {counter_name}, top_k: {top_k}\n")
+    print(f"{'image':40s} {'defects':>7s} {'markdown':>9s} {'compact':>8s} {'saved':>6s}")
+
+    total_md = total_compact = 0
+    for path in recordings:
+        with open(path, encoding="utf-8") as f:
+            rec = json.load(f)
+        md = count(format_markdown_summary(rec["image_path"], rec["payload"]))
+        compact = count(format_compact_summary(rec["image_path"], rec["payload"], top_k=top_k))
+        total_md += md
+        total_compact += compact
+        n = len(rec["payload"].get("crops") or [])
+        saved = 1 - compact / md if md else 0.0
+        print(f"{os.path.basename(path):40s} {n:7d} {md:9d} {compact:8d} {saved:6.0%}")
+
+    saved = 1 - total_compact / total_md if total_md else 0.0
+    print(f"\n{'TOTAL':40s} {'':7s} {total_md:9d} {total_compact:8d} {saved:6.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--record", metavar="IMAGES_DIR", help="record pcb-api payloads for a benchmark image set")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+    else:
+        measure(args.top_k)
@@ -0,0 +1,129 @@
+# app/admission.py
+"""
+Admission control ของ pcb-api
+
+- ClientRateLimiter: token bucket ต่อ client ต่อกลุ่ม endpoint (detect / read)
+  token หมด -> 429 + Retry-After ทันที
+- RequestQueue: จำกัดจำนวน request ที่ประมวลผลพร้อมกัน + จำนวนที่รอคิวได้
+  คิวเต็ม หรือรอเกิน max_wait -> 429 + Retry-After (ไม่ปล่อยให้ทุก request ค้างจน timeout พร้อมกัน)
+
+client = IP ของผู้เรียก หรือ hop แรกของ X-Forwarded-For ถ้าตั้ง RATE_LIMIT_TRUST_FORWARDED=1
+(pcb-agent-api ส่ง client ต้นทางมาให้) ใน docker-compose ตั้งไว้ที่ environment ของ pcb-api เท่านั้น
+และ pcb-api ไม่ publish port ออก host — ห้ามเปิด flag นี้ถ้า pcb-api ถูกเรียกตรงจากภายนอกได้
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+
+
+class OverloadedError(Exception):
+    """rate limit / คิวเต็ม (retry_after = วินาทีที่ควรรอก่อนลองใหม่)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientRateLimiter:
+    def __init__(self, name: str, rate_per_minute: float, burst: float, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        # client -> (tokens, เวลาที่อัปเดตล่าสุด) เรียงจากใช้ล่าสุดนานที่สุด
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client: str, cost: float = 1.0):
+        """หัก token / raise OverloadedError ถ้าไม่พอ (rate <= 0 = ไม่จำกัด)"""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < cost:
+                self._buckets[client] = (tokens, now)
+                raise OverloadedError(
+                    f"rate limit exceeded for {self.name} ({self.rate * 60:g}/min, burst {self.burst:g})",
+                    (cost - tokens) / self.rate,
+                )
+            self._buckets[client] = (tokens - cost, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+
+class RequestQueue:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._running = 0
+        self._rejected = 0
+        # เวลาประมวลผลเฉลี่ย (EWMA) ใช้ประมาณ Retry-After
+        self._avg_seconds: Optional[float] = None
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self._rejected,
+        }
+
+    def _overloaded(self, reason: str) -> OverloadedError:
+        self._rejected += 1
+        retry_after = 5.0
+        if self._avg_seconds is not None:
+            retry_after = max(1.0, self._avg_seconds * (self._waiting + 1) / self.max_concurrency)
+        return OverloadedError(
+            f"{self.name} is busy: {reason} ({self._running} running, {self._waiting} waiting)", retry_after
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise self._overloaded("queue is full")
+
+        self._waiting += 1
+        try:
+            async with asyncio.timeout(self.max_wait if self.max_wait > 0 else None):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            raise self._overloaded(f"waited {self.max_wait:.0f}s for a slot") from None
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = elapsed if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._running -= 1
+            self._semaphore.release()
+
+
+def client_id(request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
@@ -0,0 +1,379 @@
+# app/export.py
+"""
+Bulk export ของ pcb_main_images / pcb_defect_crops เป็นไฟล์ columnar (Parquet หรือ Arrow IPC)
+
+แทนการดึง /detections (JSON ก้อนเดียว) ไปแปลงเป็น DataFrame เอง
+- ดึงจาก DB ทีละ EXPORT_CHUNK_ROWS row แบบ keyset pagination (created_at, id) ไม่ใช้ offset
+  แล้วเขียนออกทีละ chunk -> memory คงที่ไม่ว่าจะมีกี่ล้าน row
+- partition แบบ hive: <table>/date=YYYY-MM-DD/board_code=XXX/part-<run>-<n>.parquet
+  (crop ไม่มี board_code ในตัว จะเติมจากรูปหลักให้)
+- incremental: เก็บ watermark (created_at, id ของ row สุดท้าย) ใน <out>/_watermark.json
+  รอบถัดไปด้วย --incremental จะ export เฉพาะ row ที่ใหม่กว่า
+- ไฟล์ถูกเขียนใน <out>/_staging/<run> ก่อน เสร็จทุก table แล้วค่อยย้ายเข้าที่ + อัปเดต watermark
+  (รอบที่ล้มกลางทางไม่ทิ้งไฟล์ครึ่ง ๆ กลาง ๆ และ watermark ไม่ขยับ)
+
+CLI (ในโฟลเดอร์ app/ หรือ container ของ pcb-api):
+    python export.py --out /data/pcb_export
+    python export.py --out /data/pcb_export --incremental
+    python export.py --out out --table pcb_defect_crops --partition-by none --format arrow
+endpoint: GET /export/{table}?format=parquet|arrow&since=... (ไฟล์เดียว ไม่แบ่ง partition)
+
+ต้องมี pyarrow (import ตอนใช้งาน)
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+
+from pcb_db import get_supabase
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+# จำนวนไฟล์ที่เปิดเขียนพร้อมกันได้ (1 ไฟล์ต่อ partition) เกินแล้วปิดตัวที่ไม่ได้เขียนนานที่สุด
+EXPORT_MAX_OPEN_FILES = int(os.getenv("EXPORT_MAX_OPEN_FILES", "64"))
+# จำนวน id ต่อ query ตอนหา board_code ของ crop (in.(...) อยู่ใน URL ยาวเกินแล้ว PostgREST / gateway ตอบ 414)
+EXPORT_ID_BATCH = int(os.getenv("EXPORT_ID_BATCH", "200"))
+
+TABLES = ("pcb_main_images", "pcb_defect_crops")
+PARTITION_COLUMNS = ("date", "board_code")
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+WATERMARK_FILE = "_watermark.json"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+_schemas: Dict[str, Any] = {}
+
+
+def get_schema(table: str):
+    """schema ของแต่ละ table (กำหนดตายตัว ทุก chunk / ทุกไฟล์ type ตรงกัน)"""
+    if not _schemas:
+        import pyarrow as pa
+
+        timestamp = pa.timestamp("us", tz="UTC")
+        _schemas["pcb_main_images"] = pa.schema([
+            ("id", pa.string()),
+            ("storage_path", pa.string()),
+            ("public_url", pa.string()),
+            ("width", pa.int32()),
+            ("height", pa.int32()),
+            ("original_filename", pa.string()),
+            ("board_code", pa.string()),
+            ("note", pa.string()),
+            ("renditions", pa.string()),  # JSON
+            ("created_at", timestamp),
+        ])
+        _schemas["pcb_defect_crops"] = pa.schema([
+            ("id", pa.string()),
+            ("main_image_id", pa.string()),
+            ("board_code", pa.string()),  # จากรูปหลัก
+            ("crop_storage_path", pa.string()),
+            ("crop_public_url", pa.string()),
+            ("crop_width", pa.int32()),
+            ("crop_height", pa.int32()),
+            ("prediction", pa.string()),
+            ("confidence", pa.float64()),
+            ("bbox_x", pa.int32()),
+            ("bbox_y", pa.int32()),
+            ("bbox_width", pa.int32()),
+            ("bbox_height", pa.int32()),
+            ("renditions", pa.string()),  # JSON
+            ("created_at", timestamp),
+        ])
+    return _schemas[table]
+
+
+# ---------- Fetch ----------
+
+def _quote(value: Any) -> str:
+    # ค่าใน or=(...) ของ PostgREST ที่มี , . : ( ) ต้องครอบด้วย "
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _attach_board_codes(rows: List[Dict[str, Any]]):
+    main_ids = sorted({row["main_image_id"] for row in rows if row.get("main_image_id")})
+    if not main_ids:
+        return
+    board_codes: Dict[str, Any] = {}
+    for start in range(0, len(main_ids), EXPORT_ID_BATCH):
+        batch = main_ids[start:start + EXPORT_ID_BATCH]
+        res = get_supabase().table("pcb_main_images").select("id,board_code").in_("id", batch).execute()
+        board_codes.update((m["id"], m.get("board_code")) for m in (res.data or []))
+    for row in rows:
+        row["board_code"] = board_codes.get(row.get("main_image_id"))
+
+
+def iter_chunks(
+    table: str,
+    since: Optional[Dict[str, Any]] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    ดึง row เรียงตาม (created_at, id) ทีละ chunk
+    since: watermark {"created_at": ..., "id": ...} (id ไม่ใส่ก็ได้) -> เฉพาะ row ที่ใหม่กว่า
+    """
+    cursor = since
+    while True:
+        query = get_supabase().table(table).select("*").order("created_at").order("id").limit(chunk_rows)
+        if cursor and cursor.get("id") is not None:
+            created_at, last_id = _quote(cursor["created_at"]), _quote(cursor["id"])
+            query = query.or_(f"created_at.gt.{created_at},and(created_at.eq.{created_at},id.gt.{last_id})")
+        elif cursor:
+            query = query.gt("created_at", cursor["created_at"])
+        rows = query.execute().data or []
+        if not rows:
+            return
+        if table == "pcb_defect_crops":
+            _attach_board_codes(rows)
+        yield rows
+        if len(rows) < chunk_rows:
+            return
+        cursor = {"created_at": rows[-1]["created_at"], "id": rows[-1]["id"]}
+
+
+def _cell(value: Any, field) -> Any:
+    import pyarrow as pa
+
+    if value is None:
+        return None
+    if pa.types.is_timestamp(field.type):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+    if field.name == "renditions":
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    if pa.types.is_string(field.type):
+        return str(value)
+    return value
+
+
+def to_table(table: str, rows: List[Dict[str, Any]]):
+    """rows (dict จาก PostgREST) -> pyarrow.Table ตาม schema (คอลัมน์อื่นถูกตัดทิ้ง)"""
+    import pyarrow as pa
+
+    schema = get_schema(table)
+    columns = {field.name: [_cell(row.get(field.name), field) for row in rows] for field in schema}
+    return pa.table(columns, schema=schema)
+
+
+# ---------- Write ----------
+
+def _open_writer(path: str, schema, fmt: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == "arrow":
+        return pa.ipc.new_file(path, schema)
+    return pq.ParquetWriter(path, schema, compression="zstd")
+
+
+class PartitionedWriter:
+    """
+    เขียน pyarrow.Table ลงไฟล์ตาม partition (date=/board_code=) เปิดค้างไว้ได้ EXPORT_MAX_OPEN_FILES ไฟล์
+    partition ที่ถูกปิดไปแล้วมี row มาอีกจะได้ไฟล์ใหม่ (part-<run>-<n+1>)
+    """
+
+    def __init__(self, root: str, table: str, partition_by: Sequence[str], fmt: str, run_id: str):
+        self.root = root
+        self.table = table
+        self.partition_by = tuple(partition_by)
+        self.fmt = fmt
+        self.run_id = run_id
+        self.schema = get_schema(table)
+        self.rows = 0
+        self.files: List[str] = []
+        self._writers: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._file_counts: Dict[tuple, int] = {}
+
+    def _partition_dir(self, key: tuple) -> str:
+        parts = [
+            f"{name}={quote(value, safe='') if value else NULL_PARTITION}"
+            for name, value in zip(self.partition_by, key)
+        ]
+        return os.path.join(self.root, self.table, *parts)
+
+    def _writer(self, key: tuple):
+        writer = self._writers.get(key)
+        if writer is not None:
+            self._writers.move_to_end(key)
+            return writer
+        while len(self._writers) >= EXPORT_MAX_OPEN_FILES:
+            self._writers.popitem(last=False)[1].close()
+        directory = self._partition_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        n = self._file_counts.get(key, 0)
+        self._file_counts[key] = n + 1
+        path = os.path.join(directory, f"part-{self.run_id}-{n:04d}.{FORMATS[self.fmt]}")
+        self.files.append(path)
+        writer = self._writers[key] = _open_writer(path, self.schema, self.fmt)
+        return writer
+
+    def _key(self, row: Dict[str, Any]) -> tuple:
+        values = {"date": (row.get("created_at") or "")[:10] or None, "board_code": row.get("board_code")}
+        return tuple(values[name] for name in self.partition_by)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(self._key(row), []).append(row)
+        for key, group in groups.items():
+            self._writer(key).write_table(to_table(self.table, group))
+        self.rows += len(rows)
+
+    def close(self):
+        while self._writers:
+            self._writers.popitem(last=False)[1].close()
+
+
+# ---------- Export (CLI) ----------
+
+def read_watermark(out_dir: str) -> Dict[str, Any]:
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_dataset(
+    out_dir: str,
+    tables: Sequence[str] = TABLES,
+    partition_by: Sequence[str] = PARTITION_COLUMNS,
+    fmt: str = "parquet",
+    incremental: bool = False,
+    since: Optional[str] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Dict[str, Any]:
+    """
+    export หลาย table ลง out_dir (staging แล้วค่อยย้ายเข้าที่) คืนสรุปต่อ table
+    since: ISO timestamp (ทับ watermark) / incremental: ใช้ watermark ของรอบก่อน
+    """
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    staging = os.path.join(out_dir, "_staging", run_id)
+    watermarks = read_watermark(out_dir)
+    summary: Dict[str, Any] = {}
+
+    try:
+        for table in tables:
+            cursor = {"created_at": since} if since else (watermarks.get(table) if incremental else None)
+            writer = PartitionedWriter(staging, table, partition_by, fmt, run_id)
+            try:
+                for rows in iter_chunks(table, cursor, chunk_rows):
+                    writer.write(rows)
+                    cursor = {"created_at": rows[-1]["created_at"], "id": rows[-1]["id"]}
+                    print(f"[export] {table}: {writer.rows} rows")
+            finally:
+                writer.close()
+            summary[table] = {"rows": writer.rows, "files": len(writer.files), "watermark": cursor}
+
+        # ย้ายไฟล์จาก staging เข้าที่ แล้วค่อยเขียน watermark ใหม่
+        for directory, _, files in os.walk(staging):
+            target_dir = os.path.join(out_dir, os.path.relpath(directory, staging))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in files:
+                os.replace(os.path.join(directory, name), os.path.join(target_dir, name))
+        for table, result in summary.items():
+            if result["watermark"]:
+                watermarks[table] = result["watermark"]
+        tmp_path = os.path.join(out_dir, WATERMARK_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(watermarks, f, indent=2)
+        os.replace(tmp_path, os.path.join(out_dir, WATERMARK_FILE))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(staging))  # ลบ _staging ถ้าไม่มี run อื่นค้างอยู่
+        except OSError:
+            pass
+    return summary
+
+
+# ---------- Export (HTTP) ----------
+
+def export_parquet_file(table: str, since: Optional[Dict[str, Any]] = None) -> tuple:
+    """
+    เขียน table ลง temp file (Parquet ไฟล์เดียว) ทีละ chunk
+    return (path, rows, watermark) / caller ต้องลบไฟล์เอง
+    """
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    rows, cursor = 0, since
+    writer = _open_writer(path, get_schema(table), "parquet")
+    try:
+        for chunk in iter_chunks(table, since):
+            writer.write_table(to_table(table, chunk))
+            rows += len(chunk)
+            cursor = {"created_at": chunk[-1]["created_at"], "id": chunk[-1]["id"]}
+    except Exception:
+        writer.close()
+        os.remove(path)
+        raise
+    writer.close()
+    return path, rows, cursor
+
+
+class _ChunkSink(io.RawIOBase):
+    """file-like ที่เก็บ bytes ไว้ให้ generator ดึงออกไปส่งทีละ chunk"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_arrow(table: str, since: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """Arrow IPC stream: ส่ง record batch ออกไปทันทีที่ดึงแต่ละ chunk เสร็จ (ไม่ต้องรอทั้ง table)"""
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), get_schema(table))
+    for chunk in iter_chunks(table, since):
+        writer.write_table(to_table(table, chunk))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export PCB detections as Parquet / Arrow")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--table", action="append", choices=TABLES, help="default: both tables")
+    parser.add_argument("--partition-by", default=",".join(PARTITION_COLUMNS),
+                        help="comma separated subset of date,board_code / none")
+    parser.add_argument("--format", choices=tuple(FORMATS), default="parquet")
+    parser.add_argument("--incremental", action="store_true", help=f"only rows newer than {WATERMARK_FILE}")
+    parser.add_argument("--since", help="only rows with created_at after this ISO timestamp")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    partition_by = [] if args.partition_by == "none" else [p for p in args.partition_by.split(",") if p]
+    unknown = set(partition_by) - set(PARTITION_COLUMNS)
+    if unknown:
+        parser.error(f"unknown partition column(s): {', '.join(sorted(unknown))}")
+
+    summary = export_dataset(
+        args.out,
+        tables=args.table or TABLES,
+        partition_by=partition_by,
+        fmt=args.format,
+        incremental=args.incremental,
+        since=args.since,
+        chunk_rows=args.chunk_rows,
+    )
+    print(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
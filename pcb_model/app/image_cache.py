@@ -0,0 +1,205 @@
+# app/image_cache.py
+"""
+Disk LRU cache ของไฟล์ใน Supabase Storage (ใช้กับ GET /images/{storage_path})
+
+- เก็บ object ละไฟล์ใน IMAGE_CACHE_DIR ชื่อไฟล์ = sha256(storage_path).<etag>
+  (etag = sha256 ของเนื้อไฟล์ จึงเป็น strong ETag และ restart แล้วไม่ต้องคำนวณใหม่)
+- ขนาดรวมไม่เกิน IMAGE_CACHE_MAX_BYTES เกินแล้วลบตัวที่ไม่ได้ใช้นานที่สุดก่อน
+  (ลำดับการใช้เก็บเป็น mtime ของไฟล์ restart แล้วลำดับยังอยู่)
+- miss พร้อมกันหลาย request ของ path เดียวกัน ดึงจาก storage ครั้งเดียว
+
+parse_range / etag_matches: helper ของ HTTP Range (ช่วงเดียว) และ If-None-Match
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class CachedObject(NamedTuple):
+    path: Optional[str]  # ไฟล์บนดิสก์ / None = ใหญ่เกิน cache ไม่ได้เก็บ
+    size: int
+    etag: str
+
+
+class DiskLRUCache:
+    def __init__(self, root: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # key (sha256 ของ storage path) -> CachedObject เรียงจากใช้ล่าสุดนานที่สุด
+        self._entries: "OrderedDict[str, CachedObject]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._loaded = False
+
+    # ---------- index ----------
+
+    def _load(self):
+        """อ่านไฟล์ที่มีอยู่แล้วใน root (ครั้งแรกที่ใช้) เรียงตาม mtime"""
+        if self._loaded:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for name in os.listdir(self.root):
+            key, _, etag = name.partition(".")
+            path = os.path.join(self.root, name)
+            if not etag or etag.endswith(".tmp"):
+                # ไฟล์ที่เขียนค้างตอน process ตาย
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_mtime, key, CachedObject(path, stat.st_size, etag)))
+        for _, key, entry in sorted(found):
+            self._entries[key] = entry
+            self._bytes += entry.size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._counters["evictions"] += 1
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def key(storage_path: str) -> str:
+        return hashlib.sha256(storage_path.encode("utf-8")).hexdigest()
+
+    # ---------- get / put ----------
+
+    def get(self, storage_path: str) -> Optional[CachedObject]:
+        key = self.key(storage_path)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            os.utime(entry.path)
+        except FileNotFoundError:
+            # ถูกลบจากภายนอก
+            with self._lock:
+                if self._entries.pop(key, None) is not None:
+                    self._bytes -= entry.size
+            return None
+        return entry
+
+    def put(self, storage_path: str, data: bytes) -> CachedObject:
+        key = self.key(storage_path)
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        if len(data) > self.max_bytes:
+            return CachedObject(None, len(data), etag)
+        path = os.path.join(self.root, f"{key}.{etag}")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._load()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        entry = CachedObject(path, len(data), etag)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+                if old.path != path:
+                    try:
+                        os.remove(old.path)
+                    except FileNotFoundError:
+                        pass
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+        return entry
+
+    def get_or_fetch(self, storage_path: str, fetch: Callable[[str], bytes]) -> tuple:
+        """
+        return (CachedObject, data)
+        - hit: data = None (อ่านจาก entry.path)
+        - miss: fetch(storage_path) แล้วเก็บลง cache / data = bytes ที่ดึงมา (ใช้ตอบได้เลย)
+        """
+        entry = self.get(storage_path)
+        if entry is not None:
+            self._count("hits")
+            return entry, None
+
+        key = self.key(storage_path)
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            # request อื่นอาจดึงเสร็จแล้วระหว่างรอ lock
+            entry = self.get(storage_path)
+            if entry is not None:
+                self._count("hits")
+                return entry, None
+            self._count("misses")
+            try:
+                data = fetch(storage_path)
+                entry = self.put(storage_path, data)
+            finally:
+                with self._lock:
+                    self._fetch_locks.pop(key, None)
+        return entry, data
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# ---------- HTTP helpers ----------
+
+class RangeNotSatisfiableError(ValueError):
+    """Range อยู่นอกไฟล์ (ตอบ 416)"""
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    "bytes=start-end" / "bytes=start-" / "bytes=-suffix" -> (start, end) แบบรวมปลาย
+    None = ไม่รองรับ / รูปแบบผิด / หลายช่วง -> ส่งทั้งไฟล์ (RFC 9110 อนุญาตให้ไม่สนใจ Range)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = (part.strip() for part in spec.partition("-"))
+    if not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiableError(header)
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiableError(header)
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match (เทียบแบบ weak ตาม RFC: ไม่สน W/)"""
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
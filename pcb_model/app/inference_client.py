@@ -0,0 +1,396 @@
+# app/inference_client.py
+"""
+ResilientInferenceClient: ห่อ Roboflow infer ให้ทน tail latency / service ล่ม
+
+- per-attempt deadline: แต่ละ attempt รอได้ไม่เกิน INFERENCE_ATTEMPT_TIMEOUT วินาที
+  (infer เป็น sync จึงรันใน thread pool เกินเวลาแล้วเลิกรอ ผลที่มาทีหลังถูกทิ้ง)
+  thread ยกเลิกกลางทางไม่ได้ ตัว HTTP call จึงต้องมี timeout ของตัวเองด้วย (RoboflowHTTPClient)
+- in-flight budget: จำนวน Roboflow call ที่ค้างอยู่พร้อมกัน (รวม call ที่เลิกรอแล้วแต่ยังไม่จบ)
+  ไม่เกิน max_inflight (= INFERENCE_MAX_CONCURRENCY) request หลักรอ slot ได้ไม่เกิน attempt_timeout
+  ส่วน hedge / retry ถ้า budget เต็มจะข้ามไปเลย (ไม่ยิงเพิ่มตอน Roboflow ช้าอยู่แล้ว)
+- hedging: ถ้า attempt ยังไม่เสร็จเกิน latency percentile ที่ INFERENCE_HEDGE_PERCENTILE
+  (คำนวณจาก call ที่สำเร็จล่าสุด) ยิง request ซ้ำอีกตัว แล้วใช้ผลที่มาก่อน
+  infer เป็น read-only จึงยิงซ้ำได้ปลอดภัย / 0 = ปิด
+- retry: attempt ที่ error / timeout ลองใหม่ได้ถึง INFERENCE_MAX_ATTEMPTS ครั้ง
+  เว้นช่วงแบบ exponential backoff + full jitter (INFERENCE_BACKOFF_BASE .. INFERENCE_BACKOFF_MAX)
+- circuit breaker: fail ติดกัน INFERENCE_BREAKER_FAILURES attempt -> เปิดวงจร
+  INFERENCE_BREAKER_RESET วินาที ระหว่างนั้นไม่เรียก Roboflow เลย (fail fast) แล้วค่อยปล่อย probe 1 ตัว
+- fallback: ถ้าตั้ง INFERENCE_FALLBACK_MODEL (เช่น best.pt) ตอนวงจรเปิด หรือ retry หมดแล้ว
+  จะรัน YOLO local (ultralytics) แทน ผลแปลงเป็นรูปแบบเดียวกับ Roboflow
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+INFERENCE_ATTEMPT_TIMEOUT = float(os.getenv("INFERENCE_ATTEMPT_TIMEOUT", "10"))
+INFERENCE_MAX_ATTEMPTS = int(os.getenv("INFERENCE_MAX_ATTEMPTS", "3"))
+INFERENCE_BACKOFF_BASE = float(os.getenv("INFERENCE_BACKOFF_BASE", "0.2"))
+INFERENCE_BACKOFF_MAX = float(os.getenv("INFERENCE_BACKOFF_MAX", "2.0"))
+INFERENCE_HEDGE_PERCENTILE = float(os.getenv("INFERENCE_HEDGE_PERCENTILE", "95"))
+INFERENCE_HEDGE_MIN_SAMPLES = int(os.getenv("INFERENCE_HEDGE_MIN_SAMPLES", "20"))
+INFERENCE_BREAKER_FAILURES = int(os.getenv("INFERENCE_BREAKER_FAILURES", "5"))
+INFERENCE_BREAKER_RESET = float(os.getenv("INFERENCE_BREAKER_RESET", "30"))
+INFERENCE_FALLBACK_MODEL = os.getenv("INFERENCE_FALLBACK_MODEL") or None
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "16"))
+# ด้านยาวสุดของรูปที่ส่งไป Roboflow (ย่อฝั่ง client เหมือน inference_sdk) / 0 = ส่งรูปเต็ม
+INFERENCE_MAX_INPUT_SIZE = int(os.getenv("INFERENCE_MAX_INPUT_SIZE", "1024"))
+
+
+class InferenceUnavailableError(RuntimeError):
+    """Roboflow ใช้ไม่ได้ (วงจรเปิด / retry หมด / budget เต็ม) และไม่มี fallback"""
+
+
+# ---------- Roboflow HTTP ----------
+
+class RoboflowHTTPClient:
+    """
+    เรียก Roboflow hosted API ตรง ๆ ด้วย httpx:
+        POST {api_url}/{project}/{version}?api_key=...  body = base64 ของรูป
+    ใช้แทน InferenceHTTPClient เพราะ SDK ไม่ตั้ง timeout ให้ requests (และ retry เองอีกชั้น)
+    call ที่ถูกทิ้งหลัง deadline จึงค้าง thread / quota ไปเรื่อย ๆ
+    - connect / ส่งรูป / รอผล แต่ละขั้นไม่เกิน timeout และตอนอ่านผลตัดที่เวลารวม timeout
+    - ย่อรูปให้ด้านยาวสุดไม่เกิน max_input_size ก่อนส่ง แล้วแปลงพิกัดกลับเป็นขนาดรูปจริง
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        timeout: float = INFERENCE_ATTEMPT_TIMEOUT,
+        max_input_size: int = INFERENCE_MAX_INPUT_SIZE,
+    ):
+        self.api_url = (api_url or "").rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_input_size = max_input_size
+        self._http = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    import httpx
+
+                    self._http = httpx.Client(timeout=self.timeout)
+        return self._http
+
+    def _encode(self, image_path: str) -> tuple:
+        """return (base64 body, scale) / scale = ขนาดที่ส่ง / ขนาดจริง"""
+        import base64
+
+        with open(image_path, "rb") as f:
+            data = f.read()
+        if self.max_input_size > 0:
+            from io import BytesIO
+
+            from PIL import Image
+
+            img = Image.open(BytesIO(data))
+            longest = max(img.size)
+            if longest > self.max_input_size:
+                img = img.convert("RGB")
+                img.thumbnail((self.max_input_size, self.max_input_size), Image.LANCZOS)
+                buf = BytesIO()
+                img.save(buf, format="JPEG", quality=95)
+                return base64.b64encode(buf.getvalue()), max(img.size) / longest
+        return base64.b64encode(data), 1.0
+
+    def infer(self, image_path: str, model_id: str, **kwargs) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.timeout
+        body, scale = self._encode(image_path)
+        chunks = []
+        with self._client().stream(
+            "POST",
+            f"{self.api_url}/{model_id.strip('/')}",
+            params={"api_key": self.api_key},
+            content=body,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        ) as response:
+            for chunk in response.iter_bytes():
+                chunks.append(chunk)
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Roboflow response exceeded {self.timeout:.1f}s")
+            if response.status_code >= 400:
+                # ไม่ใช้ raise_for_status เพราะข้อความมี URL ที่มี api_key
+                raise RuntimeError(f"Roboflow HTTP {response.status_code}: {b''.join(chunks)[:200]!r}")
+        result = json.loads(b"".join(chunks))
+        if scale != 1.0:
+            for pred in result.get("predictions", []):
+                for key in ("x", "y", "width", "height"):
+                    if key in pred:
+                        pred[key] = pred[key] / scale
+            image = result.get("image") or {}
+            for key in ("width", "height"):
+                if key in image:
+                    image[key] = round(float(image[key]) / scale)
+        return result
+
+
+class _BudgetExhausted(RuntimeError):
+    """Roboflow call ค้างเต็ม max_inflight"""
+
+
+# ---------- Circuit breaker ----------
+
+class CircuitBreaker:
+    """
+    closed -> (fail ติดกัน N ครั้ง) -> open -> (ครบ reset_timeout) -> half_open (probe 1 ตัว)
+    probe สำเร็จ -> closed / ไม่สำเร็จ -> open ใหม่
+    """
+
+    def __init__(self, failure_threshold: int = INFERENCE_BREAKER_FAILURES, reset_timeout: float = INFERENCE_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"[inference] circuit opened after {self._failures} failure(s)")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+# ---------- Local fallback ----------
+
+class LocalYoloBackend:
+    """
+    รัน YOLO (ultralytics) จากไฟล์ weights ในเครื่อง แปลงผลเป็นรูปแบบของ Roboflow
+    (x, y = จุดกลาง / width, height / class / confidence)
+    """
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from ultralytics import YOLO
+
+                    self._model = YOLO(self.model_path)
+        return self._model
+
+    def infer(self, image_path: str, **kwargs) -> Dict[str, Any]:
+        result = self._get_model()(image_path, verbose=False)[0]
+        height, width = result.orig_shape
+        predictions = []
+        for box in result.boxes:
+            x1, y1, x2, y2 = (float(v) for v in box.xyxy[0].tolist())
+            predictions.append({
+                "x": (x1 + x2) / 2,
+                "y": (y1 + y2) / 2,
+                "width": x2 - x1,
+                "height": y2 - y1,
+                "class": result.names[int(box.cls[0])],
+                "confidence": float(box.conf[0]),
+            })
+        return {"image": {"width": width, "height": height}, "predictions": predictions, "backend": "local"}
+
+
+# ---------- Resilient client ----------
+
+class ResilientInferenceClient:
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        attempt_timeout: float = INFERENCE_ATTEMPT_TIMEOUT,
+        max_attempts: int = INFERENCE_MAX_ATTEMPTS,
+        hedge_percentile: float = INFERENCE_HEDGE_PERCENTILE,
+        breaker: Optional[CircuitBreaker] = None,
+        fallback: Optional[Any] = None,
+        max_inflight: int = INFERENCE_WORKERS,
+    ):
+        self._client_factory = client_factory
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback = fallback
+        self.max_inflight = max(1, max_inflight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(INFERENCE_WORKERS, self.max_inflight), thread_name_prefix="roboflow"
+        )
+        # slot ของ Roboflow call ที่ค้างอยู่ คืนตอน call จบจริง (ไม่ใช่ตอนเลิกรอ)
+        self._budget = threading.BoundedSemaphore(self.max_inflight)
+        self._inflight = 0
+        # latency ของ call ที่สำเร็จล่าสุด (ใช้หา hedge delay)
+        self._latencies: deque = deque(maxlen=200)
+        self._counters = {
+            "calls": 0, "hedges": 0, "hedge_wins": 0, "retries": 0, "fallbacks": 0, "rejected": 0,
+            "budget_skips": 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """latency percentile ของ call ที่สำเร็จ / None ถ้าปิด hedging หรือข้อมูลยังน้อย"""
+        if self.hedge_percentile <= 0 or len(self._latencies) < INFERENCE_HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return latencies[index]
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        hedge_after = self.hedge_delay()
+        return {
+            **self._counters,
+            "circuit": self.breaker.state,
+            "inflight": self._inflight,
+            "max_inflight": self.max_inflight,
+            "p50_seconds": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "hedge_after_seconds": round(hedge_after, 3) if hedge_after is not None else None,
+            "fallback": self.fallback is not None,
+        }
+
+    def _timed_infer(self, image_path: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = self._client_factory().infer(image_path, **kwargs)
+        self._latencies.append(time.perf_counter() - started)
+        return result
+
+    def _submit(self, image_path: str, kwargs: Dict[str, Any], wait_for_slot: float = 0.0) -> Optional[Future]:
+        """ยิง Roboflow call ถ้าได้ slot ภายใน wait_for_slot วินาที / None = budget เต็ม"""
+        if wait_for_slot > 0:
+            acquired = self._budget.acquire(timeout=wait_for_slot)
+        else:
+            acquired = self._budget.acquire(blocking=False)
+        if not acquired:
+            self._count("budget_skips")
+            return None
+        with self._lock:
+            self._inflight += 1
+        future = self._executor.submit(self._timed_infer, image_path, kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self._inflight -= 1
+        self._budget.release()
+
+    def _attempt(self, image_path: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        1 attempt = request หลัก + (ถ้าช้ากว่า hedge delay และ budget ยังว่าง) request ซ้ำ 1 ตัว ภายใน attempt_timeout
+        """
+        started = time.monotonic()
+        deadline = started + self.attempt_timeout
+        primary = self._submit(image_path, kwargs, wait_for_slot=self.attempt_timeout)
+        if primary is None:
+            raise _BudgetExhausted(f"no inference slot within {self.attempt_timeout:.1f}s")
+        pending: List[Future] = [primary]
+        delay = self.hedge_delay()
+        hedge_at = started + delay if delay is not None else None
+        error: Optional[BaseException] = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, _ = wait(pending, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                # hedge ได้ครั้งเดียวต่อ attempt และเฉพาะตอน request หลักยังค้างอยู่ (error แล้วให้ retry แทน)
+                hedge_at = None
+                hedge = self._submit(image_path, kwargs) if pending else None
+                if hedge is not None:
+                    self._count("hedges")
+                    pending.append(hedge)
+
+        for future in pending:
+            future.cancel()
+        if pending or error is None:
+            raise TimeoutError(f"inference attempt exceeded {self.attempt_timeout:.1f}s")
+        raise error
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter: สุ่ม 0 .. min(max, base * 2^attempt)
+        return random.uniform(0, min(INFERENCE_BACKOFF_MAX, INFERENCE_BACKOFF_BASE * (2 ** attempt)))
+
+    def _use_fallback(self, image_path: str, kwargs: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        if self.fallback is None:
+            raise InferenceUnavailableError(f"Roboflow inference unavailable: {reason}")
+        print(f"[inference] using local fallback ({reason})")
+        self._count("fallbacks")
+        return self.fallback.infer(image_path, **kwargs)
+
+    def infer(self, image_path: str, **kwargs) -> Dict[str, Any]:
+        """เหมือน InferenceHTTPClient.infer(image_path, model_id=...)"""
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            return self._use_fallback(image_path, kwargs, "circuit open")
+
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retries")
+                time.sleep(self._backoff(attempt))
+                if not self.breaker.allow():
+                    return self._use_fallback(image_path, kwargs, "circuit open")
+                if self._inflight >= self.max_inflight:
+                    # call ที่เลิกรอไปแล้วยังค้างเต็ม budget ไม่ retry ซ้ำเติม
+                    self._count("budget_skips")
+                    return self._use_fallback(image_path, kwargs, f"inference budget exhausted after: {last_error}")
+            try:
+                result = self._attempt(image_path, kwargs)
+            except _BudgetExhausted as e:
+                # ไม่ใช่ความผิดของ Roboflow call ไหน ไม่นับใน breaker
+                return self._use_fallback(image_path, kwargs, f"inference budget exhausted: {e}")
+            except Exception as e:
+                last_error = e
+                self.breaker.record_failure()
+                print(f"[inference] attempt {attempt + 1}/{self.max_attempts} failed: {e}")
+                continue
+            self.breaker.record_success()
+            return result
+
+        return self._use_fallback(image_path, kwargs, f"{self.max_attempts} attempt(s) failed: {last_error}")
@@ -1,12 +1,23 @@
 # app/main.py
+import json
+import mimetypes
 import os
+import re
 from uuid import uuid4
 from io import BytesIO
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
-from pcb_db import save_detection_to_supabase_and_get_urls, get_all_detections
+from admission import ClientRateLimiter, OverloadedError, RequestQueue, client_id, retry_after_header
+from export import TABLES as EXPORT_TABLES, export_parquet_file, stream_arrow
+from image_cache import DiskLRUCache, RangeNotSatisfiableError, etag_matches, parse_range
+from inference_client import InferenceUnavailableError
+from pcb_db import save_detection_to_supabase_and_get_urls, get_all_detections, get_detection, download_from_storage
+from pcb_model import get_inference_client
+from renditions import FULL, RENDITION_NAMES, RENDITION_SIZES
 
 # หา path ของ best.pt แบบไม่ต้องเดา working dir
 BASE_DIR = os.path.dirname(__file__)          # โฟลเดอร์ app/
@@ -16,20 +27,70 @@ MODEL_PATH = os.path.join(BASE_DIR, "best.pt")
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# ===== Admission control =====
+# /detect-image: token bucket ต่อ client + คิวจำกัดขนาด (ประมวลผลพร้อมกันได้ DETECT_MAX_CONCURRENCY)
+# /detections*: อ่าน DB อย่างเดียว ใช้ bucket แยกที่หลวมกว่า
+detect_limiter = ClientRateLimiter(
+    "detect",
+    float(os.getenv("DETECT_RATE_PER_MINUTE", "120")),
+    float(os.getenv("DETECT_RATE_BURST", "30")),
+)
+read_limiter = ClientRateLimiter(
+    "read",
+    float(os.getenv("READ_RATE_PER_MINUTE", "600")),
+    float(os.getenv("READ_RATE_BURST", "100")),
+)
+image_limiter = ClientRateLimiter(
+    "images",
+    float(os.getenv("IMAGES_RATE_PER_MINUTE", "3000")),
+    float(os.getenv("IMAGES_RATE_BURST", "300")),
+)
+detect_queue = RequestQueue(
+    "detect",
+    max_concurrency=int(os.getenv("DETECT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("DETECT_MAX_QUEUE", "32")),
+    max_wait=float(os.getenv("DETECT_MAX_QUEUE_WAIT", "30")),
+)
+
+# ===== Image proxy (/images) =====
+# ให้ดึงได้เฉพาะ path ที่ pcb-api เป็นคน upload (pcb/main, pcb/crops, pcb/renditions/...)
+IMAGE_PROXY_PREFIXES = tuple(p for p in os.getenv("IMAGE_PROXY_PREFIXES", "pcb/").split(",") if p)
+# object ที่ชื่อเป็น uuid hex (upload_to_storage) ไม่มีวันถูกเขียนทับ -> cache ได้ตลอด
+IMMUTABLE_OBJECT = re.compile(r"(^|/)[0-9a-f]{32}\.[A-Za-z0-9]+$")
+IMAGE_MUTABLE_MAX_AGE = int(os.getenv("IMAGE_MUTABLE_MAX_AGE", "60"))
+image_cache = DiskLRUCache()
+
 app = FastAPI(
     title="PCB Defect Detection API",
     version="1.0.0",
 )
 
 
+def admit(request: Request, limiter: ClientRateLimiter):
+    try:
+        limiter.check(client_id(request))
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+
+
 @app.get("/")
 def health_check():
-    return {"status": "ok", "message": "PCB Defect Detection API is running."}
+    return {
+        "status": "ok",
+        "message": "PCB Defect Detection API is running.",
+        "detect": detect_queue.stats(),
+        "inference": get_inference_client().stats(),
+        "image_cache": image_cache.stats(),
+    }
 
 
 @app.post("/detect-image")
 async def detect_pcb_image(
+    request: Request,
     file: UploadFile = File(..., description="รูป PCB ที่ต้องการให้บันทึก + ส่ง url + metadata กลับมา"),
+    board_code: str | None = Form(None, description="รหัสบอร์ด (optional)"),
+    note: str | None = Form(None, description="หมายเหตุที่จะบันทึกลง DB (optional)"),
+    min_confidence: float = Form(0.0, description="ตัด prediction ที่ confidence ต่ำกว่าค่านี้ทิ้ง"),
 ):
     """
     - เซฟรูปชั่วคราว
@@ -40,27 +101,38 @@ async def detect_pcb_image(
     """
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="กรุณาอัปโหลดไฟล์รูปภาพเท่านั้น")
+    admit(request, detect_limiter)
 
     tmp_path = None
     try:
-        contents = await file.read()
-        filename = f"{uuid4()}_{file.filename}"
-        tmp_path = os.path.join(UPLOAD_DIR, filename)
-
-        # เซฟไฟล์ชั่วคราว
-        with open(tmp_path, "wb") as f:
-            f.write(contents)
-
-        # รัน model + upload Supabase + insert DB + ได้ payload กลับมา
-        payload = save_detection_to_supabase_and_get_urls(
-            image_path=tmp_path,
-            model_path=MODEL_PATH,
-            board_code=None,  # ถ้าอยากรับเพิ่มจาก client ค่อยเติม Form field
-            note="Created via /detect-image",
-        )
+        async with detect_queue.slot():
+            contents = await file.read()
+            filename = f"{uuid4()}_{file.filename}"
+            tmp_path = os.path.join(UPLOAD_DIR, filename)
+
+            # เซฟไฟล์ชั่วคราว
+            with open(tmp_path, "wb") as f:
+                f.write(contents)
+
+            # รัน model + upload Supabase + insert DB + ได้ payload กลับมา
+            # (blocking ทั้งหมด -> รันใน threadpool ไม่ให้ event loop ค้างระหว่างรอ Roboflow)
+            payload = await run_in_threadpool(
+                save_detection_to_supabase_and_get_urls,
+                image_path=tmp_path,
+                model_path=MODEL_PATH,
+                board_code=board_code,
+                note=note or "Created via /detect-image",
+                min_confidence=min_confidence,
+            )
 
         return JSONResponse(payload)
 
+    except OverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+    except InferenceUnavailableError as e:
+        # Roboflow ล่ม (circuit เปิด) และไม่มี fallback -> ตอบเร็ว ๆ ให้ลองใหม่หลังวงจรปิด
+        retry_after = get_inference_client().breaker.reset_timeout
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(retry_after))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"processing error: {e}")
     finally:
@@ -71,14 +143,159 @@ async def detect_pcb_image(
                 pass
 
 @app.get("/detections")
-def list_detections():
+def list_detections(
+    request: Request,
+    rendition: str = Query(FULL, description="ขนาดของ main_image_url: thumbnail / medium / full"),
+):
     """
     ดึงข้อมูล detection ทั้งหมดจาก DB
     - ไม่ส่งข้อมูล crop image
     - มี main image + defects (prediction, confidence, bbox, timestamp)
+    - หน้า list ใช้ ?rendition=thumbnail (JPEG หลัก KB แทน PNG เต็มขนาด)
+      ถ้าไม่ได้เปิด IMAGE_RENDITIONS ทุกชื่อได้รูปเต็ม (field "rendition" = "full")
     """
+    admit(request, read_limiter)
+    if RENDITION_SIZES and rendition not in RENDITION_NAMES:
+        raise HTTPException(status_code=400, detail=f"rendition must be one of: {', '.join(RENDITION_NAMES)}")
     try:
-        items = get_all_detections()
+        items = get_all_detections(rendition)
         return {"items": items}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"db error: {e}")
+
+
+@app.get("/detections/{main_image_id}")
+def get_detection_by_id(main_image_id: str, request: Request):
+    """
+    ดึง detection ครั้งเดียวตาม id ของรูปหลัก (รูปแบบเดียวกับผลของ /detect-image)
+    ใช้ resolve artifact_id จาก agent เป็น URL ของรูป
+    """
+    admit(request, read_limiter)
+    try:
+        payload = get_detection(main_image_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"db error: {e}")
+
+    if payload is None:
+        raise HTTPException(status_code=404, detail="detection not found")
+    return payload
+
+
+@app.get("/export/{table}")
+def export_detections(
+    table: str,
+    request: Request,
+    fmt: str = Query("parquet", alias="format", description="parquet (ไฟล์เดียว) / arrow (IPC stream)"),
+    since: str | None = Query(None, description="เฉพาะ row ที่ created_at ใหม่กว่านี้ (ISO timestamp)"),
+    since_id: str | None = Query(None, description="id ของ row สุดท้ายรอบก่อน (คู่กับ since จาก X-Export-Watermark)"),
+):
+    """
+    bulk export ของ pcb_main_images / pcb_defect_crops แบบ columnar (ดู export.py)
+    - parquet: ดึงทีละ chunk เขียนลง temp file แล้วส่งทั้งไฟล์
+      header X-Export-Watermark = {"created_at", "id"} ของ row สุดท้าย ใช้เป็น since / since_id รอบถัดไป
+    - arrow: ส่ง record batch ออกไปทีละ chunk ระหว่างดึง (Arrow IPC stream)
+    export ขนาดใหญ่ / แบ่ง partition ตามวันที่ + board_code ใช้ CLI: python export.py --out ...
+    """
+    admit(request, read_limiter)
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"table must be one of: {', '.join(EXPORT_TABLES)}")
+    if fmt not in ("parquet", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be parquet or arrow")
+    cursor = {"created_at": since, "id": since_id} if since else None
+
+    if fmt == "arrow":
+        return StreamingResponse(
+            stream_arrow(table, cursor),
+            media_type="application/vnd.apache.arrow.stream",
+            headers={"Content-Disposition": f'attachment; filename="{table}.arrows"'},
+        )
+
+    try:
+        path, rows, watermark = export_parquet_file(table, cursor)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"export error: {e}")
+    headers = {"X-Export-Rows": str(rows)}
+    if watermark:
+        headers["X-Export-Watermark"] = json.dumps(watermark)
+    return FileResponse(
+        path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"{table}.parquet",
+        headers=headers,
+        background=BackgroundTask(os.remove, path),
+    )
+
+
+def _read_cached(storage_path: str) -> tuple:
+    """
+    อ่าน object จาก cache (miss -> ดึงจาก storage แล้วเก็บลง cache)
+    return (CachedObject, bytes, hit)
+    """
+    for _ in range(2):
+        entry, data = image_cache.get_or_fetch(storage_path, download_from_storage)
+        if data is not None:
+            return entry, data, False
+        try:
+            with open(entry.path, "rb") as f:
+                return entry, f.read(), True
+        except FileNotFoundError:
+            # ถูก evict ระหว่างหาเจอกับเปิดไฟล์ -> ลองใหม่ (รอบนี้จะเป็น miss)
+            continue
+    raise FileNotFoundError(storage_path)
+
+
+@app.api_route("/images/{storage_path:path}", methods=["GET", "HEAD"])
+def get_image(storage_path: str, request: Request):
+    """
+    proxy รูปจาก Supabase Storage ผ่าน disk LRU cache ในเครื่อง
+    - storage_path = storage_path / crop_storage_path / renditions.*.storage_path จาก /detections
+    - strong ETag (sha256 ของไฟล์) + If-None-Match -> 304
+    - Cache-Control: immutable สำหรับ object ที่ชื่อเป็น uuid (ไม่ถูกเขียนทับ)
+    - Range: bytes=... ช่วงเดียว -> 206 (If-Range ต้องตรงกับ ETag)
+    """
+    admit(request, image_limiter)
+    if ".." in storage_path.split("/") or not storage_path.startswith(IMAGE_PROXY_PREFIXES):
+        raise HTTPException(status_code=404, detail="image not found")
+
+    try:
+        entry, body, hit = _read_cached(storage_path)
+    except Exception as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail="image not found")
+        raise HTTPException(status_code=502, detail=f"storage error: {e}")
+
+    etag = f'"{entry.etag}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            "public, max-age=31536000, immutable"
+            if IMMUTABLE_OBJECT.search(storage_path)
+            else f"public, max-age={IMAGE_MUTABLE_MAX_AGE}"
+        ),
+        "X-Cache": "HIT" if hit else "MISS",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and entry.size and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, entry.size)
+        except RangeNotSatisfiableError:
+            raise HTTPException(
+                status_code=416, detail="range not satisfiable", headers={"Content-Range": f"bytes */{entry.size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            body = body[start:end + 1]
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+
+    media_type = mimetypes.guess_type(storage_path)[0] or "application/octet-stream"
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        body = b""
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
@@ -1,11 +1,14 @@
 # pcb_db.py
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
 from pcb_model import run_pcb_detection  # import จากไฟล์แรก
+from renditions import FULL, RENDITION_SIZES, make_renditions, rendition_url
 
 from typing import List, Dict, Any
 
@@ -15,7 +18,35 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # หรือ SUPABASE_KEY ถ้าใช้ชื่ออื่น
 BUCKET_NAME = os.getenv("SUPABASE_BUCKET_NAME", "pcb-images")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# โฟลเดอร์เก็บไฟล์ debug (ว่าง = ไม่เขียนลงดิสก์)
+DEBUG_DIR = os.getenv("PCB_DEBUG_DIR") or None
+UPLOAD_WORKERS = int(os.getenv("SUPABASE_UPLOAD_WORKERS", "8"))
+
+_supabase: Client | None = None
+_upload_executor: ThreadPoolExecutor | None = None
+_init_lock = threading.Lock()
+
+
+def get_supabase() -> Client:
+    """สร้าง Supabase client ตอนใช้ครั้งแรก (ไม่ต่อ network ตอน import)"""
+    global _supabase
+    if _supabase is None:
+        with _init_lock:
+            if _supabase is None:
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
+def _get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+    if _upload_executor is None:
+        with _init_lock:
+            if _upload_executor is None:
+                _upload_executor = ThreadPoolExecutor(
+                    max_workers=UPLOAD_WORKERS,
+                    thread_name_prefix="supabase-upload",
+                )
+    return _upload_executor
 
 
 # ---------- Helper: upload to Storage ----------
@@ -29,16 +60,21 @@ def upload_to_storage(bytes_data: bytes, folder: str, ext: str = "png") -> tuple
     storage_path = f"{folder}/{filename}"
 
     # ถ้า error มันจะ throw exception เอง
-    supabase.storage.from_(BUCKET_NAME).upload(
+    get_supabase().storage.from_(BUCKET_NAME).upload(
         path=storage_path,
         file=bytes_data,
-        file_options={"content-type": f"image/{ext}"},
+        file_options={"content-type": f"image/{'jpeg' if ext == 'jpg' else ext}"},
     )
 
-    public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(storage_path)
+    public_url = get_supabase().storage.from_(BUCKET_NAME).get_public_url(storage_path)
     return storage_path, public_url
 
 
+def download_from_storage(storage_path: str) -> bytes:
+    """ดึงไฟล์จาก Supabase Storage (ใช้กับ /images ตอน cache miss)"""
+    return get_supabase().storage.from_(BUCKET_NAME).download(storage_path)
+
+
 # ---------- DB Insert Helpers ----------
 
 def insert_main_image(
@@ -49,9 +85,11 @@ def insert_main_image(
     original_filename: str | None = None,
     board_code: str | None = None,
     note: str | None = None,
+    renditions: dict | None = None,
 ) -> str:
     """
     Insert row ลง pcb_main_images แล้วคืน id (string)
+    renditions: {"thumbnail": {"storage_path", "public_url", "width", "height"}, ...} (ดู renditions.py)
     """
     data = {
         "storage_path": storage_path,
@@ -62,12 +100,14 @@ def insert_main_image(
         "board_code": board_code,
         "note": note,
     }
-    res = supabase.table("pcb_main_images").insert(data).execute()
+    if renditions is not None:
+        data["renditions"] = renditions
+    res = get_supabase().table("pcb_main_images").insert(data).execute()
     row = res.data[0]
     return row["id"]
 
 
-def insert_defect_crop(
+def _defect_crop_row(
     main_image_id: str,
     crop_storage_path: str,
     crop_public_url: str,
@@ -76,9 +116,10 @@ def insert_defect_crop(
     prediction: str,
     confidence: float,
     bbox: dict | None = None,
-):
+    renditions: dict | None = None,
+) -> dict:
     """
-    Insert row ลง pcb_defect_crops
+    สร้าง row สำหรับ pcb_defect_crops
     bbox: dict เช่น {"x": 100, "y": 120, "w": 50, "h": 40} หรือ None
     """
     data = {
@@ -96,86 +137,193 @@ def insert_defect_crop(
         data["bbox_y"] = bbox.get("y")
         data["bbox_width"] = bbox.get("w")
         data["bbox_height"] = bbox.get("h")
+    if renditions is not None:
+        # ใส่ทุก row (รวม {} ของ crop ที่เล็กกว่า thumbnail) ให้ batch insert มีคอลัมน์ตรงกัน
+        data["renditions"] = renditions
 
-    res = supabase.table("pcb_defect_crops").insert(data).execute()
-    return res.data[0]
+    return data
 
-def save_detection_to_supabase_and_get_urls(
-    image_path: str,
-    model_path: str,
-    board_code: str | None = None,
-    note: str | None = None,
+
+def insert_defect_crop(
+    main_image_id: str,
+    crop_storage_path: str,
+    crop_public_url: str,
+    crop_width: int,
+    crop_height: int,
+    prediction: str,
+    confidence: float,
+    bbox: dict | None = None,
 ):
     """
-    รัน YOLO, upload รูปหลัก + crop ไป Supabase, insert DB
-    แล้วคืน payload ที่มี URL + metadata กลับมา
+    Insert row ลง pcb_defect_crops
+    bbox: dict เช่น {"x": 100, "y": 120, "w": 50, "h": 40} หรือ None
     """
-    detection_result = run_pcb_detection(
-        image_path=image_path,
-        model_path=model_path,
-    )
+    return insert_defect_crops(
+        [
+            _defect_crop_row(
+                main_image_id=main_image_id,
+                crop_storage_path=crop_storage_path,
+                crop_public_url=crop_public_url,
+                crop_width=crop_width,
+                crop_height=crop_height,
+                prediction=prediction,
+                confidence=confidence,
+                bbox=bbox,
+            )
+        ]
+    )[0]
+
+
+def insert_defect_crops(rows: List[dict]) -> List[dict]:
+    """
+    Insert หลาย row ลง pcb_defect_crops ใน request เดียว
+    """
+    if not rows:
+        return []
+    res = get_supabase().table("pcb_defect_crops").insert(rows).execute()
+    return res.data
+
+
+# ---------- Persist detection (upload + insert) ----------
 
-    annotated = detection_result["annotated_image"]
+def _upload_many(items: List[tuple[bytes, str, str]]) -> List[tuple[str, str]]:
+    """
+    upload หลายไฟล์พร้อมกัน (thread pool) แทนการ upload ทีละไฟล์
+    items: [(bytes_data, folder, ext), ...]
+    return [(storage_path, public_url), ...] ตามลำดับเดิม
+    """
+    if len(items) <= 1:
+        return [upload_to_storage(b, folder=folder, ext=ext) for b, folder, ext in items]
+
+    futures = [
+        _get_upload_executor().submit(upload_to_storage, b, folder, ext)
+        for b, folder, ext in items
+    ]
+    return [f.result() for f in futures]
+
+
+def _write_debug_files(
+    debug_dir: str,
+    main_image: Dict[str, Any],
+    crops: List[Dict[str, Any]],
+    ext: str = "png",
+):
+    """
+    เขียน bytes ชุดเดียวกับที่ upload ลงดิสก์ (ไว้ debug) ไม่ encode ใหม่
+    ชื่อไฟล์มี id ของ request นี้ (request พร้อมกัน / ชื่อไฟล์ซ้ำกันจะไม่เขียนทับกัน)
+    """
+    os.makedirs(debug_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(main_image.get("original_filename") or "image"))[0]
+    prefix = f"{stem}_{uuid.uuid4().hex[:8]}"
+
+    with open(os.path.join(debug_dir, f"detected_{prefix}.{ext}"), "wb") as f:
+        f.write(main_image["bytes"])
+
+    for i, crop in enumerate(crops):
+        crop_name = f"crop_{prefix}_{i}_{crop['prediction']}.{ext}"
+        with open(os.path.join(debug_dir, crop_name), "wb") as f:
+            f.write(crop["bytes"])
 
-    # 1) upload main image
-    main_storage_path, main_public_url = upload_to_storage(
-        annotated["bytes"],
-        folder="pcb/main",
-        ext="png",
+
+def _persist_detection(
+    main_image: Dict[str, Any],
+    crops: List[Dict[str, Any]],
+    board_code: str | None = None,
+    note: str | None = None,
+    debug_dir: str | None = None,
+):
+    """
+    upload รูปหลัก + crop ทั้งหมดพร้อมกัน, insert DB (crop insert ทีเดียวเป็น batch)
+    แล้วคืน payload ที่มี URL + metadata
+    bytes ที่ได้มาถูก encode แล้วครั้งเดียว ใช้ซ้ำทั้ง storage และ debug_dir
+    """
+    if debug_dir:
+        _write_debug_files(debug_dir, main_image, crops)
+
+    # 1) สร้างรูปย่อ (JPEG) ของรูปหลัก + crop แล้ว upload ทุกไฟล์พร้อมกัน
+    images = [main_image] + crops
+    renditions = [make_renditions(img["bytes"], int(img["width"]), int(img["height"])) for img in images]
+    rendition_keys = [(i, name) for i, variants in enumerate(renditions) for name in variants]
+    uploads = _upload_many(
+        [(main_image["bytes"], "pcb/main", "png")]
+        + [(crop["bytes"], "pcb/crops", "png") for crop in crops]
+        + [(renditions[i][name]["bytes"], f"pcb/renditions/{name}", "jpg") for i, name in rendition_keys]
     )
+    main_storage_path, main_public_url = uploads[0]
+    crop_uploads = uploads[1:len(images)]
+
+    # {index ของรูป: {"thumbnail": {storage_path, public_url, width, height}, ...}}
+    # IMAGE_RENDITIONS ว่าง = ไม่เขียนคอลัมน์ renditions (ใช้ได้กับ DB ที่ยังไม่ได้รัน migration)
+    rendition_rows: List[Dict[str, Any]] = [{} for _ in images]
+    stored_renditions = rendition_rows if RENDITION_SIZES else [None] * len(images)
+    for (i, name), (path, url) in zip(rendition_keys, uploads[len(images):]):
+        variant = renditions[i][name]
+        rendition_rows[i][name] = {
+            "storage_path": path,
+            "public_url": url,
+            "width": variant["width"],
+            "height": variant["height"],
+        }
 
     # 2) insert main image row
     main_image_id = insert_main_image(
         storage_path=main_storage_path,
         public_url=main_public_url,
-        width=annotated["width"],
-        height=annotated["height"],
-        original_filename=annotated["original_filename"],
+        width=int(main_image["width"]),
+        height=int(main_image["height"]),
+        original_filename=main_image.get("original_filename"),
         board_code=board_code,
         note=note,
+        renditions=stored_renditions[0],
     )
 
     main_payload = {
         "id": main_image_id,
         "storage_path": main_storage_path,
         "public_url": main_public_url,
-        "width": annotated["width"],
-        "height": annotated["height"],
-        "original_filename": annotated["original_filename"],
+        "width": int(main_image["width"]),
+        "height": int(main_image["height"]),
+        "original_filename": main_image.get("original_filename"),
         "board_code": board_code,
         "note": note,
+        "renditions": rendition_rows[0],
     }
 
-    # 3) upload crops + insert defects + สร้าง payload
-    crops_payload = []
-    for crop in detection_result["crops"]:
-        crop_storage_path, crop_public_url = upload_to_storage(
-            crop["bytes"],
-            folder="pcb/crops",
-            ext="png",
-        )
-
-        defect_row = insert_defect_crop(
-            main_image_id=main_image_id,
-            crop_storage_path=crop_storage_path,
-            crop_public_url=crop_public_url,
-            crop_width=crop["width"],
-            crop_height=crop["height"],
-            prediction=crop["prediction"],
-            confidence=crop["confidence"],
-            bbox=crop["bbox"],
-        )
+    # 3) insert defects ทีเดียว + สร้าง payload
+    defect_rows = insert_defect_crops(
+        [
+            _defect_crop_row(
+                main_image_id=main_image_id,
+                crop_storage_path=crop_storage_path,
+                crop_public_url=crop_public_url,
+                crop_width=int(crop["width"]),
+                crop_height=int(crop["height"]),
+                prediction=str(crop["prediction"]),
+                confidence=float(crop["confidence"]),
+                bbox=crop.get("bbox"),
+                renditions=crop_renditions,
+            )
+            for crop, (crop_storage_path, crop_public_url), crop_renditions in zip(
+                crops, crop_uploads, stored_renditions[1:]
+            )
+        ]
+    )
 
+    crops_payload: List[Dict[str, Any]] = []
+    for crop, (crop_storage_path, crop_public_url), crop_renditions, defect_row in zip(
+        crops, crop_uploads, rendition_rows[1:], defect_rows
+    ):
         crops_payload.append(
             {
                 "id": defect_row["id"],
                 "crop_storage_path": crop_storage_path,
                 "crop_public_url": crop_public_url,
-                "width": crop["width"],
-                "height": crop["height"],
-                "prediction": crop["prediction"],
-                "confidence": crop["confidence"],
-                "bbox": crop["bbox"],
+                "width": int(crop["width"]),
+                "height": int(crop["height"]),
+                "prediction": str(crop["prediction"]),
+                "confidence": float(crop["confidence"]),
+                "bbox": crop.get("bbox"),
+                "renditions": crop_renditions,
             }
         )
 
@@ -184,13 +332,46 @@ def save_detection_to_supabase_and_get_urls(
         "crops": crops_payload,
     }
 
-def get_all_detections() -> List[Dict[str, Any]]:
+
+def save_detection_to_supabase_and_get_urls(
+    image_path: str,
+    model_path: str,
+    board_code: str | None = None,
+    note: str | None = None,
+    min_confidence: float = 0.0,
+    debug_dir: str | None = None,
+):
+    """
+    รัน YOLO, upload รูปหลัก + crop ไป Supabase, insert DB
+    แล้วคืน payload ที่มี URL + metadata กลับมา
+    (ทั้ง /detect-image และ detect_pcb_defects ของ agent ใช้ pipeline นี้ตัวเดียว)
+    debug_dir: ถ้าใส่ (หรือตั้ง env PCB_DEBUG_DIR) จะเขียนไฟล์เดียวกับที่ upload ลงดิสก์ด้วย
+    """
+    detection_result = run_pcb_detection(
+        image_path=image_path,
+        model_path=model_path,
+        min_confidence=min_confidence,
+    )
+
+    return _persist_detection(
+        main_image=detection_result["annotated_image"],
+        crops=detection_result["crops"],
+        board_code=board_code,
+        note=note,
+        debug_dir=debug_dir or DEBUG_DIR,
+    )
+
+def get_all_detections(rendition: str = FULL) -> List[Dict[str, Any]]:
+    """
+    rendition: ขนาดของ main_image_url ("thumbnail" / "medium" / "full")
+    หน้า list ใช้ "thumbnail" ได้ โหลดแค่หลัก KB ต่อ row (row เก่าที่ไม่มีรูปย่อจะได้ขนาดที่ใหญ่กว่าแทน)
+    """
     # ดึงรูปหลักทั้งหมด
-    main_res = supabase.table("pcb_main_images").select("*").execute()
+    main_res = get_supabase().table("pcb_main_images").select("*").execute()
     main_rows = main_res.data or []
 
     # ดึง defects ทั้งหมด
-    crop_res = supabase.table("pcb_defect_crops").select("*").execute()
+    crop_res = get_supabase().table("pcb_defect_crops").select("*").execute()
     crop_rows = crop_res.data or []
 
     # group crop ตาม main_image_id
@@ -205,9 +386,11 @@ def get_all_detections() -> List[Dict[str, Any]]:
 
     for m in main_rows:
         mid = m["id"]
+        main_url, main_rendition = rendition_url(m.get("renditions"), m.get("public_url"), rendition)
         main_item: Dict[str, Any] = {
             "main_image_id": mid,
-            "main_image_url": m.get("public_url"),
+            "main_image_url": main_url,
+            "rendition": main_rendition,
             "storage_path": m.get("storage_path"),
             "original_filename": m.get("original_filename"),
             "board_code": m.get("board_code"),
@@ -239,7 +422,62 @@ def get_all_detections() -> List[Dict[str, Any]]:
 
     return results
 
-from typing import List, Dict, Any
+def get_detection(main_image_id: str) -> Dict[str, Any] | None:
+    """
+    ดึง detection หนึ่งครั้งตาม id ของรูปหลัก
+    คืน payload รูปแบบเดียวกับ save_detection_to_supabase_and_get_urls (หรือ None ถ้าไม่เจอ)
+    """
+    main_res = (
+        get_supabase().table("pcb_main_images")
+        .select("*")
+        .eq("id", main_image_id)
+        .limit(1)
+        .execute()
+    )
+    if not main_res.data:
+        return None
+    m = main_res.data[0]
+
+    crop_res = (
+        get_supabase().table("pcb_defect_crops")
+        .select("*")
+        .eq("main_image_id", main_image_id)
+        .execute()
+    )
+
+    return {
+        "main_image": {
+            "id": m["id"],
+            "storage_path": m.get("storage_path"),
+            "public_url": m.get("public_url"),
+            "width": m.get("width"),
+            "height": m.get("height"),
+            "original_filename": m.get("original_filename"),
+            "board_code": m.get("board_code"),
+            "note": m.get("note"),
+            "renditions": m.get("renditions") or {},
+        },
+        "crops": [
+            {
+                "id": c.get("id"),
+                "crop_storage_path": c.get("crop_storage_path"),
+                "crop_public_url": c.get("crop_public_url"),
+                "width": c.get("crop_width"),
+                "height": c.get("crop_height"),
+                "prediction": c.get("prediction"),
+                "confidence": c.get("confidence"),
+                "bbox": {
+                    "x": c.get("bbox_x"),
+                    "y": c.get("bbox_y"),
+                    "w": c.get("bbox_width"),
+                    "h": c.get("bbox_height"),
+                },
+                "renditions": c.get("renditions") or {},
+            }
+            for c in (crop_res.data or [])
+        ],
+    }
+
 
 def save_detection_from_agent_bytes_and_get_urls(
     main_image: Dict[str, Any],
@@ -267,72 +505,9 @@ def save_detection_from_agent_bytes_and_get_urls(
         ...
     ]
     """
-    # 1) upload main image
-    main_storage_path, main_public_url = upload_to_storage(
-        main_image["bytes"],
-        folder="pcb/main",
-        ext="png",
-    )
-
-    # 2) insert main image row
-    main_image_id = insert_main_image(
-        storage_path=main_storage_path,
-        public_url=main_public_url,
-        width=int(main_image["width"]),
-        height=int(main_image["height"]),
-        original_filename=main_image.get("original_filename"),
+    return _persist_detection(
+        main_image=main_image,
+        crops=crops,
         board_code=board_code,
         note=note,
     )
-
-    main_payload = {
-        "id": main_image_id,
-        "storage_path": main_storage_path,
-        "public_url": main_public_url,
-        "width": int(main_image["width"]),
-        "height": int(main_image["height"]),
-        "original_filename": main_image.get("original_filename"),
-        "board_code": board_code,
-        "note": note,
-    }
-
-    # 3) upload crops + insert defects
-    crops_payload: List[Dict[str, Any]] = []
-
-    for crop in crops:
-        crop_storage_path, crop_public_url = upload_to_storage(
-            crop["bytes"],
-            folder="pcb/crops",
-            ext="png",
-        )
-
-        bbox = crop.get("bbox")
-
-        defect_row = insert_defect_crop(
-            main_image_id=main_image_id,
-            crop_storage_path=crop_storage_path,
-            crop_public_url=crop_public_url,
-            crop_width=int(crop["width"]),
-            crop_height=int(crop["height"]),
-            prediction=str(crop["prediction"]),
-            confidence=float(crop["confidence"]),
-            bbox=bbox,
-        )
-
-        crops_payload.append(
-            {
-                "id": defect_row["id"],
-                "crop_storage_path": crop_storage_path,
-                "crop_public_url": crop_public_url,
-                "width": int(crop["width"]),
-                "height": int(crop["height"]),
-                "prediction": str(crop["prediction"]),
-                "confidence": float(crop["confidence"]),
-                "bbox": bbox,
-            }
-        )
-
-    return {
-        "main_image": main_payload,
-        "crops": crops_payload,
-    }
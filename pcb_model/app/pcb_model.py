@@ -3,7 +3,9 @@ import os
 from io import BytesIO
 
 from PIL import Image, ImageDraw
-from inference_sdk import InferenceHTTPClient
+from typing import Optional
+
+from inference_client import INFERENCE_FALLBACK_MODEL, LocalYoloBackend, ResilientInferenceClient, RoboflowHTTPClient
 
 
 # ===== Roboflow config =====
@@ -11,10 +13,40 @@ API_URL = os.getenv("ROBOFLOW_API_URL")
 API_KEY = os.getenv("ROBOFLOW_API_KEY")
 MODEL_ID = os.getenv("ROBOFLOW_MODEL_ID")
 
-CLIENT = InferenceHTTPClient(
-    api_url=API_URL,
-    api_key=API_KEY,
-)
+# จำนวน Roboflow call ที่ค้างพร้อมกันได้ (กัน quota / rate limit ของ Roboflow)
+# รวม hedge / retry และ call ที่เลิกรอแล้วแต่ยังไม่จบ (นับใน ResilientInferenceClient)
+# แยกจากจำนวน request ที่ /detect-image รับเข้ามา (upload Supabase ของ request อื่นรันต่อได้)
+INFERENCE_MAX_CONCURRENCY = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "4"))
+
+_client: Optional[RoboflowHTTPClient] = None
+_resilient_client: Optional[ResilientInferenceClient] = None
+
+
+def get_client() -> RoboflowHTTPClient:
+    """สร้าง Roboflow client ตอน detect ครั้งแรก"""
+    global _client
+    if _client is None:
+        _client = RoboflowHTTPClient(
+            api_url=API_URL,
+            api_key=API_KEY,
+        )
+    return _client
+
+
+def get_inference_client() -> ResilientInferenceClient:
+    """
+    Roboflow client ที่มี deadline / hedging / retry / circuit breaker (ดู inference_client.py)
+    fallback เป็น YOLO local ถ้าตั้ง INFERENCE_FALLBACK_MODEL (path สัมพัทธ์นับจากโฟลเดอร์ app/)
+    """
+    global _resilient_client
+    if _resilient_client is None:
+        fallback = None
+        if INFERENCE_FALLBACK_MODEL:
+            fallback = LocalYoloBackend(os.path.join(os.path.dirname(__file__), INFERENCE_FALLBACK_MODEL))
+        _resilient_client = ResilientInferenceClient(
+            get_client, fallback=fallback, max_inflight=INFERENCE_MAX_CONCURRENCY
+        )
+    return _resilient_client
 
 
 def _pred_to_xyxy(pred: dict) -> tuple[int, int, int, int]:
@@ -37,6 +69,7 @@ def _pred_to_xyxy(pred: dict) -> tuple[int, int, int, int]:
 def run_pcb_detection(
     image_path: str,
     model_path: str = "best.pt",  # ไม่ได้ใช้แล้ว แต่คง argument ไว้ให้โค้ดอื่นไม่พัง
+    min_confidence: float = 0.0,
 ):
     """
     รัน Roboflow model กับรูป PCB 1 รูป
@@ -50,9 +83,12 @@ def run_pcb_detection(
     img = Image.open(image_path).convert("RGB")
 
     # 2) เรียก Roboflow inference
-    result = CLIENT.infer(image_path, model_id=MODEL_ID)
+    result = get_inference_client().infer(image_path, model_id=MODEL_ID)
 
-    preds = result.get("predictions", [])
+    preds = [
+        p for p in result.get("predictions", [])
+        if float(p.get("confidence", 0.0)) >= min_confidence
+    ]
     img_w = result.get("image", {}).get("width", img.width)
     img_h = result.get("image", {}).get("height", img.height)
 
@@ -0,0 +1,70 @@
+# app/renditions.py
+"""
+รูปย่อ (rendition) ของรูปที่บันทึกลง storage
+
+หน้า list ของ dashboard ไม่ต้องโหลดรูปเต็ม (PNG หลาย MB) แค่เพื่อแสดง thumbnail
+ตอนบันทึก detection จะสร้างรูปย่อเป็น JPEG ตาม IMAGE_RENDITIONS ("ชื่อ:ด้านยาวสุด px" คั่นด้วย comma)
+แล้วเก็บ URL ไว้ในคอลัมน์ renditions (jsonb) คู่กับ public_url (= "full")
+- สร้างเฉพาะขนาดที่เล็กกว่ารูปจริง (crop เล็ก ๆ ส่วนใหญ่จะไม่มี rendition)
+- ปิดเป็นค่าเริ่มต้น (IMAGE_RENDITIONS ว่าง = ไม่สร้าง และไม่เขียนคอลัมน์ renditions)
+  DB ที่ยังไม่มีคอลัมน์จะ reject insert ทั้ง row (/detect-image ตอบ 500 และไฟล์ที่ upload แล้วค้างใน storage)
+  จึงต้องรัน migrations/001_image_renditions.sql ก่อน แล้วค่อยตั้ง IMAGE_RENDITIONS=thumbnail:256,medium:1024
+"""
+import os
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+IMAGE_RENDITIONS = os.getenv("IMAGE_RENDITIONS", "")
+RENDITION_JPEG_QUALITY = int(os.getenv("RENDITION_JPEG_QUALITY", "80"))
+
+FULL = "full"
+
+
+def _parse(spec: str) -> Dict[str, int]:
+    sizes: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, size = item.partition(":")
+        if name == FULL or not size.isdigit():
+            raise ValueError(f"invalid IMAGE_RENDITIONS entry: {item!r}")
+        sizes[name] = int(size)
+    return sizes
+
+
+RENDITION_SIZES = _parse(IMAGE_RENDITIONS)
+RENDITION_NAMES = (*RENDITION_SIZES, FULL)
+
+
+def make_renditions(image_bytes: bytes, width: int, height: int) -> Dict[str, Dict[str, Any]]:
+    """
+    ย่อรูปเป็น JPEG ทุกขนาดใน RENDITION_SIZES ที่เล็กกว่ารูปจริง
+    return {name: {"bytes": ..., "width": int, "height": int}}
+    """
+    sizes = {name: size for name, size in RENDITION_SIZES.items() if size < max(width, height)}
+    if not sizes:
+        return {}
+
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    renditions: Dict[str, Dict[str, Any]] = {}
+    # ย่อจากใหญ่ไปเล็ก ต่อจากรูปที่ย่อแล้ว (เร็วกว่าย่อจากรูปเต็มทุกขนาด)
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        img.thumbnail((size, size), Image.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=RENDITION_JPEG_QUALITY, optimize=True)
+        renditions[name] = {"bytes": buf.getvalue(), "width": img.width, "height": img.height}
+    return renditions
+
+
+def rendition_url(renditions: Optional[Dict[str, Any]], full_url: Optional[str], rendition: str) -> tuple:
+    """
+    URL ของ rendition ที่ขอ / ถ้าไม่มี (row เก่า หรือรูปเล็กกว่าขนาดนั้น) ใช้ขนาดถัดไปที่ใหญ่กว่า จนถึง full
+    return (url, ชื่อ rendition ที่ได้จริง)
+    """
+    renditions = renditions or {}
+    if rendition != FULL:
+        larger = [name for name in RENDITION_SIZES if RENDITION_SIZES[name] >= RENDITION_SIZES.get(rendition, 0)]
+        for name in sorted(larger, key=RENDITION_SIZES.get):
+            if renditions.get(name, {}).get("public_url"):
+                return renditions[name]["public_url"], name
+    return full_url, FULL
@@ -0,0 +1,17 @@
+-- 001_image_renditions.sql
+-- รูปย่อ (JPEG) ของรูปหลัก + crop ที่ pcb-api สร้างตอนบันทึก detection (ดู app/renditions.py)
+-- ตัวอย่างค่า:
+--   {"thumbnail": {"storage_path": "pcb/renditions/thumbnail/<uuid>.jpg", "public_url": "...", "width": 256, "height": 192},
+--    "medium":    {"storage_path": "pcb/renditions/medium/<uuid>.jpg",    "public_url": "...", "width": 1024, "height": 768}}
+-- รูปเต็มยังเป็น storage_path / public_url เดิม ("full")
+-- row เก่า (null) -> /detections?rendition=... คืนรูปเต็มแทน
+--
+-- ลำดับการเปิดใช้: รันไฟล์นี้ใน Supabase SQL editor ก่อน แล้วค่อยตั้ง IMAGE_RENDITIONS
+-- (เช่น IMAGE_RENDITIONS=thumbnail:256,medium:1024 ใน .env) แล้ว restart pcb-api
+-- ตั้งก่อนรัน migration = insert ทุกครั้ง fail เพราะไม่มีคอลัมน์ renditions
+
+alter table public.pcb_main_images
+    add column if not exists renditions jsonb;
+
+alter table public.pcb_defect_crops
+    add column if not exists renditions jsonb;
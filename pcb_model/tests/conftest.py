@@ -0,0 +1,6 @@
+# pcb_model/tests/conftest.py
+# โมดูลใน app/ import กันแบบ top-level (Dockerfile copy app/ ไปที่ /app)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
@@ -0,0 +1,226 @@
+# pcb_model/tests/test_inference_client.py
+"""circuit breaker / deadline / hedging / retry / in-flight budget ของ inference_client (ไม่เรียก Roboflow จริง)"""
+import base64
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import inference_client
+from inference_client import (
+    CircuitBreaker,
+    InferenceUnavailableError,
+    ResilientInferenceClient,
+    RoboflowHTTPClient,
+)
+
+RESULT = {"image": {"width": 10, "height": 10}, "predictions": []}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(inference_client, "INFERENCE_BACKOFF_BASE", 0.0)
+
+
+class FakeBackend:
+    """infer ที่กำหนด delay / error ของแต่ละ call ได้ และนับ call ที่รันพร้อมกันสูงสุด"""
+
+    def __init__(self, delays=None, errors=0, default_delay=0.0):
+        self.delays = list(delays or [])
+        self.errors = errors
+        self.default_delay = default_delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def infer(self, image_path, **kwargs):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delays[index] if index < len(self.delays) else self.default_delay)
+            if index < self.errors:
+                raise ConnectionError("boom")
+            return {**RESULT, "call": index}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def make_client(backend, **kwargs):
+    kwargs.setdefault("hedge_percentile", 0)
+    return ResilientInferenceClient(lambda: backend, **kwargs)
+
+
+# ---------- circuit breaker ----------
+
+def test_breaker_opens_after_threshold_then_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # probe
+    assert breaker.state == "half_open" and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_open_circuit_fails_fast_without_calling_backend():
+    backend = FakeBackend()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    client = make_client(backend, breaker=breaker)
+    with pytest.raises(InferenceUnavailableError):
+        client.infer("x.jpg")
+    assert backend.calls == 0 and client.stats()["rejected"] == 1
+
+
+# ---------- retry / deadline ----------
+
+def test_retries_after_error():
+    backend = FakeBackend(errors=1)
+    client = make_client(backend, max_attempts=3)
+    assert client.infer("x.jpg")["call"] == 1
+    assert client.stats()["retries"] == 1 and client.breaker.state == "closed"
+
+
+def test_deadline_then_fallback():
+    class Fallback:
+        def infer(self, image_path, **kwargs):
+            return {"backend": "local"}
+
+    backend = FakeBackend(default_delay=0.3)
+    client = make_client(backend, attempt_timeout=0.05, max_attempts=1, fallback=Fallback())
+    started = time.monotonic()
+    assert client.infer("x.jpg") == {"backend": "local"}
+    assert time.monotonic() - started < 0.25
+
+
+def test_abandoned_calls_count_against_budget():
+    # 4 request พร้อมกัน backend ช้ากว่า deadline มาก: call ที่ค้างต้องไม่เกิน max_inflight
+    backend = FakeBackend(default_delay=0.5)
+    client = make_client(backend, attempt_timeout=0.05, max_attempts=3, max_inflight=2)
+
+    def run(_):
+        try:
+            return client.infer("x.jpg")
+        except InferenceUnavailableError as e:
+            return e
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(run, range(4)))
+    assert all(isinstance(r, InferenceUnavailableError) for r in results)
+    assert backend.peak <= 2
+    assert client.stats()["budget_skips"] >= 1
+
+    time.sleep(0.6)  # call ที่ถูกทิ้งจบแล้ว budget ต้องคืนครบ
+    assert client.stats()["inflight"] == 0
+
+
+# ---------- hedging ----------
+
+def _warm(client, seconds):
+    client._latencies.extend([seconds] * inference_client.INFERENCE_HEDGE_MIN_SAMPLES)
+
+
+def test_hedge_wins_when_primary_is_slow():
+    backend = FakeBackend(delays=[0.5, 0.0])
+    client = make_client(backend, hedge_percentile=95, attempt_timeout=2)
+    _warm(client, 0.02)
+    started = time.monotonic()
+    assert client.infer("x.jpg")["call"] == 1
+    assert time.monotonic() - started < 0.3
+    assert client.stats()["hedges"] == 1 and client.stats()["hedge_wins"] == 1
+
+
+def test_hedge_skipped_when_budget_full():
+    backend = FakeBackend(delays=[0.2])
+    client = make_client(backend, hedge_percentile=95, attempt_timeout=2, max_inflight=1)
+    _warm(client, 0.02)
+    assert client.infer("x.jpg")["call"] == 0
+    assert backend.calls == 1
+    assert client.stats()["hedges"] == 0 and client.stats()["budget_skips"] == 1
+
+
+# ---------- RoboflowHTTPClient ----------
+
+def test_http_client_scales_predictions_back(tmp_path):
+    from PIL import Image
+
+    path = tmp_path / "board.png"
+    Image.new("RGB", (400, 200)).save(path)
+    seen = {}
+
+    def handler(request):
+        seen["url"] = str(request.url)
+        seen["size"] = Image.open(io.BytesIO(base64.b64decode(request.content))).size
+        return httpx.Response(200, json={
+            "image": {"width": 100, "height": 50},
+            "predictions": [{"x": 50, "y": 25, "width": 10, "height": 4, "class": "spur"}],
+        })
+
+    client = RoboflowHTTPClient("https://detect.example", "secret", timeout=1, max_input_size=100)
+    client._http = httpx.Client(transport=httpx.MockTransport(handler))
+    result = client.infer(str(path), model_id="pcb/3")
+
+    assert seen["url"] == "https://detect.example/pcb/3?api_key=secret"
+    assert seen["size"] == (100, 50)
+    assert result["image"] == {"width": 400, "height": 200}
+    assert result["predictions"][0] == {"x": 200, "y": 100, "width": 40, "height": 16, "class": "spur"}
+
+
+def test_http_error_does_not_leak_api_key(tmp_path):
+    path = tmp_path / "board.bin"
+    path.write_bytes(b"raw")
+    client = RoboflowHTTPClient("https://detect.example", "secret", timeout=1, max_input_size=0)
+    client._http = httpx.Client(transport=httpx.MockTransport(lambda r: httpx.Response(503, text="busy")))
+    with pytest.raises(RuntimeError) as exc:
+        client.infer(str(path), model_id="pcb/3")
+    assert "503" in str(exc.value) and "secret" not in str(exc.value)
+
+
+def test_http_timeout_stops_slow_call(tmp_path):
+    class Slow(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(1)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(json.dumps(RESULT).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Slow)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = tmp_path / "board.bin"
+    path.write_bytes(b"raw")
+    try:
+        client = RoboflowHTTPClient(f"http://127.0.0.1:{server.server_port}", "k", timeout=0.2, max_input_size=0)
+        started = time.monotonic()
+        with pytest.raises(httpx.TimeoutException):
+            client.infer(str(path), model_id="pcb/3")
+        assert time.monotonic() - started < 0.6
+    finally:
+        server.shutdown()